@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class BrowseConfig(AppConfig):
     name = "browse"
+
+    def ready(self):
+        # Connect the signal handlers
+        from . import signals
@@ -0,0 +1,258 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Stream the contents of the database into a tar or zip archive.
+
+The function :func:`stream_archive` produces the same files that
+:func:`browse.models.dump_db_to_json` would save into a folder (the
+schema and the attachments), encoded as a sequence of ``bytes`` objects
+forming a tar or zip archive. Nothing is written into a staging folder,
+and attachments are read from the storage one chunk at a time, so that
+the archive can be saved into a file (``manage.py export --archive``)
+or sent over the network (the ``bundle`` action of the releases API)
+while it is being built::
+
+    with open("release.zip", "wb") as outf:
+        for chunk in stream_archive(configuration, ArchiveFormat.ZIP, "v1.0"):
+            outf.write(chunk)
+"""
+
+from enum import Enum
+from pathlib import Path
+import tarfile
+from tempfile import SpooledTemporaryFile
+import time
+from typing import Any, Iterator, List, NamedTuple, Optional, Tuple
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile, ZipInfo
+
+from browse.models import (
+    COPY_CHUNK_SIZE,
+    ReleaseDumpConfiguration,
+    build_schema,
+    stream_schema,
+)
+
+
+class ArchiveFormat(Enum):
+    TAR = "tar"
+    ZIP = "zip"
+
+
+ARCHIVE_MIME_TYPES = {
+    ArchiveFormat.TAR: "application/x-tar",
+    ArchiveFormat.ZIP: "application/zip",
+}
+
+# The tar format requires the size of each file to be written before its
+# contents. Schemas smaller than this (in bytes) are kept in memory before
+# being written, larger ones are spooled into an anonymous temporary file
+SCHEMA_SPOOL_SIZE = 16 * 1024 * 1024
+
+
+class ArchiveMember(NamedTuple):
+    # Path of the file within the archive
+    path: str
+    storage: Any
+    # Name of the file within the storage
+    name: str
+
+    def stat(self) -> Tuple[int, float]:
+        "Return the size and the modification time of the file"
+
+        size = self.storage.size(self.name)
+        try:
+            mtime = self.storage.get_modified_time(self.name).timestamp()
+        except NotImplementedError:
+            mtime = time.time()
+
+        return size, mtime
+
+
+class AttachmentCollector:
+    """Record the attachments of a dump instead of copying them
+
+    An instance of this class can be used in place of
+    :class:`browse.models.AttachmentCopier`: the attachments are listed
+    in ``members`` and written into the archive once the schema is
+    complete.
+    """
+
+    def __init__(self, output_folder: Path):
+        self.output_folder = output_folder
+        self.members: List[ArchiveMember] = []
+
+    def copy(self, file_data, dest_path: Path, sha256: str = "") -> None:
+        self.members.append(
+            ArchiveMember(
+                path=dest_path.relative_to(self.output_folder).as_posix(),
+                storage=file_data.storage,
+                name=file_data.name,
+            )
+        )
+
+
+def _read_chunks(inpf, size: int, path: str) -> Iterator[bytes]:
+    remaining = size
+    while remaining > 0:
+        data = inpf.read(min(COPY_CHUNK_SIZE, remaining))
+        if not data:
+            raise OSError(f"file '{path}' is shorter than {size} bytes")
+
+        remaining -= len(data)
+        yield data
+
+
+class _TarStream:
+    "Encode files in the tar format, one block of data at a time"
+
+    def __init__(self):
+        self.offset = 0
+
+    def _emit(self, data: bytes) -> bytes:
+        self.offset += len(data)
+        return data
+
+    def add(self, path: str, size: int, mtime: float, chunks) -> Iterator[bytes]:
+        info = tarfile.TarInfo(path)
+        info.size = size
+        info.mtime = int(mtime)
+        info.mode = 0o644
+
+        yield self._emit(
+            info.tobuf(tarfile.PAX_FORMAT, tarfile.ENCODING, "surrogateescape")
+        )
+        for cur_chunk in chunks:
+            yield self._emit(cur_chunk)
+
+        remainder = size % tarfile.BLOCKSIZE
+        if remainder:
+            yield self._emit(tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+
+    def close(self) -> Iterator[bytes]:
+        # Like `TarFile.close`, write two empty blocks and pad the
+        # archive to a whole record
+        end_blocks = tarfile.NUL * (2 * tarfile.BLOCKSIZE)
+        remainder = (self.offset + len(end_blocks)) % tarfile.RECORDSIZE
+        if remainder:
+            end_blocks += tarfile.NUL * (tarfile.RECORDSIZE - remainder)
+
+        yield self._emit(end_blocks)
+
+
+class _ByteQueue:
+    "Write-only file object that keeps what `ZipFile` writes until it is drained"
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> Iterator[bytes]:
+        if self.chunks:
+            data = b"".join(self.chunks)
+            self.chunks = []
+            yield data
+
+
+def _stream_tar(schema_name: str, schema_chunks, collector: AttachmentCollector):
+    tar = _TarStream()
+
+    with SpooledTemporaryFile(max_size=SCHEMA_SPOOL_SIZE) as spool:
+        for cur_chunk in schema_chunks:
+            spool.write(cur_chunk)
+
+        size = spool.tell()
+        spool.seek(0)
+        yield from tar.add(
+            schema_name, size, time.time(), _read_chunks(spool, size, schema_name)
+        )
+
+    for cur_member in collector.members:
+        size, mtime = cur_member.stat()
+        with cur_member.storage.open(cur_member.name, "rb") as inpf:
+            yield from tar.add(
+                cur_member.path,
+                size,
+                mtime,
+                _read_chunks(inpf, size, cur_member.path),
+            )
+
+    yield from tar.close()
+
+
+def _stream_zip(schema_name: str, schema_chunks, collector: AttachmentCollector):
+    queue = _ByteQueue()
+
+    # As `queue` is not seekable, `ZipFile` writes the size and the
+    # checksum of each file *after* its contents
+    with ZipFile(queue, "w", compression=ZIP_DEFLATED) as archive:
+        with archive.open(schema_name, "w", force_zip64=True) as outf:
+            for cur_chunk in schema_chunks:
+                outf.write(cur_chunk)
+                yield from queue.drain()
+
+        for cur_member in collector.members:
+            size, mtime = cur_member.stat()
+            info = ZipInfo(cur_member.path, date_time=time.localtime(mtime)[:6])
+            # Most data files are binary files that do not compress well
+            info.compress_type = ZIP_STORED
+            info.file_size = size
+
+            with cur_member.storage.open(cur_member.name, "rb") as inpf:
+                with archive.open(info, "w") as outf:
+                    for cur_chunk in _read_chunks(inpf, size, cur_member.path):
+                        outf.write(cur_chunk)
+                        yield from queue.drain()
+
+    yield from queue.drain()
+
+
+def stream_archive(
+    configuration: ReleaseDumpConfiguration,
+    archive_format: ArchiveFormat,
+    release_tag: Optional[str] = None,
+    delta_from: Optional[str] = None,
+) -> Iterator[bytes]:
+    """Return an iterator over the bytes of an archive containing a dump
+
+    The archive contains the schema (``schema.json`` or ``schema.yaml``,
+    depending on ``configuration.output_format``) followed by the
+    attachments, using the same paths as :func:`dump_db_to_json`. The
+    fields ``output_folder``, ``exist_ok``, ``num_of_copy_threads`` and
+    ``hard_link_attachments`` of `configuration` are ignored.
+
+    If `delta_from` is set, the archive contains the differences between
+    the releases `delta_from` and `release_tag` (``delta.json``) and the
+    attachments of the data files that have been added.
+    """
+
+    collector = AttachmentCollector(configuration.output_folder)
+    base_name = "delta" if delta_from else "schema"
+    schema_name = f"{base_name}.{configuration.output_format.name.lower()}"
+
+    configuration.attachment_copier = collector
+    try:
+        # Attachments are added to `collector` while the schema is encoded
+        schema_chunks = (
+            x if isinstance(x, bytes) else x.encode("utf-8")
+            for x in stream_schema(
+                build_schema(
+                    configuration, release_tag=release_tag, delta_from=delta_from
+                ),
+                configuration.output_format,
+            )
+        )
+
+        if archive_format == ArchiveFormat.TAR:
+            yield from _stream_tar(schema_name, schema_chunks, collector)
+        elif archive_format == ArchiveFormat.ZIP:
+            yield from _stream_zip(schema_name, schema_chunks, collector)
+        else:
+            raise ValueError(f"unsupported archive format {archive_format}")
+    finally:
+        configuration.attachment_copier = None
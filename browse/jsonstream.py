@@ -0,0 +1,158 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Incremental reader for large JSON files.
+
+The class :class:`JSONStreamReader` lets the caller walk through the
+objects and arrays of a JSON document one element at a time, so that
+only the element being processed needs to be kept in memory. It is used
+by the ``import`` command to load schema files that are too large to be
+parsed with ``json.load``::
+
+    reader = JSONStreamReader(fp)
+    for key in reader.iter_object():
+        if key == "data_files":
+            for record in reader.iter_values():
+                process(record)
+        else:
+            reader.read_value()
+
+Every value yielded by the iterators must be consumed (either with
+:meth:`JSONStreamReader.read_value` or by iterating over it) before
+moving to the next one.
+"""
+
+import json
+from typing import Any, Iterator, TextIO
+
+WHITESPACE = " \t\n\r"
+NUMBER_START = "-0123456789"
+NUMBER_CHARS = "0123456789+-.eE"
+
+
+class JSONStreamReader:
+    def __init__(self, fp: TextIO, chunk_size: int = 65536):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        """Read more characters from the file, discarding the ones already parsed
+
+        Return ``False`` if the end of the file has been reached.
+        """
+
+        if self.eof:
+            return False
+
+        # Read at least as many characters as the ones still unparsed, so
+        # that the time spent parsing large values stays linear
+        chunk = self.fp.read(max(self.chunk_size, len(self.buffer) - self.pos))
+        self.buffer = self.buffer[self.pos :] + chunk
+        self.pos = 0
+
+        if not chunk:
+            self.eof = True
+            return False
+
+        return True
+
+    def _error(self, message: str) -> json.JSONDecodeError:
+        return json.JSONDecodeError(message, self.buffer, self.pos)
+
+    def peek(self) -> str:
+        "Return the next non-whitespace character, or an empty string at the end"
+
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+
+            if not self._fill():
+                return ""
+
+    def _expect(self, chars: str) -> str:
+        char = self.peek()
+        if not char or char not in chars:
+            raise self._error(
+                "expecting {}".format(" or ".join(f"'{x}'" for x in chars))
+            )
+
+        self.pos += 1
+        return char
+
+    def read_value(self) -> Any:
+        "Parse the next value and return it as a Python object"
+
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+
+                raise
+
+            # A number near the end of the buffer might continue in the next
+            # chunk: "-7." is parsed as -7 if "5" has not been read yet
+            if (
+                self.buffer[self.pos] in NUMBER_START
+                and (end == len(self.buffer) or self.buffer[end] in NUMBER_CHARS)
+                and self._fill()
+            ):
+                continue
+
+            self.pos = end
+            return value
+
+    def iter_array(self) -> Iterator[None]:
+        """Iterate over the elements of the next value, which must be an array
+
+        The iterator does not return anything: the caller must consume each
+        element before asking for the next one.
+        """
+
+        self._expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+
+        while True:
+            yield
+            if self._expect(",]") == "]":
+                return
+
+    def iter_object(self) -> Iterator[str]:
+        """Iterate over the keys of the next value, which must be an object
+
+        The caller must consume the value associated with each key before
+        asking for the next one.
+        """
+
+        self._expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+
+        while True:
+            if self.peek() != '"':
+                raise self._error("expecting a string key")
+
+            key = self.read_value()
+            self._expect(":")
+            yield key
+
+            if self._expect(",}") == "}":
+                return
+
+    def iter_values(self) -> Iterator[Any]:
+        "Iterate over the elements of an array, parsing each of them"
+
+        for _ in self.iter_array():
+            yield self.read_value()
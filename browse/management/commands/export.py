@@ -2,9 +2,11 @@
 
 from pathlib import Path
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
+from browse.archive import ArchiveFormat, stream_archive
 from browse.models import (
+    Release,
     ReleaseDumpConfiguration,
     DumpOutputFormat,
     dump_db_to_json,
@@ -40,6 +42,19 @@ class Command(BaseCommand):
             help="Save a copy of the schema using the YAML format (useful "
             "for legacy codes)",
         )
+        parser.add_argument(
+            "--cbor",
+            action="store_true",
+            help="Save the schema in binary form, using the CBOR format (RFC 8949)",
+        )
+        parser.add_argument(
+            "--sqlite",
+            action="store_true",
+            help="""
+Save the schema into a standalone SQLite database with indexed tables,
+which can be queried without loading the whole file.
+""",
+        )
         parser.add_argument(
             "--force",
             action="store_true",
@@ -70,6 +85,44 @@ If set, skip all those quantities that have no data files.
 (This can be useful if you are using --release=REL to
 export just one release, as some quantities might have been
 included because of a different release.)
+""",
+        )
+        parser.add_argument(
+            "--jobs",
+            type=int,
+            default=1,
+            help="""
+Number of threads used to copy the attachments (data files, plots,
+specification documents, release documents). The default is 1.
+""",
+        )
+        parser.add_argument(
+            "--hard-links",
+            action="store_true",
+            help="""
+Create hard links to the attachments instead of copying them, if the
+output path is on the same filesystem as the storage of the database.
+Be careful: modifying the exported files will modify the database!
+""",
+        )
+        parser.add_argument(
+            "--delta-from",
+            type=str,
+            default=None,
+            metavar="TAG",
+            help="""
+Only save the differences between the release TAG and the one specified
+with --release: the output will contain a file named 'delta.json' and
+the attachments of the data files that have been added.
+""",
+        )
+        parser.add_argument(
+            "--archive",
+            choices=[x.value for x in ArchiveFormat],
+            default=None,
+            help="""
+Save the schema and the attachments into a tar/zip archive instead of a
+directory. In this case, OUTPUT_PATH is the name of the archive file.
 """,
         )
         parser.add_argument(
@@ -80,18 +133,82 @@ If the folder does not exist, it will be created.""",
             type=str,
         )
 
+    def export_archive(self, configuration, archive_format, release_tag, delta_from):
+        if configuration.hard_link_attachments:
+            raise CommandError("--hard-links cannot be used with --archive")
+
+        output_path = configuration.output_folder
+        if output_path.is_dir():
+            raise CommandError(f"'{output_path}' is a directory")
+
+        try:
+            output_file = output_path.open("wb" if configuration.exist_ok else "xb")
+        except FileExistsError:
+            raise CommandError(
+                f"file '{output_path}' already exists, use --force to overwrite it"
+            )
+
+        # Paths within the archive are relative to the root of the dump
+        configuration.output_folder = Path()
+        with output_file:
+            for cur_chunk in stream_archive(
+                configuration,
+                archive_format,
+                release_tag=release_tag,
+                delta_from=delta_from,
+            ):
+                output_file.write(cur_chunk)
+
     def handle(self, *args, **options):
+        delta_from = options["delta_from"]
+        if delta_from:
+            if not options["release"]:
+                raise CommandError("--delta-from requires --release")
+
+            for cur_tag in (delta_from, options["release"]):
+                if not Release.objects.filter(tag=cur_tag).exists():
+                    raise CommandError(f"release '{cur_tag}' does not exist")
+
+        if options["sqlite"]:
+            if options["cbor"]:
+                raise CommandError("--cbor and --sqlite cannot be used together")
+
+            # SQLite databases cannot be written one chunk at a time
+            if options["archive"]:
+                raise CommandError("--sqlite cannot be used with --archive")
+
+            if delta_from:
+                raise CommandError("--sqlite cannot be used with --delta-from")
+
+            output_format = DumpOutputFormat.SQLITE
+        elif options["cbor"]:
+            output_format = DumpOutputFormat.CBOR
+        elif options["json"]:
+            output_format = DumpOutputFormat.JSON
+        else:
+            output_format = DumpOutputFormat.YAML
+
+        configuration = ReleaseDumpConfiguration(
+            no_attachments=options["no_attachments"],
+            exist_ok=options["force"],
+            output_format=output_format,
+            skip_empty_quantities=options["skip_empty_quantities"],
+            skip_empty_entities=options["skip_empty_entities"],
+            only_tree=options["only_tree"],
+            output_folder=Path(options["output_path"]),
+            num_of_copy_threads=options["jobs"],
+            hard_link_attachments=options["hard_links"],
+        )
+
+        if options["archive"]:
+            self.export_archive(
+                configuration,
+                ArchiveFormat(options["archive"]),
+                release_tag=options["release"],
+                delta_from=delta_from,
+            )
+            return
+
         dump_db_to_json(
-            ReleaseDumpConfiguration(
-                no_attachments=options["no_attachments"],
-                exist_ok=options["force"],
-                output_format=(
-                    DumpOutputFormat.JSON if options["json"] else DumpOutputFormat.YAML
-                ),
-                skip_empty_quantities=options["skip_empty_quantities"],
-                skip_empty_entities=options["skip_empty_entities"],
-                only_tree=options["only_tree"],
-                output_folder=Path(options["output_path"]),
-            ),
-            release_tag=options["release"],
+            configuration, release_tag=options["release"], delta_from=delta_from
         )
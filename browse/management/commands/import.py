@@ -1,22 +1,36 @@
 # -*- encoding: utf-8 -*-
 
+from collections import namedtuple, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+import hashlib
 from pathlib import Path
 import json
-from typing import Any, List, Dict
+import threading
+from typing import Any, List, Dict, Optional, Set
 from uuid import UUID
 import yaml
 
 from django.core.files import File
+from django.db import transaction
+from django.db.models import Max
 from django.utils.dateparse import parse_datetime
 from django.utils.timezone import is_aware, make_aware
 from django.core.management.base import BaseCommand, CommandError
+from browse.jsonstream import JSONStreamReader
 from browse.models import (
+    MANIFEST_FILE_NAME,
     Entity,
     Quantity,
     DataFile,
     FormatSpecification,
     Release,
+    file_sha256,
+    mark_all_release_dumps_outdated,
+    mark_release_dumps_outdated,
+    rebuild_paths,
     update_release_file_dumps,
+    update_release_path_indexes,
 )
 
 
@@ -44,11 +58,399 @@ def build_query_from_uuid_or_name(key, name_field="name"):
     return query
 
 
+def uuid_argument(uuid) -> Dict[str, Any]:
+    """Return the keyword arguments that set the UUID of a new model instance
+
+    If "uuid" is ``None``, the dictionary is empty, so that the model
+    generates a random UUID by itself.
+    """
+
+    return {"uuid": uuid} if uuid else {}
+
+
+def to_uuid(value) -> Optional[UUID]:
+    "Convert `value` into a UUID, returning ``None`` if it is not a valid UUID"
+
+    try:
+        return UUID(str(value))
+    except ValueError:
+        return None
+
+
+def find_data_files(uuids, batch_size=1000) -> Dict[UUID, str]:
+    """Look for the data files with the given UUIDs in the database
+
+    Return a dictionary associating the UUID of each data file that was found
+    with its name. The database is queried once every `batch_size` UUIDs.
+    """
+
+    uuids = sorted({uuid for uuid in map(to_uuid, uuids) if uuid})
+    result = {}  # type: Dict[UUID, str]
+    for start in range(0, len(uuids), batch_size):
+        result.update(
+            DataFile.objects.filter(
+                uuid__in=uuids[start : start + batch_size]
+            ).values_list("uuid", "name")
+        )
+
+    return result
+
+
+# Name and checksum of a file saved in the storage by AttachmentStager
+StagedFile = namedtuple("StagedFile", ["name", "sha256"])
+
+
+class HashingFile(File):
+    "A File that computes the SHA-256 checksum of the data read through `chunks`"
+
+    sha256 = None
+
+    def chunks(self, chunk_size=None):
+        checksum = hashlib.sha256()
+        for chunk in super().chunks(chunk_size):
+            checksum.update(chunk)
+            yield chunk
+
+        self.sha256 = checksum.hexdigest()
+
+
+class AttachmentStager:
+    """Save attachments into the storage on a pool of threads
+
+    Each call to :meth:`stage` saves a file into the storage of a file field
+    (e.g., ``data_files/`` under ``MEDIA_ROOT``) and returns a ``Future``
+    whose result is a :class:`StagedFile`. The SHA-256 checksum is computed
+    while the file is being copied, so that every file is read only once.
+
+    If the directory containing the attachments has a ``manifest.json`` file
+    (written by the "export" command), the checksum of every file listed in it
+    is verified.
+
+    The class is a context manager: if an exception occurs, pending files are
+    not saved and the ones already saved are deleted from the storage.
+    """
+
+    def __init__(self, source_path: Path, num_of_threads=1):
+        self.source_path = source_path
+        self.executor = (
+            ThreadPoolExecutor(max_workers=num_of_threads)
+            if num_of_threads > 1
+            else None
+        )
+        self.lock = threading.Lock()
+        self.staged = []  # type: List[Any]
+        # Futures returned by `stage` that have not completed yet
+        self.futures = set()  # type: Set[Future]
+
+        self.checksums = {}  # type: Dict[str, str]
+        manifest_path = source_path / MANIFEST_FILE_NAME
+        if manifest_path.is_file():
+            with manifest_path.open("rt") as inpf:
+                self.checksums = {
+                    key: entry["sha256"]
+                    for (key, entry) in json.load(inpf).get("files", {}).items()
+                }
+
+    def stage(self, instance, field_name: str, file_path: Path) -> Future:
+        "Save `file_path` into the storage of the field `field_name` of `instance`"
+
+        field = instance._meta.get_field(field_name)
+        name = field.generate_filename(instance, file_path.name)
+
+        try:
+            key = file_path.relative_to(self.source_path).as_posix()
+        except ValueError:
+            key = None
+
+        if self.executor:
+            future = self.executor.submit(
+                self._save, field.storage, name, file_path, self.checksums.get(key)
+            )
+            with self.lock:
+                self.futures.add(future)
+            future.add_done_callback(self._forget)
+            return future
+
+        future = Future()
+        try:
+            future.set_result(
+                self._save(field.storage, name, file_path, self.checksums.get(key))
+            )
+        except Exception as exc:
+            future.set_exception(exc)
+
+        return future
+
+    def _save(self, storage, name, file_path: Path, expected_sha256) -> StagedFile:
+        with file_path.open("rb") as inpf:
+            content = HashingFile(inpf, name)
+            name = storage.save(name, content)
+
+        with self.lock:
+            self.staged.append((storage, name))
+
+        # Not all the storages read the file through File.chunks()
+        sha256 = content.sha256 or file_sha256(file_path)
+        if expected_sha256 and sha256 != expected_sha256:
+            raise CommandError(f"wrong SHA-256 checksum for file {file_path}")
+
+        return StagedFile(name, sha256)
+
+    def _forget(self, future: Future):
+        with self.lock:
+            self.futures.discard(future)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.executor:
+            if exc_type is not None:
+                # Executor.shutdown() accepts "cancel_futures" only since
+                # Python 3.9
+                with self.lock:
+                    pending = list(self.futures)
+                for future in pending:
+                    future.cancel()
+
+            self.executor.shutdown(wait=True)
+
+        if exc_type is not None:
+            for storage, name in self.staged:
+                storage.delete(name)
+
+
+class BulkWriter:
+    """Collect entities, quantities, and data files and save them in batches
+
+    Objects passed to :meth:`add` are kept in memory and written to the
+    database using ``bulk_create`` (for new objects) and ``bulk_update`` (for
+    objects whose UUID is already in the database), `batch_size` objects at a
+    time. Batches are always written parents-first (entities, quantities,
+    data files), so that foreign keys are always valid. Attachments are
+    saved by `stager` as soon as objects are added, and rows are written
+    only once all the files in their batch have been saved.
+
+    Which objects of a batch are already in the database is checked with
+    one query when the batch is written, so that the memory used by this
+    class depends on `batch_size` and not on the size of the database.
+
+    New entities are inserted with a placeholder position in the MPTT tree;
+    the tree is rebuilt once by :meth:`finish`, which must be called after
+    the last object has been added.
+    """
+
+    MODELS = (Entity, Quantity, DataFile)
+    UPDATE_FIELDS = {
+        Entity: ["name", "parent"],
+        Quantity: ["name", "format_spec", "parent_entity"],
+        DataFile: [
+            "name",
+            "upload_date",
+            "metadata",
+            "file_data",
+            "quantity",
+            "spec_version",
+            "plot_file",
+            "plot_mime_type",
+            "file_data_sha256",
+            "plot_file_sha256",
+        ],
+    }
+
+    def __init__(self, stager: AttachmentStager, batch_size=1000):
+        self.stager = stager
+        self.batch_size = batch_size
+        self.pending = {model: {} for model in self.MODELS}
+        # UUIDs recently found in the database by `exists`, at most
+        # `batch_size` per model (e.g., the parents of consecutive records)
+        self.known = {model: OrderedDict() for model in self.MODELS}
+        self.attachments = {}  # type: Dict[UUID, Dict[str, Future]]
+        self.format_specs = {}  # type: Dict[Any, FormatSpecification]
+        self.next_tree_id = (
+            Entity.objects.aggregate(Max("tree_id"))["tree_id__max"] or 0
+        ) + 1
+        self.tree_changed = False
+        self.paths_changed = False
+        self.load_format_specifications()
+
+    def load_format_specifications(self):
+        "Cache all the format specifications, indexed both by UUID and document_ref"
+
+        self.format_specs = {}
+        for spec in FormatSpecification.objects.all():
+            self.format_specs[("uuid", spec.uuid)] = spec
+            self.format_specs[("document_ref", spec.document_ref)] = spec
+
+    def find_format_specification(self, key) -> Optional[FormatSpecification]:
+        query = build_query_from_uuid_or_name(key, name_field="document_ref")
+        return self.format_specs.get(next(iter(query.items())))
+
+    def exists(self, model, uuid) -> bool:
+        "Return True if the object is in the database or is going to be added"
+
+        if not uuid:
+            return False
+
+        try:
+            uuid = UUID(str(uuid))
+        except ValueError:
+            return False
+
+        if uuid in self.pending[model] or uuid in self.known[model]:
+            return True
+
+        if not model.objects.filter(uuid=uuid).exists():
+            return False
+
+        self.known[model][uuid] = True
+        if len(self.known[model]) > self.batch_size:
+            self.known[model].popitem(last=False)
+
+        return True
+
+    def add(self, obj, attachments: Optional[Dict[str, Optional[Path]]] = None):
+        """Schedule `obj` to be saved in the database
+
+        The dictionary `attachments` associates the name of a file field in
+        `obj` with the path of the file to be stored in it.
+        """
+
+        model = type(obj)
+        self.pending[model][obj.pk] = obj
+
+        if model is Entity:
+            self.tree_changed = True
+
+        if model in (Entity, Quantity):
+            self.paths_changed = True
+
+        if attachments is not None:
+            self.attachments[obj.pk] = {
+                field_name: self.stager.stage(obj, field_name, path)
+                for (field_name, path) in attachments.items()
+                if path
+            }
+
+        if len(self.pending[model]) >= self.batch_size:
+            self.flush()
+
+        return obj
+
+    def save_attachments(self, obj):
+        "Wait until the attachments of `obj` are in the storage"
+
+        for field_name, future in self.attachments.pop(obj.pk, {}).items():
+            staged_file = future.result()
+            setattr(obj, field_name, staged_file.name)
+            setattr(obj, f"{field_name}_sha256", staged_file.sha256)
+
+    def flush(self):
+        "Write all the pending objects to the database"
+
+        for model in self.MODELS:
+            pending = self.pending[model]
+            if not pending:
+                continue
+
+            existing = set(
+                model.objects.filter(uuid__in=list(pending.keys())).values_list(
+                    "uuid", flat=True
+                )
+            )
+            to_create = [obj for (pk, obj) in pending.items() if pk not in existing]
+            to_update = [obj for (pk, obj) in pending.items() if pk in existing]
+
+            # Rows must be written only once their files are in the storage
+            for obj in to_create + to_update:
+                self.save_attachments(obj)
+
+            if to_create:
+                if model is Entity:
+                    # Placeholder position: each new entity is the root of
+                    # its own tree, in the same order as they were added.
+                    # The call to rebuild() in finish() will fix this
+                    for obj in to_create:
+                        obj.tree_id = self.next_tree_id
+                        obj.lft, obj.rght, obj.level = 1, 2, 0
+                        self.next_tree_id += 1
+
+                model.objects.bulk_create(to_create, batch_size=self.batch_size)
+
+                # Entities and quantities are included in every dump
+                if model is not DataFile:
+                    mark_all_release_dumps_outdated()
+
+            if to_update:
+                model.objects.bulk_update(
+                    to_update, self.UPDATE_FIELDS[model], batch_size=self.batch_size
+                )
+
+                # bulk_update() does not send any signal
+                if model is DataFile:
+                    mark_release_dumps_outdated(data_files__in=existing)
+                else:
+                    mark_all_release_dumps_outdated()
+
+            self.pending[model] = {}
+
+    def finish(self):
+        "Write all the pending objects and rebuild the tree of entities"
+
+        self.flush()
+
+        if self.tree_changed:
+            Entity.objects.rebuild()
+            self.tree_changed = False
+
+        # The paths depend on the tree, so they must be rebuilt afterwards
+        if self.paths_changed:
+            rebuild_paths(batch_size=self.batch_size)
+            self.paths_changed = False
+
+
 class Command(BaseCommand):
     help = "Load records into the database from a JSON file"
     output_transaction = True
     requires_migrations_checks = True
 
+    def create_entity(self, entity_dict, parent=None, nest_level=0):
+        cur_entity_name = entity_dict.get("name")
+        uuid = entity_dict.get("uuid")
+
+        if uuid:
+            uuid = UUID(uuid)
+            self.stdout.write(
+                spaces(nest_level) + f"Entity {cur_entity_name} ({uuid.hex[0:6]})"
+            )
+        else:
+            self.stdout.write(spaces(nest_level) + f"Entity {cur_entity_name}")
+
+        if self.dry_run:
+            return cur_entity_name
+
+        if self.bulk_writer:
+            if self.no_overwrite and self.bulk_writer.exists(Entity, uuid):
+                return Entity(uuid=uuid)
+
+            return self.bulk_writer.add(
+                Entity(name=cur_entity_name, parent=parent, **uuid_argument(uuid))
+            )
+
+        cur_entity = Entity.objects.filter(uuid=uuid)
+        if not (self.no_overwrite and cur_entity):
+            (cur_entity, _) = Entity.objects.update_or_create(
+                uuid=uuid,
+                defaults={
+                    "name": cur_entity_name,
+                    "parent": parent,
+                },
+            )
+        else:
+            cur_entity = cur_entity[0]
+
+        return cur_entity
+
     def create_entities(
         self,
         entities,
@@ -57,31 +459,9 @@ class Command(BaseCommand):
         dependencies_to_add: Dict[UUID, List[UUID]] = {},
     ):
         for entity_dict in entities:
-            cur_entity_name = entity_dict.get("name")
-            uuid = entity_dict.get("uuid")
-
-            if uuid:
-                uuid = UUID(uuid)
-                self.stdout.write(
-                    spaces(nest_level) + f"Entity {cur_entity_name} ({uuid.hex[0:6]})"
-                )
-            else:
-                self.stdout.write(spaces(nest_level) + f"Entity {cur_entity_name}")
-
-            if not self.dry_run:
-                cur_entity = Entity.objects.filter(uuid=uuid)
-                if not (self.no_overwrite and cur_entity):
-                    (cur_entity, _) = Entity.objects.update_or_create(
-                        uuid=uuid,
-                        defaults={
-                            "name": cur_entity_name,
-                            "parent": parent,
-                        },
-                    )
-                else:
-                    cur_entity = cur_entity[0]
-            else:
-                cur_entity = cur_entity_name
+            cur_entity = self.create_entity(
+                entity_dict, parent=parent, nest_level=nest_level
+            )
 
             if "quantities" in entity_dict:
                 self.create_quantities(
@@ -91,7 +471,7 @@ class Command(BaseCommand):
                     dependencies_to_add=dependencies_to_add,
                 )
 
-            if not self.dry_run:
+            if not (self.dry_run or self.bulk_writer):
                 cur_entity.save()
 
             # Recursively create children
@@ -102,7 +482,102 @@ class Command(BaseCommand):
                 dependencies_to_add=dependencies_to_add,
             )
 
+    def stream_entities(
+        self,
+        reader: JSONStreamReader,
+        parent=None,
+        nest_level=0,
+        dependencies_to_add: Dict[UUID, List[UUID]] = {},
+    ):
+        """Like create_entities, but read the tree of entities from `reader`
+
+        Each entity is created as soon as its "quantities" or "children" are
+        found, so neither of them is ever kept in memory as a whole. This
+        requires that "uuid" and "name" come before them, which is always
+        the case for files produced by the "export" command.
+        """
+
+        for _ in reader.iter_array():
+            entity_dict = {}
+            cur_entity = None
+            for key in reader.iter_object():
+                if key not in ("quantities", "children") or reader.peek() != "[":
+                    if cur_entity is not None and key in ("uuid", "name"):
+                        raise CommandError(
+                            f'"{key}" must come before "quantities" and "children" '
+                            f"in entity {entity_dict.get('name')} when streaming"
+                        )
+
+                    entity_dict[key] = reader.read_value()
+                    continue
+
+                if cur_entity is None:
+                    if "name" not in entity_dict:
+                        raise CommandError(
+                            f'"name" must come before "{key}" in entities '
+                            "when streaming"
+                        )
+
+                    cur_entity = self.create_entity(
+                        entity_dict, parent=parent, nest_level=nest_level
+                    )
+
+                if key == "quantities":
+                    self.create_quantities(
+                        reader.iter_values(),
+                        parent_entity=cur_entity,
+                        nest_level=nest_level + 1,
+                        dependencies_to_add=dependencies_to_add,
+                    )
+                else:
+                    self.stream_entities(
+                        reader,
+                        parent=cur_entity,
+                        nest_level=nest_level + 1,
+                        dependencies_to_add=dependencies_to_add,
+                    )
+
+            if cur_entity is None:
+                cur_entity = self.create_entity(
+                    entity_dict, parent=parent, nest_level=nest_level
+                )
+
+            if not (self.dry_run or self.bulk_writer):
+                cur_entity.save()
+
+    def stage_format_specifications(self, specs) -> Dict[UUID, Future]:
+        "Start saving the documents of the format specifications in the storage"
+
+        staged_files = {}
+        for spec_dict in specs:
+            uuid = spec_dict.get("uuid")
+            doc_file_name = spec_dict.get("file_path")
+            if not (uuid and doc_file_name):
+                continue
+
+            uuid = UUID(uuid)
+            if self.no_overwrite and self.object_exists(FormatSpecification, uuid):
+                continue
+
+            staged_files[uuid] = self.bulk_writer.stager.stage(
+                FormatSpecification(
+                    uuid=uuid,
+                    doc_file_name=doc_file_name,
+                    doc_mime_type=spec_dict.get("doc_mime_type", ""),
+                ),
+                "doc_file",
+                self.find_attachment(doc_file_name, "format_spec"),
+            )
+
+        return staged_files
+
     def create_format_specifications(self, specs):
+        staged_files = {}  # type: Dict[UUID, Future]
+        if self.bulk_writer and not self.dry_run:
+            # Save all the documents in parallel before creating the records
+            specs = list(specs)
+            staged_files = self.stage_format_specifications(specs)
+
         for spec_dict in specs:
             document_ref = spec_dict.get("document_ref")
             uuid = spec_dict.get("uuid")
@@ -121,16 +596,16 @@ class Command(BaseCommand):
 
             doc_file_name = spec_dict.get("file_path")
 
-            if doc_file_name:
-                file_path = self.attachment_source_path / doc_file_name
-                try:
-                    fp = open(file_path, "rb")
-                except FileNotFoundError:
-                    file_path = (
-                        self.attachment_source_path / "format_spec" / doc_file_name
-                    )
-                    fp = open(file_path, "rb")
-
+            # The checksum of files that are not staged is computed when
+            # the record is saved, see FormatSpecification.save()
+            doc_file_sha256 = ""
+            if uuid in staged_files:
+                file_path = self.find_attachment(doc_file_name, "format_spec")
+                fp = None
+                (doc_file, doc_file_sha256) = staged_files[uuid].result()
+            elif doc_file_name:
+                file_path = self.find_attachment(doc_file_name, "format_spec")
+                fp = open(file_path, "rb")
                 doc_file = File(fp, "rb")
             else:
                 file_path = "<no file>"
@@ -157,6 +632,7 @@ class Command(BaseCommand):
                         "document_ref": document_ref,
                         "title": title,
                         "doc_file": doc_file,
+                        "doc_file_sha256": doc_file_sha256,
                         "doc_file_name": doc_file_name,
                         "doc_mime_type": doc_mime_type,
                         "file_mime_type": file_mime_type,
@@ -181,7 +657,7 @@ class Command(BaseCommand):
 
             if uuid:
                 uuid = UUID(uuid)
-                if self.no_overwrite and Quantity.objects.filter(uuid=uuid):
+                if self.no_overwrite and self.object_exists(Quantity, uuid):
                     self.stdout.write(
                         spaces(nest_level)
                         + f"Quantity {name} already exists in the database"
@@ -201,7 +677,12 @@ class Command(BaseCommand):
                     raise CommandError(f"expected entity for quantity {name}")
 
                 try:
-                    entity = Entity.objects.get(uuid=parent_uuid)
+                    if self.bulk_writer:
+                        if not self.bulk_writer.exists(Entity, parent_uuid):
+                            raise Entity.DoesNotExist()
+                        entity = Entity(uuid=UUID(parent_uuid))
+                    else:
+                        entity = Entity.objects.get(uuid=parent_uuid)
 
                 except Entity.DoesNotExist:
                     raise CommandError(
@@ -213,11 +694,18 @@ class Command(BaseCommand):
             format_spec = None
             if format_spec_ref:
                 try:
-                    format_spec = FormatSpecification.objects.get(
-                        **build_query_from_uuid_or_name(
-                            format_spec_ref, name_field="document_ref"
+                    if self.bulk_writer:
+                        format_spec = self.bulk_writer.find_format_specification(
+                            format_spec_ref
+                        )
+                        if not format_spec:
+                            raise FormatSpecification.DoesNotExist()
+                    else:
+                        format_spec = FormatSpecification.objects.get(
+                            **build_query_from_uuid_or_name(
+                                format_spec_ref, name_field="document_ref"
+                            )
                         )
-                    )
                 except FormatSpecification.DoesNotExist:
                     self.stderr.write(
                         f"Error, format specification {format_spec_ref} "
@@ -227,28 +715,35 @@ class Command(BaseCommand):
             if self.dry_run:
                 continue
 
-            (quantity, _) = Quantity.objects.update_or_create(
-                uuid=uuid,
-                defaults={
-                    "name": name,
-                    "format_spec": format_spec,
-                    "parent_entity": entity,
-                },
-            )
+            if self.bulk_writer:
+                quantity = self.bulk_writer.add(
+                    Quantity(
+                        name=name,
+                        format_spec=format_spec,
+                        parent_entity=entity,
+                        **uuid_argument(uuid),
+                    )
+                )
+            else:
+                (quantity, _) = Quantity.objects.update_or_create(
+                    uuid=uuid,
+                    defaults={
+                        "name": name,
+                        "format_spec": format_spec,
+                        "parent_entity": entity,
+                    },
+                )
 
             if "data_files" in quantity_dict:
                 self.create_data_files(
                     quantity_dict["data_files"],
                     parent_quantity=quantity,
                     nest_level=nest_level + 1,
+                    dependencies_to_add=dependencies_to_add,
                 )
 
-                for cur_dict in quantity_dict["data_files"]:
-                    deps = cur_dict.get("dependencies", [])
-                    if deps:
-                        dependencies_to_add[UUID(cur_dict["uuid"])] = deps
-
-            quantity.save()
+            if not self.bulk_writer:
+                quantity.save()
 
     def create_data_files(
         self,
@@ -263,7 +758,7 @@ class Command(BaseCommand):
             if uuid:
                 uuid = UUID(uuid)
 
-            if self.no_overwrite and uuid and DataFile.objects.filter(uuid=uuid):
+            if self.no_overwrite and uuid and self.object_exists(DataFile, uuid):
                 self.stdout.write(
                     spaces(nest_level)
                     + f"Data file {name} already exists in the database"
@@ -271,8 +766,6 @@ class Command(BaseCommand):
                 continue
 
             dependencies = data_file_dict.get("dependencies", [])
-            if dependencies:
-                dependencies_to_add[uuid] = dependencies
 
             metadata = json.dumps(data_file_dict.get("metadata", {}))
             filename = data_file_dict.get("file_name")
@@ -293,31 +786,35 @@ class Command(BaseCommand):
                     f"no upload date specified for data file {name} ({uuid.hex[0:6]})"
                 )
 
-            if filename:
-                file_path = self.attachment_source_path / filename
-                try:
-                    fp = open(file_path, "rb")
-                except FileNotFoundError:
-                    file_path = self.attachment_source_path / "data_files" / filename
-                    fp = open(file_path, "rb")
-                file_data = File(fp, "rb")
-            else:
+            if self.bulk_writer:
+                # Files are opened only when the data file is actually
+                # written to the database, see BulkWriter.flush()
                 fp = None
-                file_data = None
+                file_data = (
+                    self.find_attachment(filename, "data_files") if filename else None
+                )
+                plot_fp = None
+                plot_file = (
+                    self.find_attachment(plot_filename, "plot_files")
+                    if plot_filename
+                    else None
+                )
+            else:
+                if filename:
+                    fp = self.find_attachment(filename, "data_files").open("rb")
+                    file_data = File(fp, "rb")
+                else:
+                    fp = None
+                    file_data = None
 
-            if plot_filename:
-                file_path = self.attachment_source_path / plot_filename
-                try:
-                    plot_fp = open(file_path, "rb")
-                except FileNotFoundError:
-                    file_path = (
-                        self.attachment_source_path / "plot_files" / plot_filename
+                if plot_filename:
+                    plot_fp = self.find_attachment(plot_filename, "plot_files").open(
+                        "rb"
                     )
-                    plot_fp = open(file_path, "rb")
-                plot_file = File(plot_fp, "rb")
-            else:
-                plot_fp = None
-                plot_file = None
+                    plot_file = File(plot_fp, "rb")
+                else:
+                    plot_fp = None
+                    plot_file = None
 
             if uuid:
                 self.stdout.write(
@@ -335,7 +832,30 @@ class Command(BaseCommand):
             quantity = parent_quantity
             if not quantity:
                 parent_uuid = data_file_dict.get("quantity", "")
-                quantity = Quantity.objects.get(uuid=parent_uuid)
+                if self.bulk_writer:
+                    if not self.bulk_writer.exists(Quantity, parent_uuid):
+                        raise CommandError(
+                            f"quantity {parent_uuid} for data file {name} does not exist"
+                        )
+                    quantity = Quantity(uuid=UUID(parent_uuid))
+                else:
+                    quantity = Quantity.objects.get(uuid=parent_uuid)
+
+            if self.bulk_writer:
+                self.bulk_writer.add(
+                    DataFile(
+                        name=name,
+                        upload_date=upload_date,
+                        metadata=metadata,
+                        quantity=quantity,
+                        spec_version=data_file_dict.get("spec_version"),
+                        plot_mime_type=data_file_dict.get("plot_mime_type"),
+                        **uuid_argument(uuid),
+                    ),
+                    attachments={"file_data": file_data, "plot_file": plot_file},
+                )
+                self.add_dependencies(dependencies_to_add, uuid, dependencies)
+                continue
 
             (cur_data_file, _) = DataFile.objects.update_or_create(
                 uuid=uuid,
@@ -357,42 +877,155 @@ class Command(BaseCommand):
             if plot_fp:
                 plot_fp.close()
 
-    def update_dependencies(self, dependencies_to_add: Dict[UUID, List[UUID]]):
+            self.add_dependencies(dependencies_to_add, uuid, dependencies)
+
+    def object_exists(self, model, uuid) -> bool:
+        if self.bulk_writer and model in BulkWriter.MODELS:
+            return self.bulk_writer.exists(model, uuid)
+
+        return model.objects.filter(uuid=uuid).exists()
+
+    def find_attachment(self, file_name, subfolder) -> Path:
+        """Return the path to an attachment of the schema file
+
+        The file is looked first in the same directory as the schema, then
+        in the subdirectory `subfolder` (this is the layout used by the
+        "export" command).
+        """
+
+        file_path = self.attachment_source_path / file_name
+        if not file_path.exists():
+            file_path = self.attachment_source_path / subfolder / file_name
+
+        return file_path
+
+    def add_dependencies(
+        self,
+        dependencies_to_add: Dict[UUID, List[UUID]],
+        data_file_uuid: UUID,
+        dependencies: List[UUID],
+    ):
+        """Record the dependencies of a data file, and link them in batches
+
+        Dependencies are linked once `dependencies_to_add` contains at least
+        `batch_size` data files, so that the dictionary does not grow with
+        the size of the schema. Dependencies referring to data files that
+        are not in the database yet (they might appear later in the schema)
+        are kept in the dictionary and linked by :meth:`update_dependencies`
+        at the end.
+        """
+
+        if dependencies:
+            dependencies_to_add[data_file_uuid] = dependencies
+
+        if self.dry_run or len(dependencies_to_add) < self.dependency_batch_size:
+            return
+
+        if self.bulk_writer:
+            # Make sure that all the data files read so far are in the database
+            self.bulk_writer.flush()
+
+        names = self.find_data_files_with_dependencies(dependencies_to_add)
+        resolved = {
+            data_file_uuid: dependencies
+            for (data_file_uuid, dependencies) in dependencies_to_add.items()
+            if to_uuid(data_file_uuid) in names
+            and all(to_uuid(dep) in names for dep in dependencies)
+        }
+        for data_file_uuid in resolved:
+            del dependencies_to_add[data_file_uuid]
+
+        self.update_dependencies(resolved, names=names)
+
+        # Do not look again for unresolved dependencies until enough new
+        # ones have been added
+        self.dependency_batch_size = max(self.batch_size, 2 * len(dependencies_to_add))
+
+    def find_data_files_with_dependencies(
+        self, dependencies_to_add: Dict[UUID, List[UUID]]
+    ) -> Dict[UUID, str]:
+        return find_data_files(
+            list(dependencies_to_add.keys())
+            + [dep for deps in dependencies_to_add.values() for dep in deps],
+            batch_size=self.batch_size,
+        )
+
+    def update_dependencies(
+        self,
+        dependencies_to_add: Dict[UUID, List[UUID]],
+        names: Optional[Dict[UUID, str]] = None,
+    ):
+        dependencies_to_add = {
+            data_file_uuid: dependencies
+            for (data_file_uuid, dependencies) in dependencies_to_add.items()
+            if dependencies
+        }
+        if not dependencies_to_add:
+            return
+
+        if names is None:
+            names = self.find_data_files_with_dependencies(dependencies_to_add)
+
+        # Check every reference before adding anything, so that all the
+        # missing objects can be reported at once
+        errors = []
+        links = []
         for data_file_uuid, dependencies in dependencies_to_add.items():
-            if not dependencies:
+            data_file_uuid = to_uuid(data_file_uuid)
+            if data_file_uuid not in names:
+                errors.append(
+                    "There is no data file with UUID {}".format(data_file_uuid)
+                )
                 continue
 
-            try:
-                cur_data_file = DataFile.objects.get(uuid=data_file_uuid)
-            except DataFile.DoesNotExist:
-                raise CommandError(
-                    "There is no data file with UUID {}".format(
-                        data_file_uuid.hex[0:6],
-                    )
-                )
             for cur_dep in dependencies:
-                try:
-                    reference = DataFile.objects.get(uuid=cur_dep)
-                    cur_data_file.dependencies.add(reference)
-                    self.stdout.write(
-                        (
-                            'Adding "{dep_name}" ({dep_uuid}) as a dependency '
-                            + 'to "{parent_name}" ({parent_uuid})'
-                        ).format(
-                            dep_name=reference.name,
-                            dep_uuid=reference.uuid.hex[0:6],
-                            parent_name=cur_data_file.name,
-                            parent_uuid=cur_data_file.uuid.hex[0:6],
-                        )
-                    )
-                except DataFile.DoesNotExist:
-                    raise CommandError(
+                dep_uuid = to_uuid(cur_dep)
+                if dep_uuid not in names:
+                    errors.append(
                         (
                             'Object with UUID "{cur_dep}" does not exist but is '
                             + 'listed in the dependencies for "{name}"'
-                        ).format(cur_dep=cur_dep, name=cur_data_file.name)
+                        ).format(cur_dep=cur_dep, name=names[data_file_uuid])
                     )
-            cur_data_file.save()
+                    continue
+
+                links.append((data_file_uuid, dep_uuid))
+
+        if errors:
+            raise CommandError("\n".join(errors))
+
+        for data_file_uuid, dep_uuid in links:
+            self.stdout.write(
+                (
+                    'Adding "{dep_name}" ({dep_uuid}) as a dependency '
+                    + 'to "{parent_name}" ({parent_uuid})'
+                ).format(
+                    dep_name=names[dep_uuid],
+                    dep_uuid=dep_uuid.hex[0:6],
+                    parent_name=names[data_file_uuid],
+                    parent_uuid=data_file_uuid.hex[0:6],
+                )
+            )
+
+        if self.dry_run:
+            return
+
+        through_model = DataFile.dependencies.through
+        through_model.objects.bulk_create(
+            [
+                through_model(from_datafile_id=from_uuid, to_datafile_id=to_uuid)
+                for (from_uuid, to_uuid) in links
+            ],
+            batch_size=self.batch_size,
+            ignore_conflicts=True,
+        )
+
+        # bulk_create() does not send the "m2m_changed" signal
+        changed_data_files = sorted({from_uuid for (from_uuid, _) in links})
+        for start in range(0, len(changed_data_files), self.batch_size):
+            mark_release_dumps_outdated(
+                data_files__in=changed_data_files[start : start + self.batch_size]
+            )
 
     def create_releases(self, releases):
         for rel_dict in releases:
@@ -417,6 +1050,21 @@ class Command(BaseCommand):
             if not rel_date:
                 raise CommandError(f"no date specified for release {tag}")
 
+            if not self.dry_run:
+                # Check that all the data files exist before creating anything
+                data_file_uuids = [to_uuid(cur_uuid) for cur_uuid in data_files]
+                names = find_data_files(data_file_uuids, batch_size=self.batch_size)
+                missing = [
+                    str(cur_uuid)
+                    for (cur_uuid, parsed_uuid) in zip(data_files, data_file_uuids)
+                    if parsed_uuid not in names
+                ]
+                if missing:
+                    raise CommandError(
+                        f"the following data files in release {tag} "
+                        f"do not exist: {', '.join(missing)}"
+                    )
+
             if release_document:
                 file_path = self.attachment_source_path / release_document
                 release_fp = open(file_path, "rb")
@@ -440,8 +1088,15 @@ class Command(BaseCommand):
                     },
                 )
 
-                for cur_uuid in data_files:
-                    cur_release.data_files.add(DataFile.objects.get(uuid=cur_uuid))
+                through_model = DataFile.release_tags.through
+                through_model.objects.bulk_create(
+                    [
+                        through_model(datafile_id=cur_uuid, release_id=cur_release.tag)
+                        for cur_uuid in names.keys()
+                    ],
+                    batch_size=self.batch_size,
+                    ignore_conflicts=True,
+                )
 
                 cur_release.save()
 
@@ -464,6 +1119,44 @@ class Command(BaseCommand):
             action="store_true",
             help="Do not overwrite existing objects in the database.",
         )
+        parser.add_argument(
+            "--bulk",
+            action="store_true",
+            help="""
+Save entities, quantities, and data files using bulk queries within one
+transaction per schema file. This is much faster for large schemas, but
+signals are not sent and the previous attachments of updated data files
+are not deleted from the storage.
+""",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="""
+Number of objects to save at once when --bulk is used, and number of UUIDs
+to look for in each query when linking dependencies and releases (default:
+1000)
+""",
+        )
+        parser.add_argument(
+            "--jobs",
+            type=int,
+            default=1,
+            help="""
+Number of threads used to save attachments in the storage when --bulk is
+used (default: 1)
+""",
+        )
+        parser.add_argument(
+            "--stream",
+            action="store_true",
+            help="""
+Parse JSON schema files incrementally and save each record as soon as it is
+read, instead of loading the whole file in memory. YAML files are always
+loaded in memory.
+""",
+        )
         parser.add_argument(
             "schema_file",
             nargs="+",
@@ -479,6 +1172,15 @@ etc.) will be looked in the directory where this file resides.
         self.dry_run = options["dry_run"]
         self.use_json = options["json"]
         self.no_overwrite = options["no_overwrite"]
+        self.bulk_writer = None
+        self.batch_size = options["batch_size"]
+        self.dependency_batch_size = self.batch_size
+
+        if self.batch_size < 1:
+            raise CommandError("the batch size must be a positive number")
+
+        if options["jobs"] < 1:
+            raise CommandError("the number of jobs must be a positive number")
 
         for curfile in options["schema_file"]:
             schema_filename = Path(curfile)
@@ -490,30 +1192,101 @@ etc.) will be looked in the directory where this file resides.
             with schema_filename.open("rt") as inpf:
                 if schema_filename.suffix == ".yaml":
                     schema = yaml.safe_load(inpf)
+                    import_function = partial(self.import_schema, schema)
+                elif options["stream"]:
+                    import_function = partial(
+                        self.import_schema_stream, JSONStreamReader(inpf)
+                    )
                 else:
                     schema = json.load(inpf)
+                    import_function = partial(self.import_schema, schema)
 
-            self.create_format_specifications(schema.get("format_specifications", []))
+                if options["bulk"]:
+                    stager = AttachmentStager(
+                        self.attachment_source_path, num_of_threads=options["jobs"]
+                    )
+                    try:
+                        with stager, transaction.atomic():
+                            self.bulk_writer = BulkWriter(
+                                stager=stager, batch_size=self.batch_size
+                            )
+                            import_function()
+                    finally:
+                        self.bulk_writer = None
+                else:
+                    import_function()
 
-            # FIRST add all the data files, THEN update the dependencies, otherwise
-            # some dependencies might not be found because they refer to data files
-            # that have not been added yet. Note that data files can appear either
-            # in the entity/quantity tree or in a separated "data_files" section
-            # in the JSON/YAML file, so we must gather all of them before calling
-            # self.update_dependencies(). That's the reason why we pass the
-            # dictionary "dependencies_to_add" to all the self_create_* methods
-            dependencies_to_add = {}  # type: Dict[UUID, List[UUID]]
-            self.create_entities(
-                schema.get("entities", []), dependencies_to_add=dependencies_to_add
-            )
-            self.create_quantities(
-                schema.get("quantities", []), dependencies_to_add=dependencies_to_add
-            )
-            self.create_data_files(
-                schema.get("data_files", []), dependencies_to_add=dependencies_to_add
-            )
-            self.update_dependencies(dependencies_to_add)
+        update_release_file_dumps()
+        update_release_path_indexes()
+
+    def import_schema(self, schema):
+        self.create_format_specifications(schema.get("format_specifications", []))
+        if self.bulk_writer:
+            self.bulk_writer.load_format_specifications()
+
+        # FIRST add all the data files, THEN update the dependencies, otherwise
+        # some dependencies might not be found because they refer to data files
+        # that have not been added yet. Note that data files can appear either
+        # in the entity/quantity tree or in a separated "data_files" section
+        # in the JSON/YAML file, so we must gather all of them before calling
+        # self.update_dependencies(). That's the reason why we pass the
+        # dictionary "dependencies_to_add" to all the self_create_* methods
+        dependencies_to_add = {}  # type: Dict[UUID, List[UUID]]
+        self.create_entities(
+            schema.get("entities", []), dependencies_to_add=dependencies_to_add
+        )
+        self.create_quantities(
+            schema.get("quantities", []), dependencies_to_add=dependencies_to_add
+        )
+        self.create_data_files(
+            schema.get("data_files", []), dependencies_to_add=dependencies_to_add
+        )
 
-            self.create_releases(schema.get("releases", []))
+        if self.bulk_writer:
+            self.bulk_writer.finish()
 
-        update_release_file_dumps()
+        self.update_dependencies(dependencies_to_add)
+
+        self.create_releases(schema.get("releases", []))
+
+    def import_schema_stream(self, reader: JSONStreamReader):
+        """Like import_schema, but read the sections of the schema from `reader`
+
+        Sections are processed in the same order as they appear in the file,
+        so format specifications must come before the quantities that refer
+        to them, and releases must come after the data files they contain.
+        """
+
+        dependencies_to_add = {}  # type: Dict[UUID, List[UUID]]
+        for section in reader.iter_object():
+            if section == "format_specifications":
+                self.create_format_specifications(reader.iter_values())
+                if self.bulk_writer:
+                    self.bulk_writer.load_format_specifications()
+            elif section == "entities":
+                self.stream_entities(reader, dependencies_to_add=dependencies_to_add)
+            elif section == "quantities":
+                self.create_quantities(
+                    reader.iter_values(), dependencies_to_add=dependencies_to_add
+                )
+            elif section == "data_files":
+                self.create_data_files(
+                    reader.iter_values(), dependencies_to_add=dependencies_to_add
+                )
+            elif section == "releases":
+                # Releases refer to data files, which must be in the
+                # database before their records are read
+                if self.bulk_writer:
+                    self.bulk_writer.finish()
+
+                self.update_dependencies(dependencies_to_add)
+                dependencies_to_add = {}
+
+                self.create_releases(reader.iter_values())
+            else:
+                reader.read_value()
+
+        if self.bulk_writer:
+            self.bulk_writer.finish()
+
+        self.update_dependencies(dependencies_to_add)
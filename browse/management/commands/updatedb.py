@@ -1,9 +1,11 @@
 # -*- encoding: utf-8 -*-
 import time
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from browse.models import (
+    outdated_releases,
     update_release_file_dumps,
+    update_release_path_indexes,
 )
 
 
@@ -16,15 +18,42 @@ class Command(BaseCommand):
         parser.add_argument(
             "--force",
             action="store_true",
-            help="""Force the rebuild of the JSON files for *all* releases,
-            even if they already exist""",
+            help="""Force the rebuild of the JSON files and of the path
+            indexes for *all* releases, even if they already exist and are
+            up to date""",
+        )
+        parser.add_argument(
+            "--list-stale",
+            action="store_true",
+            help="""Only print the releases whose JSON file is missing or
+            outdated, without rebuilding anything""",
+        )
+        parser.add_argument(
+            "--jobs",
+            type=int,
+            default=1,
+            metavar="N",
+            help="""Number of processes used to rebuild the JSON files
+            (default: 1)""",
         )
 
     def handle(self, *args, **options):
+        if options["list_stale"]:
+            for cur_release in outdated_releases():
+                print(cur_release.tag)
+            return
+
         force_flag = options["force"]
+        num_of_jobs = options["jobs"]
+        if num_of_jobs < 1:
+            raise CommandError("the number of jobs must be at least 1")
 
         print("Going to update the internal status of the DB…")
         start_time = time.perf_counter()
-        update_release_file_dumps(force=force_flag)
+        timings = update_release_file_dumps(force=force_flag, num_of_jobs=num_of_jobs)
+        for cur_tag, cur_time in timings:
+            print(f"Rebuilt the JSON file for release {cur_tag} in {cur_time:.1f} s")
+        for cur_tag in update_release_path_indexes(force=force_flag):
+            print(f"Rebuilt the path index for release {cur_tag}")
         end_time = time.perf_counter()
         print("The update has been completed in {:.1f} s".format(end_time - start_time))
@@ -0,0 +1,19 @@
+# -*- encoding: utf-8 -*-
+
+from django.middleware.gzip import GZipMiddleware
+
+
+class RangeAwareGZipMiddleware(GZipMiddleware):
+    """Compress responses, except the ones sent by :func:`browse.ranges.serve_file`
+
+    Byte ranges refer to the uncompressed file: compressing a partial
+    response, or a full response that advertises ``Accept-Ranges``,
+    would make the offsets used by the client wrong when it resumes a
+    download.
+    """
+
+    def process_response(self, request, response):
+        if response.status_code == 206 or response.has_header("Accept-Ranges"):
+            return response
+
+        return super().process_response(request, response)
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("browse", "0007_alter_datafile_metadata"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="datafile",
+            name="file_data_sha256",
+            field=models.CharField(
+                blank=True,
+                default="",
+                editable=False,
+                help_text="SHA-256 checksum of the file contents (empty if unknown)",
+                max_length=64,
+                verbose_name="SHA-256 checksum of the file",
+            ),
+        ),
+    ]
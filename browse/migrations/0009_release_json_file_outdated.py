@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("browse", "0008_datafile_file_data_sha256"),
+    ]
+
+    operations = [
+        # Existing dumps were never refreshed when data files changed, so
+        # we consider all of them outdated
+        migrations.AddField(
+            model_name="release",
+            name="json_file_outdated",
+            field=models.BooleanField(
+                default=True,
+                editable=False,
+                help_text="True if the release or its data files have changed since "
+                "the JSON dump was created",
+            ),
+        ),
+    ]
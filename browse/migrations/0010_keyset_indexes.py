@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("browse", "0009_release_json_file_outdated"),
+    ]
+
+    operations = [
+        # These indexes match the default ordering of each model, which
+        # is used by the keyset pagination of the REST API
+        migrations.AddIndex(
+            model_name="entity",
+            index=models.Index(fields=["name", "uuid"], name="entity_keyset_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="quantity",
+            index=models.Index(fields=["name", "uuid"], name="quantity_keyset_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="datafile",
+            index=models.Index(
+                fields=["-upload_date", "name", "uuid"], name="datafile_keyset_idx"
+            ),
+        ),
+    ]
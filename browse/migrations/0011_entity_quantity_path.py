@@ -0,0 +1,63 @@
+from django.db import migrations, models
+
+
+def fill_paths(apps, schema_editor):
+    # Historical models do not have the methods of `MPTTModel`, so the
+    # paths are computed here instead of calling `browse.models.rebuild_paths`
+    Entity = apps.get_model("browse", "Entity")
+    Quantity = apps.get_model("browse", "Quantity")
+
+    entity_paths = {}
+    entities = []
+    # Parents always come before their children in this ordering
+    for cur_entity in Entity.objects.order_by("tree_id", "lft"):
+        if cur_entity.parent_id is None:
+            cur_entity.path = cur_entity.name
+        else:
+            cur_entity.path = f"{entity_paths[cur_entity.parent_id]}/{cur_entity.name}"
+
+        entity_paths[cur_entity.uuid] = cur_entity.path
+        entities.append(cur_entity)
+
+    Entity.objects.bulk_update(entities, ["path"], batch_size=1000)
+
+    quantities = []
+    for cur_quantity in Quantity.objects.all():
+        cur_quantity.path = (
+            f"{entity_paths[cur_quantity.parent_entity_id]}/{cur_quantity.name}"
+        )
+        quantities.append(cur_quantity)
+
+    Quantity.objects.bulk_update(quantities, ["path"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("browse", "0010_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="entity",
+            name="path",
+            field=models.CharField(
+                db_index=True,
+                default="",
+                editable=False,
+                help_text="Full path of the entity, e.g., satellite/LFT",
+                max_length=4096,
+            ),
+        ),
+        migrations.AddField(
+            model_name="quantity",
+            name="path",
+            field=models.CharField(
+                db_index=True,
+                default="",
+                editable=False,
+                help_text="Full path of the quantity, e.g., satellite/LFT/cad",
+                max_length=4096,
+            ),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("browse", "0011_entity_quantity_path"),
+    ]
+
+    operations = [
+        # The indexes of existing releases are built by the "updatedb"
+        # command
+        migrations.AddField(
+            model_name="release",
+            name="path_index_outdated",
+            field=models.BooleanField(
+                default=True,
+                editable=False,
+                help_text="True if the data files of the release or their paths "
+                "have changed since the path index was built",
+            ),
+        ),
+        migrations.CreateModel(
+            name="ReleasePathIndex",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("path", models.CharField(max_length=4096)),
+                (
+                    "data_file",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="browse.datafile",
+                    ),
+                ),
+                (
+                    "release",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="path_index",
+                        to="browse.release",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "release path indexes",
+                "indexes": [
+                    models.Index(fields=["release", "path"], name="release_path_idx")
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("browse", "0012_release_path_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="release",
+            name="json_file_date",
+            field=models.DateTimeField(
+                blank=True,
+                editable=False,
+                help_text="Date when the JSON dump was created",
+                null=True,
+            ),
+        ),
+    ]
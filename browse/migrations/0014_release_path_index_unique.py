@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+def clear_path_indexes(apps, schema_editor):
+    # Concurrent rebuilds might have left duplicate rows behind: the
+    # indexes are built again from scratch by the "updatedb" command
+    ReleasePathIndex = apps.get_model("browse", "ReleasePathIndex")
+    Release = apps.get_model("browse", "Release")
+
+    ReleasePathIndex.objects.all().delete()
+    Release.objects.update(path_index_outdated=True)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("browse", "0013_release_json_file_date"),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_path_indexes, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name="releasepathindex",
+            name="release_path_idx",
+        ),
+        migrations.AddConstraint(
+            model_name="releasepathindex",
+            constraint=models.UniqueConstraint(
+                fields=("release", "path", "data_file"), name="release_path_uniq"
+            ),
+        ),
+    ]
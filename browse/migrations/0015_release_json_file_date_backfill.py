@@ -0,0 +1,33 @@
+from django.db import migrations
+
+
+def backfill_json_file_dates(apps, schema_editor):
+    # Dumps created before migration 0013 have no date, which is needed to
+    # build their ETag, and no compressed copies. Use the time the file
+    # was saved (or the release date, if the storage cannot tell) and flag
+    # the dumps, so that "updatedb" rebuilds them with their copies
+    Release = apps.get_model("browse", "Release")
+
+    for cur_release in Release.objects.filter(json_file_date=None).exclude(
+        json_file=""
+    ):
+        try:
+            date = cur_release.json_file.storage.get_modified_time(
+                cur_release.json_file.name
+            )
+        except (OSError, NotImplementedError):
+            date = cur_release.rel_date
+
+        cur_release.json_file_date = date
+        cur_release.json_file_outdated = True
+        cur_release.save(update_fields=["json_file_date", "json_file_outdated"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("browse", "0014_release_path_index_unique"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_json_file_dates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+import hashlib
+
+from django.db import migrations, models
+
+
+def compute_checksums(apps, schema_editor):
+    # The checksums are used to build the ETags of plots and specification
+    # documents, so they are computed for the files already in the storage
+    for model_name, field_name in [
+        ("FormatSpecification", "doc_file"),
+        ("DataFile", "plot_file"),
+    ]:
+        model = apps.get_model("browse", model_name)
+        for cur_object in model.objects.exclude(**{field_name: ""}).exclude(
+            **{field_name: None}
+        ):
+            field_file = getattr(cur_object, field_name)
+            checksum = hashlib.sha256()
+            try:
+                with field_file.open("rb"):
+                    for chunk in field_file.chunks():
+                        checksum.update(chunk)
+            except OSError:
+                # The file is missing from the storage
+                continue
+
+            setattr(cur_object, f"{field_name}_sha256", checksum.hexdigest())
+            cur_object.save(update_fields=[f"{field_name}_sha256"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("browse", "0015_release_json_file_date_backfill"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="formatspecification",
+            name="doc_file_sha256",
+            field=models.CharField(
+                blank=True,
+                default="",
+                editable=False,
+                help_text="SHA-256 checksum of the specification document (empty if unknown)",
+                max_length=64,
+                verbose_name="SHA-256 checksum of the specification document",
+            ),
+        ),
+        migrations.AddField(
+            model_name="datafile",
+            name="plot_file_sha256",
+            field=models.CharField(
+                blank=True,
+                default="",
+                editable=False,
+                help_text="SHA-256 checksum of the image (empty if unknown)",
+                max_length=64,
+                verbose_name="SHA-256 checksum of the image",
+            ),
+        ),
+        migrations.RunPython(compute_checksums, migrations.RunPython.noop),
+    ]
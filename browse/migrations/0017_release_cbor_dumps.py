@@ -0,0 +1,29 @@
+from pathlib import Path
+
+from django.db import migrations
+
+
+def flag_dumps_without_cbor(apps, schema_editor):
+    # CBOR dumps used to be created when they were first downloaded; now
+    # they are saved together with the JSON dump, and downloads never
+    # create them. Flag the dumps that lack them, so that "updatedb"
+    # rebuilds them
+    Release = apps.get_model("browse", "Release")
+
+    for cur_release in Release.objects.exclude(json_file="").filter(
+        json_file_outdated=False
+    ):
+        cbor_name = str(Path(cur_release.json_file.name).with_suffix(".cbor"))
+        if not cur_release.json_file.storage.exists(cbor_name):
+            cur_release.json_file_outdated = True
+            cur_release.save(update_fields=["json_file_outdated"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("browse", "0016_attachment_checksums"),
+    ]
+
+    operations = [
+        migrations.RunPython(flag_dumps_without_cbor, migrations.RunPython.noop),
+    ]
@@ -26,31 +26,62 @@ in the database:
 
 """
 import mimetypes
-from collections import namedtuple, OrderedDict
-from dataclasses import dataclass
+from collections import namedtuple, Counter, OrderedDict, defaultdict
+from collections.abc import Iterator
+from dataclasses import dataclass, field, replace
 from enum import Enum
+import datetime
+import errno
+import gzip
+import hashlib
+import io
 import logging
+import os
 from pathlib import Path
 import re
+import shutil
+import sys
+import threading
+import time
 from tempfile import TemporaryDirectory
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
 
 import uuid
-from typing import Optional
+from typing import Dict, List, Optional, Set, Tuple
 
+import cbor2
+import django
 import git
 import json
 import yaml
 from django.core.exceptions import ValidationError
 from django.core.files import File
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import Value
+from django.db.models.functions import Concat, Substr
 from django.utils import timezone
 from mptt.models import MPTTModel, TreeForeignKey
 
 from instrumentdb import __version__
+from browse.snapshot import save_snapshot
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 # This is used to validate entity/quantity names, which are used in URLs
 QUANTITY_NAME_REGEXP = re.compile(r"[-a-zA-Z0-9@:%._\+~#=]{1,256}")
 
+# Maximum length of the materialized paths of entities and quantities
+PATH_MAX_LENGTH = 4096
+
 
 FileType = namedtuple(
     "ImageFileType",
@@ -204,13 +235,63 @@ class Entity(MPTTModel):
     parent = TreeForeignKey(
         "self", on_delete=models.CASCADE, null=True, blank=True, related_name="children"
     )
+    # Names of all the ancestors and of the entity itself, joined by "/":
+    # this is the path used in the `/tree/` URLs. It is kept up to date by
+    # `save()` and is rebuilt by `rebuild_paths()` after bulk operations
+    path = models.CharField(
+        max_length=PATH_MAX_LENGTH,
+        default="",
+        editable=False,
+        db_index=True,
+        help_text="Full path of the entity, e.g., satellite/LFT",
+    )
 
     def __str__(self):
         return self.name
 
+    def build_path(self) -> str:
+        "Return the path of the entity, using the path saved in its parent"
+        if self.parent is None:
+            return self.name
+
+        return f"{self.parent.path}/{self.name}"
+
+    def save(self, *args, **kwargs):
+        old_path = None
+        if not self._state.adding:
+            # Read the path from the database, as the one in this object
+            # might be outdated if an ancestor has been modified
+            old_path = (
+                Entity.objects.filter(pk=self.pk).values_list("path", flat=True).first()
+            )
+
+        self.path = self.build_path()
+        super().save(*args, **kwargs)
+
+        if old_path is not None and old_path != self.path:
+            # The entity has been renamed or moved: replace the old prefix
+            # in the paths of its descendants and of their quantities
+            new_path = Concat(
+                Value(self.path),
+                Substr("path", len(old_path) + 1),
+                output_field=models.CharField(),
+            )
+            self.get_descendants().update(path=new_path)
+            Quantity.objects.filter(
+                parent_entity__in=self.get_descendants(include_self=True)
+            ).update(path=new_path)
+            mark_release_path_indexes_outdated(
+                data_files__quantity__parent_entity__in=self.get_descendants(
+                    include_self=True
+                )
+            )
+
     class Meta:
         ordering = ("name",)
         verbose_name_plural = "entities"
+        # Used by `browse.pagination.KeysetPagination`, which appends
+        # the primary key to the ordering
+        indexes = [models.Index(fields=["name", "uuid"], name="entity_keyset_idx")]
 
 
 def format_spec_directory_path(instance, filename):
@@ -231,6 +312,24 @@ def format_spec_directory_path(instance, filename):
     return Path("format_spec") / f"{instance.uuid}_{true_file_name}"
 
 
+def update_file_checksum(instance, field_name: str) -> None:
+    """Update the SHA-256 checksum of the file in the field `field_name`
+
+    The checksum is kept in the field ``<field_name>_sha256`` and it is
+    computed only when a new file has been assigned to the field, just
+    before it is written into the storage.
+    """
+
+    field_file = getattr(instance, field_name)
+    if not field_file:
+        setattr(instance, f"{field_name}_sha256", "")
+    elif not field_file._committed:
+        checksum = hashlib.sha256()
+        for chunk in field_file.file.chunks():
+            checksum.update(chunk)
+        setattr(instance, f"{field_name}_sha256", checksum.hexdigest())
+
+
 class FormatSpecification(models.Model):
     uuid = models.UUIDField(
         primary_key=True, unique=True, default=uuid.uuid4, editable=False
@@ -275,6 +374,15 @@ class FormatSpecification(models.Model):
         max_length=256,
         help_text="This specifies the MIME type of the data file",
     )
+    doc_file_sha256 = models.CharField(
+        "SHA-256 checksum of the specification document",
+        max_length=64,
+        blank=True,
+        default="",
+        editable=False,
+        help_text="SHA-256 checksum of the specification document (empty if "
+        + "unknown)",
+    )
 
     def __str__(self):
         if self.title:
@@ -289,6 +397,10 @@ class FormatSpecification(models.Model):
         else:
             return self.document_ref + mimetypes.guess_extension(self.doc_mime_type)
 
+    def save(self, *args, **kwargs):
+        update_file_checksum(self, "doc_file")
+        super().save(*args, **kwargs)
+
 
 class Quantity(models.Model):
     uuid = models.UUIDField(
@@ -312,22 +424,85 @@ class Quantity(models.Model):
         related_name="quantities",
         help_text="Entity to whom this quantity is related",
     )
+    # Path of the parent entity followed by the name of the quantity,
+    # e.g., satellite/LFT/cad; see `Entity.path`
+    path = models.CharField(
+        max_length=PATH_MAX_LENGTH,
+        default="",
+        editable=False,
+        db_index=True,
+        help_text="Full path of the quantity, e.g., satellite/LFT/cad",
+    )
 
     def __str__(self):
         return f"{self.name} ({self.uuid.hex[0:8]})"
 
+    def save(self, *args, **kwargs):
+        # A new quantity has no data files yet
+        path_changed = not self._state.adding and (
+            self.path != f"{self.parent_entity.path}/{self.name}"
+        )
+        self.path = f"{self.parent_entity.path}/{self.name}"
+        super().save(*args, **kwargs)
+
+        if path_changed:
+            mark_release_path_indexes_outdated(data_files__quantity=self)
+
     class Meta:
         verbose_name_plural = "quantities"
         ordering = (
             "name",
             "uuid",
         )
+        indexes = [models.Index(fields=["name", "uuid"], name="quantity_keyset_idx")]
 
     @property
     def full_path(self):
-        entity = self.parent_entity
-        ancestors = entity.get_ancestors(include_self=True)
-        return "/".join([x.name for x in ancestors]) + "/" + self.name
+        return self.path
+
+
+def rebuild_paths(batch_size=1000) -> None:
+    """Recompute the paths of all the entities and quantities
+
+    This must be called after entities or quantities have been written
+    using bulk operations, which bypass ``save()``. Only the paths that
+    have changed are written to the database.
+    """
+
+    entity_paths = {}  # type: Dict[uuid.UUID, str]
+    to_update = []
+
+    # Parents always come before their children in this ordering
+    for cur_entity in Entity.objects.order_by("tree_id", "lft").only(
+        "uuid", "parent_id", "name", "path"
+    ):
+        if cur_entity.parent_id is None:
+            cur_path = cur_entity.name
+        else:
+            cur_path = f"{entity_paths[cur_entity.parent_id]}/{cur_entity.name}"
+
+        entity_paths[cur_entity.uuid] = cur_path
+        if cur_entity.path != cur_path:
+            cur_entity.path = cur_path
+            to_update.append(cur_entity)
+
+    Entity.objects.bulk_update(to_update, ["path"], batch_size=batch_size)
+
+    to_update = []
+    for cur_quantity in Quantity.objects.only(
+        "uuid", "parent_entity_id", "name", "path"
+    ):
+        cur_path = f"{entity_paths[cur_quantity.parent_entity_id]}/{cur_quantity.name}"
+        if cur_quantity.path != cur_path:
+            cur_quantity.path = cur_path
+            to_update.append(cur_quantity)
+
+    Quantity.objects.bulk_update(to_update, ["path"], batch_size=batch_size)
+
+    # Releases are few, and listing the quantities that changed might
+    # produce a query too large for the database
+    if to_update:
+        mark_release_path_indexes_outdated()
 
 
 def data_file_directory_path(instance, filename):
@@ -426,9 +601,31 @@ class DataFile(models.Model):
 
     comment = models.TextField(max_length=4096, blank=True, help_text="Free-form notes")
 
+    file_data_sha256 = models.CharField(
+        "SHA-256 checksum of the file",
+        max_length=64,
+        blank=True,
+        default="",
+        editable=False,
+        help_text="SHA-256 checksum of the file contents (empty if unknown)",
+    )
+    plot_file_sha256 = models.CharField(
+        "SHA-256 checksum of the image",
+        max_length=64,
+        blank=True,
+        default="",
+        editable=False,
+        help_text="SHA-256 checksum of the image (empty if unknown)",
+    )
+
     def __str__(self):
         return f"{self.name} ({self.uuid.hex[0:8]})"
 
+    def save(self, *args, **kwargs):
+        update_file_checksum(self, "file_data")
+        update_file_checksum(self, "plot_file")
+        super().save(*args, **kwargs)
+
     class Meta:
         # When querying *all* the DataFile objects in a database, the
         # (inverse) order by upload date will not be very meaningful… But
@@ -440,18 +637,17 @@ class DataFile(models.Model):
             "name",
             "uuid",
         )
+        # The columns match `ordering`, so that pages of data files can be
+        # read with a range scan (see `browse.pagination`)
+        indexes = [
+            models.Index(
+                fields=["-upload_date", "name", "uuid"], name="datafile_keyset_idx"
+            )
+        ]
 
     @property
     def full_path(self):
-        entity = self.quantity.parent_entity
-        ancestors = entity.get_ancestors(include_self=True)
-        return (
-            "/".join([x.name for x in ancestors])
-            + "/"
-            + self.quantity.name
-            + "/"
-            + self.name
-        )
+        return f"{self.quantity.path}/{self.name}"
 
 
 class Release(models.Model):
@@ -497,35 +693,78 @@ class Release(models.Model):
         help_text="A JSON dump of the release, ready to be downloaded",
     )
 
-    def save(self, *args, **kwargs):
-        result = super().save(*args, **kwargs)
+    json_file_outdated = models.BooleanField(
+        default=True,
+        editable=False,
+        help_text="True if the release or its data files have changed since "
+        + "the JSON dump was created",
+    )
 
-        if bool(self.json_file):
-            # The JSON dump already exists
-            return
+    # The dump is always saved with the same name, so this is used to
+    # tell whether the copy of a client is up to date
+    json_file_date = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Date when the JSON dump was created",
+    )
 
-        with TemporaryDirectory() as tempdir:
-            temp_path = Path(tempdir)
-            json_file_path = dump_db_to_json(
-                ReleaseDumpConfiguration(
-                    no_attachments=True,
-                    only_tree=False,
-                    exist_ok=True,
-                    skip_empty_quantities=False,
-                    skip_empty_entities=False,
-                    output_format=DumpOutputFormat.JSON,
-                    output_folder=temp_path,
-                ),
-                release_tag=str(self.tag),
-            )
+    path_index_outdated = models.BooleanField(
+        default=True,
+        editable=False,
+        help_text="True if the data files of the release or their paths have "
+        + "changed since the path index was built",
+    )
 
-            with json_file_path.open("rt") as json_file:
-                self.json_file.save(
-                    name=f"schema_{self.tag}.json",
-                    content=File(json_file),
-                )
+    def save(self, *args, **kwargs):
+        # Any change to the release makes the JSON dump outdated, unless it
+        # is the dump itself that is being saved. The dump is rebuilt lazily
+        # (see `update_release_file_dumps`). The same applies to the path
+        # index: flagging it here prevents a stale copy of the release from
+        # overwriting a flag set by `mark_release_path_indexes_outdated`
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or set(update_fields) - {
+            "json_file",
+            "json_file_date",
+            "json_file_outdated",
+        }:
+            self.json_file_outdated = True
+            self.path_index_outdated = True
+
+        return super().save(*args, **kwargs)
+
+
+class ReleasePathIndex(models.Model):
+    """Associate the path of each quantity in a release with its data file
+
+    This table is used to answer requests like
+    ``/releases/v1.0/satellite/LFT/cad`` with one indexed lookup. The rows
+    of a release are rebuilt by :func:`update_release_path_index` once the
+    release has been flagged as outdated (see
+    :func:`mark_release_path_indexes_outdated`).
+    """
 
-        return result
+    release = models.ForeignKey(
+        Release,
+        on_delete=models.CASCADE,
+        related_name="path_index",
+        # The unique index on (release, path, data_file) can be used in
+        # place of this one
+        db_index=False,
+    )
+    path = models.CharField(max_length=PATH_MAX_LENGTH)
+    data_file = models.ForeignKey(DataFile, on_delete=models.CASCADE, related_name="+")
+
+    class Meta:
+        verbose_name_plural = "release path indexes"
+        # A release can contain more than one data file with the same path
+        # (lookups report this as an error), but never the same data file
+        # twice
+        constraints = [
+            models.UniqueConstraint(
+                fields=["release", "path", "data_file"], name="release_path_uniq"
+            ),
+        ]
 
 
 ############################################################################
@@ -534,6 +773,10 @@ class Release(models.Model):
 class DumpOutputFormat(Enum):
     JSON = 1
     YAML = 2
+    # Binary format (RFC 8949), see `_stream_cbor`
+    CBOR = 3
+    # Standalone SQLite database, see `browse.snapshot`
+    SQLITE = 4
 
 
 @dataclass
@@ -545,12 +788,26 @@ class ReleaseDumpConfiguration:
     skip_empty_quantities: bool
     output_format: DumpOutputFormat
     output_folder: Path
+    # Number of threads used to copy attachments in parallel
+    num_of_copy_threads: int = 1
+    # If true, attachments are hard-linked to the files in the storage
+    # instead of being copied, whenever this is possible. Note that
+    # in this case modifying an exported file modifies the database!
+    hard_link_attachments: bool = False
+    # This is set by `dump_db_to_json` while the dump is in progress
+    attachment_copier: Optional["AttachmentCopier"] = field(
+        default=None, init=False, repr=False, compare=False
+    )
 
 
 # File dump is done in chunks; this variable specifies the
 # size of one chunk (in bytes)
 COPY_CHUNK_SIZE = 1024 * 1024
 
+# Number of rows fetched at a time from the database when dumping
+# data files, so that memory usage does not depend on their number
+DUMP_QUERY_CHUNK_SIZE = 2000
+
 # This is used as a wrapper to strings that must be quoted in YAML
 # output. Consider the following code:
 #
@@ -575,7 +832,12 @@ COPY_CHUNK_SIZE = 1024 * 1024
 
 
 class Quoted(str):
-    pass
+    def __new__(cls, value):
+        result = super().__new__(cls, value)
+        # Keep the original object, so that binary formats can encode
+        # UUIDs and dates natively (see `_cbor_native_value`)
+        result.value = value
+        return result
 
 
 # Taken from
@@ -600,7 +862,424 @@ def yaml_saner_dump(data, stream=None, Dumper=yaml.Dumper, **kwds):
     return yaml.dump(data, stream, OrderedDumper, **kwds)
 
 
-def save_attachment(configuration: ReleaseDumpConfiguration, relative_path, file_data):
+# This is the number of the ioctl used on Linux to ask the filesystem
+# to share the blocks of a file with another one (copy-on-write)
+FICLONE = 0x40049409
+
+# Errors raised by the system calls below when the two files cannot
+# be handled by them (e.g., they are on different filesystems)
+_UNSUPPORTED_COPY_ERRORS = (
+    errno.EXDEV,
+    errno.EINVAL,
+    errno.ENOSYS,
+    errno.ENOTSUP,
+    errno.EOPNOTSUPP,
+    errno.EBADF,
+    errno.ENOTTY,
+    errno.EPERM,
+)
+
+
+def _copy_with_system_call(inpf, outf, system_call) -> bool:
+    """Copy `inpf` into `outf` using `system_call(in_fd, out_fd, offset, count)`
+
+    Return ``False`` if the system call cannot handle these files; in
+    this case, both files are rewound and `outf` is truncated.
+    """
+
+    size = os.fstat(inpf.fileno()).st_size
+    offset = 0
+    try:
+        while offset < size:
+            num_of_bytes = system_call(
+                inpf.fileno(), outf.fileno(), offset, size - offset
+            )
+            if num_of_bytes == 0:
+                break
+            offset += num_of_bytes
+    except OSError as err:
+        if err.errno not in _UNSUPPORTED_COPY_ERRORS:
+            raise
+        offset = -1
+
+    if offset == size:
+        return True
+
+    inpf.seek(0)
+    outf.seek(0)
+    outf.truncate()
+    return False
+
+
+def _copy_file_contents(inpf, outf, checksum=None) -> bool:
+    """Copy the contents of file `inpf` into `outf` without going through Python
+
+    The function tries to clone the file (reflink), then to use
+    ``copy_file_range`` and ``sendfile``, so that the data does not
+    need to be moved to user space. If none of them is supported,
+    it falls back to a copy in chunks of `COPY_CHUNK_SIZE` bytes.
+
+    Return ``True`` if the fallback was used: in this case, `checksum`
+    (a :mod:`hashlib` object, if not ``None``) has been updated with the
+    contents of the file.
+    """
+
+    system_calls = []
+    if sys.platform.startswith("linux"):
+        import fcntl
+
+        try:
+            fcntl.ioctl(outf.fileno(), FICLONE, inpf.fileno())
+            return False
+        except OSError as err:
+            if err.errno not in _UNSUPPORTED_COPY_ERRORS:
+                raise
+
+        system_calls.append(
+            lambda in_fd, out_fd, offset, count: os.copy_file_range(
+                in_fd, out_fd, count, offset, offset
+            )
+        )
+        system_calls.append(
+            lambda in_fd, out_fd, offset, count: os.sendfile(
+                out_fd, in_fd, offset, count
+            )
+        )
+
+    for cur_system_call in system_calls:
+        if _copy_with_system_call(inpf, outf, cur_system_call):
+            return False
+
+    while True:
+        data = inpf.read(COPY_CHUNK_SIZE)
+        if not data:  # end of file reached
+            break
+        outf.write(data)
+        if checksum is not None:
+            checksum.update(data)
+
+    return True
+
+
+# Result of `copy_field_file`. The field `sha256` is empty if the
+# checksum was not requested or if the file was not copied through
+# memory (e.g., it was cloned or hard-linked)
+CopiedFile = namedtuple("CopiedFile", ["hard_link", "sha256"])
+
+
+def copy_field_file(
+    file_data, dest_path: Path, hard_link: bool = False, compute_sha256: bool = False
+) -> CopiedFile:
+    """Copy the file referenced by a ``FileField`` into `dest_path`
+
+    If the storage keeps the file in the local filesystem, the
+    function uses the fastest method available to copy it; otherwise,
+    it reads the file from the storage in chunks.
+
+    If `compute_sha256` is ``True``, the SHA-256 checksum is computed
+    while the file is being copied, but only if its contents pass
+    through memory anyway: zero-copy methods are never given up to
+    compute it.
+    """
+
+    checksum = hashlib.sha256() if compute_sha256 else None
+
+    # Never write into an existing file: if it was hard-linked by a
+    # previous export, we would overwrite the file in the storage!
+    dest_path.unlink(missing_ok=True)
+
+    try:
+        source_path = Path(file_data.path)
+    except NotImplementedError:
+        # The storage is not on the local filesystem
+        source_path = None
+
+    if source_path is None:
+        with file_data.storage.open(file_data.name, "rb") as inpf, dest_path.open(
+            "wb"
+        ) as outf:
+            while True:
+                data = inpf.read(COPY_CHUNK_SIZE)
+                if not data:  # end of file reached
+                    break
+                outf.write(data)
+                if checksum is not None:
+                    checksum.update(data)
+
+        return CopiedFile(
+            hard_link=False, sha256=checksum.hexdigest() if checksum else ""
+        )
+
+    if hard_link:
+        try:
+            os.link(source_path, dest_path)
+            return CopiedFile(hard_link=True, sha256="")
+        except OSError as err:
+            logging.info(
+                "unable to create a hard link to '%s' (%s), copying it",
+                source_path,
+                err,
+            )
+
+    with source_path.open("rb") as inpf, dest_path.open("wb") as outf:
+        hashed = _copy_file_contents(inpf, outf, checksum)
+
+    # Preserve the modification time, like `cp -p` does
+    source_stat = source_path.stat()
+    os.utime(dest_path, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns))
+
+    return CopiedFile(
+        hard_link=False, sha256=checksum.hexdigest() if (checksum and hashed) else ""
+    )
+
+
+def field_file_stat(file_data) -> Tuple[int, Optional[float]]:
+    """Return the size and the modification time of a file in the storage
+
+    The modification time is ``None`` if the storage does not support it.
+    """
+
+    try:
+        source_stat = os.stat(file_data.path)
+        return source_stat.st_size, source_stat.st_mtime
+    except NotImplementedError:
+        pass
+
+    size = file_data.storage.size(file_data.name)
+    try:
+        mtime = file_data.storage.get_modified_time(file_data.name).timestamp()
+    except NotImplementedError:
+        mtime = None
+
+    return size, mtime
+
+
+def file_sha256(path: Path) -> str:
+    """Return the SHA-256 checksum of a file as a hexadecimal string"""
+
+    checksum = hashlib.sha256()
+    with path.open("rb") as inpf:
+        while True:
+            data = inpf.read(COPY_CHUNK_SIZE)
+            if not data:  # end of file reached
+                break
+            checksum.update(data)
+
+    return checksum.hexdigest()
+
+
+# Name of the file listing the attachments saved by `dump_db_to_json`
+MANIFEST_FILE_NAME = "manifest.json"
+
+
+class AttachmentManifest:
+    """List of the attachments saved in an output folder
+
+    For every attachment saved by :func:`dump_db_to_json`, the manifest
+    records its size, its modification time (which is the same as the
+    file in the storage), its SHA-256 checksum, and whether it is a hard
+    link to the file in the storage. When the database is
+    exported again in the same folder, attachments whose size and
+    modification time did not change are not copied again, and
+    attachments that are no longer part of the export are deleted.
+    """
+
+    def __init__(self, output_folder: Path):
+        self.output_folder = output_folder
+        self.path = output_folder / MANIFEST_FILE_NAME
+        self.lock = threading.Lock()
+        self.new_entries = {}
+        self.num_of_copied_files = 0
+
+        try:
+            with self.path.open("rt") as inpf:
+                self.old_entries = json.load(inpf).get("files", {})
+        except FileNotFoundError:
+            self.old_entries = {}
+
+    def _key(self, dest_path: Path) -> str:
+        return dest_path.relative_to(self.output_folder).as_posix()
+
+    def is_up_to_date(
+        self, dest_path: Path, size: int, mtime: Optional[float], hard_link: bool
+    ):
+        entry = self.old_entries.get(self._key(dest_path))
+        if (not entry) or (mtime is None):
+            return False
+
+        # A hard link must be replaced by a copy if it is no longer
+        # wanted. (The opposite is not needed: a copy is always safe.)
+        if entry.get("hard_link", False) and not hard_link:
+            return False
+
+        try:
+            dest_size = dest_path.stat().st_size
+        except FileNotFoundError:
+            return False
+
+        return entry["size"] == size and entry["mtime"] == mtime and dest_size == size
+
+    def keep(self, dest_path: Path) -> None:
+        key = self._key(dest_path)
+        with self.lock:
+            self.new_entries[key] = self.old_entries[key]
+
+    def record(
+        self,
+        dest_path: Path,
+        size: int,
+        mtime: Optional[float],
+        checksum: str,
+        hard_link: bool,
+    ) -> None:
+        with self.lock:
+            self.new_entries[self._key(dest_path)] = OrderedDict(
+                [
+                    ("size", size),
+                    ("mtime", mtime),
+                    ("sha256", checksum),
+                    ("hard_link", hard_link),
+                ]
+            )
+            self.num_of_copied_files += 1
+
+    def remove_stale_files(self) -> List[str]:
+        """Delete the files listed in the old manifest that were not exported again
+
+        Return the list of the files that have been deleted.
+        """
+
+        result = []
+        for cur_key in sorted(set(self.old_entries) - set(self.new_entries)):
+            (self.output_folder / cur_key).unlink(missing_ok=True)
+            result.append(cur_key)
+
+        return result
+
+    def save(self) -> None:
+        temp_path = self.path.with_name(self.path.name + ".tmp")
+        with temp_path.open("wt") as outf:
+            json.dump(
+                OrderedDict(
+                    [
+                        ("version", 1),
+                        ("files", OrderedDict(sorted(self.new_entries.items()))),
+                    ]
+                ),
+                outf,
+                indent=2,
+            )
+
+        # This is atomic, so that an interrupted export never leaves a
+        # truncated manifest behind
+        os.replace(temp_path, self.path)
+
+
+class AttachmentCopier:
+    """Copy attachments on a pool of threads
+
+    Copies are queued by calling :meth:`copy`; if there are too many
+    pending copies, the method waits for some of them to complete, so
+    that the queue does not grow without limits. Use this class as a
+    context manager: all the copies are completed (and errors are
+    raised) when the ``with`` block ends.
+    """
+
+    def __init__(
+        self,
+        num_of_threads: int = 1,
+        hard_links: bool = False,
+        manifest: Optional[AttachmentManifest] = None,
+    ):
+        self.num_of_threads = max(1, num_of_threads)
+        self.hard_links = hard_links
+        self.manifest = manifest
+        self.pending = set()
+        self.executor = (
+            ThreadPoolExecutor(
+                max_workers=self.num_of_threads, thread_name_prefix="attachment-copy"
+            )
+            if self.num_of_threads > 1
+            else None
+        )
+
+    def _copy(self, file_data, dest_path: Path, sha256: str) -> None:
+        if self.manifest is None:
+            copy_field_file(file_data, dest_path, hard_link=self.hard_links)
+            return
+
+        size, mtime = field_file_stat(file_data)
+        if self.manifest.is_up_to_date(
+            dest_path, size=size, mtime=mtime, hard_link=self.hard_links
+        ):
+            self.manifest.keep(dest_path)
+            return
+
+        # Reading the copy again just to compute its checksum would
+        # double the I/O: use the one saved in the database, if known
+        copied_file = copy_field_file(
+            file_data,
+            dest_path,
+            hard_link=self.hard_links,
+            compute_sha256=not sha256,
+        )
+        self.manifest.record(
+            dest_path,
+            size=size,
+            mtime=mtime,
+            checksum=sha256 or copied_file.sha256,
+            hard_link=copied_file.hard_link,
+        )
+
+    def copy(self, file_data, dest_path: Path, sha256: str = "") -> None:
+        """Copy `file_data` into `dest_path`
+
+        If the SHA-256 checksum of the file is known, pass it in
+        `sha256`, so that it is recorded in the manifest.
+        """
+
+        dest_path.parent.mkdir(parents=True, exist_ok=True)
+
+        if self.executor is None:
+            self._copy(file_data, dest_path, sha256)
+            return
+
+        self.pending.add(self.executor.submit(self._copy, file_data, dest_path, sha256))
+
+        if len(self.pending) >= 4 * self.num_of_threads:
+            done, self.pending = wait(self.pending, return_when=FIRST_COMPLETED)
+            for cur_future in done:
+                cur_future.result()
+
+    def wait(self) -> None:
+        """Wait for all the pending copies to complete"""
+
+        done, _ = wait(self.pending)
+        self.pending = set()
+        for cur_future in done:
+            # This raises the exception, if the copy failed
+            cur_future.result()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.executor is None:
+            return
+
+        try:
+            if exc_type is None:
+                self.wait()
+            else:
+                for cur_future in self.pending:
+                    cur_future.cancel()
+        finally:
+            self.executor.shutdown(wait=True)
+
+
+def save_attachment(
+    configuration: ReleaseDumpConfiguration, relative_path, file_data, sha256: str = ""
+):
     """Save a file into the specified path under the output folder
 
     This function is used to save specification documents, data
@@ -608,32 +1287,163 @@ def save_attachment(configuration: ReleaseDumpConfiguration, relative_path, file
 
     The parameter "relative_path" specifies the sub-folder *and*
     file name, which is considered relative to self.output_folder
-    (set within Command.handle).
-
+    (set within Command.handle). The SHA-256 checksum of the file can be
+    passed in `sha256`, if it is known.
+
+    If `dump_db_to_json` is running, the copy is queued in the pool of
+    threads of its :class:`AttachmentCopier` and might be still in
+    progress when the function returns. (Any object with a ``copy``
+    method accepting the same arguments as :meth:`AttachmentCopier.copy`
+    can be used in place of it, see e.g. :mod:`browse.archive`.)
     """
     abs_path = configuration.output_folder / relative_path
-    abs_path.parent.mkdir(parents=True, exist_ok=True)
 
-    with file_data.open("rb") as inpf, abs_path.open("wb") as outf:
-        while True:
-            data = inpf.read(COPY_CHUNK_SIZE)
-            if not data:  # end of file reached
-                break
-            outf.write(data)
+    if configuration.attachment_copier is not None:
+        configuration.attachment_copier.copy(file_data, abs_path, sha256)
+    else:
+        abs_path.parent.mkdir(parents=True, exist_ok=True)
+        copy_field_file(
+            file_data, abs_path, hard_link=configuration.hard_link_attachments
+        )
+
 
+@dataclass
+class DumpIndex:
+    """In-memory copy of the tables needed to dump the database
+
+    Following the relationships between objects while dumping the
+    database (e.g., calling ``Entity.get_children()`` or
+    ``DataFile.dependencies.all()``) costs one or more queries per
+    object. Instead, :func:`build_dump_index` loads every table once
+    and keeps the relationships in dictionaries indexed by UUID, so
+    that the number of queries does not depend on the size of the
+    database.
+    """
 
-def dump_entity_tree(configuration: ReleaseDumpConfiguration, entities, data_files):
+    # Key: UUID of the parent entity (``None`` for root nodes)
+    entity_children: Dict[Optional[uuid.UUID], List[Entity]]
+    format_specs: List[FormatSpecification]
+    quantities: List[Quantity]
+    # This is a lazy queryset: data files are read from the database in
+    # chunks while they are being written, as they can be very many
+    data_files: models.QuerySet
+    # Number of data files in `data_files` belonging to each quantity/entity
+    data_files_per_quantity: Dict[uuid.UUID, int]
+    data_files_per_entity: Dict[uuid.UUID, int]
+    # Key: UUID of a data file, value: list of UUIDs of its dependencies
+    dependencies: Dict[uuid.UUID, List[uuid.UUID]]
+    releases: List[Release]
+    # Key: release tag, value: list of UUIDs of the data files in the release
+    release_members: Dict[str, List[uuid.UUID]]
+
+
+# This is the ordering used by `DataFile.Meta`, applied to the data
+# file on the "far" side of a many-to-many through table
+def _data_file_ordering(field_name: str) -> List[str]:
     result = []
+    for cur_field in DataFile._meta.ordering:
+        if cur_field.startswith("-"):
+            result.append(f"-{field_name}__{cur_field[1:]}")
+        else:
+            result.append(f"{field_name}__{cur_field}")
+
+    return result
+
+
+def build_dump_index(release_tag: Optional[str] = None) -> DumpIndex:
+    """Load all the objects to be dumped into a :class:`DumpIndex`
+
+    If `release_tag` is ``None``, all the data files and releases are
+    included, otherwise only the data files belonging to the release
+    (and the release itself). Entities, quantities, and format
+    specifications are always loaded in full.
+    """
+
+    dependency_links = DataFile.dependencies.through.objects.all()
+    release_links = DataFile.release_tags.through.objects.all()
+
+    if release_tag:
+        releases = [Release.objects.get(tag=release_tag)]
+        data_files = DataFile.objects.filter(release_tags__tag=release_tag)
+        dependency_links = dependency_links.filter(
+            from_datafile__release_tags__tag=release_tag
+        )
+        release_links = release_links.filter(release_id=release_tag)
+    else:
+        # If no release is specified, return *everything*
+        releases = list(Release.objects.all())
+        data_files = DataFile.objects.all()
+
+    # The default manager of MPTT models sorts entities by (tree_id,
+    # lft), which is the same order used by `root_nodes()` and
+    # `get_children()`
+    entity_children = defaultdict(list)
+    for cur_entity in Entity.objects.all():
+        entity_children[cur_entity.parent_id].append(cur_entity)
+
+    quantities = list(Quantity.objects.all())
+
+    # Let the database count the data files, so that we get one row per
+    # quantity/entity instead of one per data file. The call to
+    # `order_by` clears the default ordering, which would otherwise be
+    # added to the GROUP BY clause
+    data_files_per_quantity = Counter(
+        dict(
+            data_files.order_by()
+            .values("quantity_id")
+            .annotate(num_of_files=models.Count("uuid"))
+            .values_list("quantity_id", "num_of_files")
+        )
+    )
+    data_files_per_entity = Counter(
+        dict(
+            data_files.order_by()
+            .values("quantity__parent_entity_id")
+            .annotate(num_of_files=models.Count("uuid"))
+            .values_list("quantity__parent_entity_id", "num_of_files")
+        )
+    )
+
+    # Sorting the links like `DataFile.Meta.ordering` produces lists
+    # in the same order as `DataFile.dependencies.all()` and
+    # `Release.data_files.all()`
+    dependencies = defaultdict(list)
+    for from_uuid, to_uuid in dependency_links.order_by(
+        *_data_file_ordering("to_datafile")
+    ).values_list("from_datafile_id", "to_datafile_id"):
+        dependencies[from_uuid].append(to_uuid)
+
+    release_members = defaultdict(list)
+    for cur_tag, cur_uuid in release_links.order_by(
+        *_data_file_ordering("datafile")
+    ).values_list("release_id", "datafile_id"):
+        release_members[cur_tag].append(cur_uuid)
+
+    return DumpIndex(
+        entity_children=entity_children,
+        format_specs=list(FormatSpecification.objects.all()),
+        quantities=quantities,
+        data_files=data_files,
+        data_files_per_quantity=data_files_per_quantity,
+        data_files_per_entity=data_files_per_entity,
+        dependencies=dependencies,
+        releases=releases,
+        release_members=release_members,
+    )
+
+
+def dump_entity_tree(
+    configuration: ReleaseDumpConfiguration, index: DumpIndex, entities
+):
     for cur_entity in entities:
-        if configuration.skip_empty_entities:
-            quantities = Quantity.objects.filter(parent_entity=cur_entity)
-            num_of_data_files = 0
-            for cur_quantity in quantities:
-                num_of_data_files += len(
-                    cur_quantity.data_files.filter(uuid__in=data_files.all())
-                )
+        children = index.entity_children.get(cur_entity.uuid, [])
 
-            if not cur_entity.get_children() and num_of_data_files == 0:
+        if configuration.skip_empty_entities:
+            # In a MPTT tree, leaf nodes have rght == lft + 1
+            if (
+                cur_entity.is_leaf_node()
+                and index.data_files_per_entity[cur_entity.uuid] == 0
+            ):
                 logging.info(
                     f"Skipping {cur_entity.name} as it has no children nor quantities"
                 )
@@ -647,20 +1457,16 @@ def dump_entity_tree(configuration: ReleaseDumpConfiguration, entities, data_fil
         )
 
         # Add the "children" key at the bottom of the list of keys
-        children = cur_entity.get_children()
         if children:
             # Descend the tree recursively
-            new_element["children"] = dump_entity_tree(
-                configuration, children, data_files
+            new_element["children"] = list(
+                dump_entity_tree(configuration, index, children)
             )
 
-        result.append(new_element)
-
-    return result
+        yield new_element
 
 
 def dump_specifications(configuration: ReleaseDumpConfiguration, specs):
-    result = []
     for cur_spec in specs:
         cur_entry = OrderedDict(
             [
@@ -679,18 +1485,21 @@ def dump_specifications(configuration: ReleaseDumpConfiguration, specs):
             )
             cur_entry["file_path"] = Quoted(dest_path)
 
-            save_attachment(configuration, dest_path, cur_spec.doc_file)
+            save_attachment(
+                configuration,
+                dest_path,
+                cur_spec.doc_file,
+                sha256=cur_spec.doc_file_sha256,
+            )
 
-        result.append(cur_entry)
+        yield cur_entry
 
-    return result
 
-
-def dump_quantities(configuration: ReleaseDumpConfiguration, quantities, data_files):
-    result = []
-    for cur_quantity in quantities:
-        if configuration.skip_empty_quantities and (
-            len(cur_quantity.data_files.filter(uuid__in=data_files.all())) < 1
+def dump_quantities(configuration: ReleaseDumpConfiguration, index: DumpIndex):
+    for cur_quantity in index.quantities:
+        if (
+            configuration.skip_empty_quantities
+            and index.data_files_per_quantity[cur_quantity.uuid] < 1
         ):
             # This quantity has no data files
             logging.info(
@@ -702,25 +1511,22 @@ def dump_quantities(configuration: ReleaseDumpConfiguration, quantities, data_fi
             [
                 ("uuid", Quoted(cur_quantity.uuid)),
                 ("name", Quoted(cur_quantity.name)),
-                ("format_spec", Quoted(cur_quantity.format_spec.uuid)),
-                ("entity", Quoted(cur_quantity.parent_entity.uuid)),
+                ("format_spec", Quoted(cur_quantity.format_spec_id)),
+                ("entity", Quoted(cur_quantity.parent_entity_id)),
             ]
         )
 
-        result.append(cur_entry)
-
-    return result
+        yield cur_entry
 
 
-def dump_data_files(configuration: ReleaseDumpConfiguration, data_files):
-    result = []
-    for cur_data_file in data_files:
+def dump_data_files(configuration: ReleaseDumpConfiguration, index: DumpIndex):
+    for cur_data_file in index.data_files.iterator(chunk_size=DUMP_QUERY_CHUNK_SIZE):
         cur_entry = OrderedDict(
             [
                 ("uuid", Quoted(cur_data_file.uuid)),
                 ("name", Quoted(cur_data_file.name)),
                 ("upload_date", Quoted(cur_data_file.upload_date)),
-                ("quantity", Quoted(cur_data_file.quantity.uuid)),
+                ("quantity", Quoted(cur_data_file.quantity_id)),
                 ("spec_version", Quoted(cur_data_file.spec_version)),
             ]
         )
@@ -734,27 +1540,33 @@ def dump_data_files(configuration: ReleaseDumpConfiguration, data_files):
             )
             cur_entry["file_name"] = Quoted(dest_path)
 
-            save_attachment(configuration, dest_path, cur_data_file.file_data)
+            save_attachment(
+                configuration,
+                dest_path,
+                cur_data_file.file_data,
+                sha256=cur_data_file.file_data_sha256,
+            )
 
         if cur_data_file.plot_file and (not configuration.no_attachments):
             dest_path = Path("plot_files") / full_plot_file_path(cur_data_file, "").name
             cur_entry["plot_file"] = Quoted(dest_path)
             cur_entry["plot_mime_type"] = Quoted(cur_data_file.plot_mime_type)
-            save_attachment(configuration, dest_path, cur_data_file.plot_file)
-
-        if cur_data_file.dependencies:
-            cur_entry["dependencies"] = [
-                Quoted(x.uuid) for x in cur_data_file.dependencies.all()
-            ]
+            save_attachment(
+                configuration,
+                dest_path,
+                cur_data_file.plot_file,
+                sha256=cur_data_file.plot_file_sha256,
+            )
 
-        result.append(cur_entry)
+        cur_entry["dependencies"] = [
+            Quoted(x) for x in index.dependencies.get(cur_data_file.uuid, [])
+        ]
 
-    return result
+        yield cur_entry
 
 
-def dump_releases(configuration: ReleaseDumpConfiguration, releases):
-    result = []
-    for cur_release in releases:
+def dump_releases(configuration: ReleaseDumpConfiguration, index: DumpIndex):
+    for cur_release in index.releases:
         cur_entry = OrderedDict(
             [
                 ("tag", Quoted(cur_release.tag)),
@@ -762,7 +1574,7 @@ def dump_releases(configuration: ReleaseDumpConfiguration, releases):
                 ("comment", Quoted(cur_release.comment)),
                 (
                     "data_files",
-                    [Quoted(x.uuid) for x in cur_release.data_files.all()],
+                    [Quoted(x) for x in index.release_members.get(cur_release.tag, [])],
                 ),
             ]
         )
@@ -785,50 +1597,369 @@ def dump_releases(configuration: ReleaseDumpConfiguration, releases):
             save_attachment(configuration, dest_path, cur_release.release_document)
             cur_entry["release_document"] = Quoted(dest_path)
 
-        result.append(cur_entry)
+        yield cur_entry
 
-    return result
 
+def _stream_json(value, level: int = 0):
+    """Yield the JSON representation of `value` one chunk at a time
+
+    Iterators within `value` (e.g., generators) are encoded as lists,
+    so that their elements never need to be all in memory at the same
+    time. The output is the same that ``json.dump(value, indent=2)``
+    would produce if the iterators were lists.
+    """
+
+    indent = "  " * (level + 1)
+
+    if isinstance(value, Iterator):
+        first = True
+        for cur_item in value:
+            yield ("[\n" if first else ",\n") + indent
+            yield from _stream_json(cur_item, level + 1)
+            first = False
+
+        yield "[]" if first else "\n" + "  " * level + "]"
+    elif isinstance(value, dict) and any(
+        isinstance(x, Iterator) for x in value.values()
+    ):
+        first = True
+        for cur_key, cur_value in value.items():
+            yield ("{\n" if first else ",\n") + indent + json.dumps(cur_key) + ": "
+            yield from _stream_json(cur_value, level + 1)
+            first = False
+
+        yield "\n" + "  " * level + "}"
+    else:
+        # Newlines within JSON strings are always escaped, so every
+        # newline here marks the beginning of a new indented line
+        yield json.dumps(value, indent=2).replace("\n", "\n" + "  " * level)
+
+
+def _stream_yaml(schema):
+    """Yield the YAML representation of `schema` one chunk at a time
+
+    Only iterators in the top-level mapping are streamed: each of their
+    elements is dumped separately and appended to the output.
+    """
+
+    for cur_key, cur_value in schema.items():
+        if not isinstance(cur_value, Iterator):
+            yield yaml_saner_dump(OrderedDict([(cur_key, cur_value)]))
+            continue
+
+        first = True
+        for cur_item in cur_value:
+            if first:
+                yield f"{cur_key}:\n"
+
+            yield yaml_saner_dump([cur_item])
+            first = False
+
+        if first:
+            yield yaml_saner_dump(OrderedDict([(cur_key, [])]))
+
+
+# Initial bytes of an indefinite-length array and of its end marker
+CBOR_INDEFINITE_ARRAY = b"\x9f"
+CBOR_BREAK = b"\xff"
+
+# Major type of CBOR maps (RFC 8949, section 3.1)
+CBOR_MAJOR_MAP = 5
+
+
+def _cbor_native_value(value):
+    """Replace UUIDs and dates wrapped in `Quoted` objects with the objects themselves
+
+    This is applied recursively to the elements of dictionaries and lists,
+    so that ``cbor2`` encodes them as native CBOR values (tags 37 and 1).
+    """
+
+    if isinstance(value, Quoted):
+        if isinstance(value.value, (uuid.UUID, datetime.datetime)):
+            return value.value
+
+        return str(value)
+    elif isinstance(value, dict):
+        return {
+            _cbor_native_value(k): _cbor_native_value(v) for (k, v) in value.items()
+        }
+    elif isinstance(value, (list, tuple)):
+        return [_cbor_native_value(x) for x in value]
+
+    return value
+
+
+def _cbor_dumps(value) -> bytes:
+    # Dates are saved as epoch-based timestamps; naive dates are assumed
+    # to be in UTC
+    return cbor2.dumps(
+        _cbor_native_value(value),
+        datetime_as_timestamp=True,
+        timezone=datetime.timezone.utc,
+    )
+
+
+def _cbor_map_head(length: int) -> bytes:
+    buf = io.BytesIO()
+    cbor2.CBOREncoder(buf).encode_length(CBOR_MAJOR_MAP, length)
+    return buf.getvalue()
+
+
+def _stream_cbor(value):
+    """Yield the CBOR representation of `value` one chunk at a time
+
+    Like in :func:`_stream_json`, iterators within `value` are streamed:
+    they are encoded as indefinite-length arrays, whose elements are
+    yielded as soon as they have been encoded.
+    """
+
+    if isinstance(value, Iterator):
+        yield CBOR_INDEFINITE_ARRAY
+        for cur_item in value:
+            yield from _stream_cbor(cur_item)
+        yield CBOR_BREAK
+    elif isinstance(value, dict) and any(
+        isinstance(x, Iterator) for x in value.values()
+    ):
+        yield _cbor_map_head(len(value))
+        for cur_key, cur_value in value.items():
+            yield _cbor_dumps(cur_key)
+            yield from _stream_cbor(cur_value)
+    else:
+        yield _cbor_dumps(value)
+
+
+def stream_schema(schema, output_format: DumpOutputFormat):
+    """Return an iterator over the chunks of text encoding `schema`
+
+    The sections of `schema` can be iterators (e.g., the generators
+    returned by :func:`dump_data_files`); in this case, each record
+    is encoded and yielded as soon as it is produced.
+
+    The chunks are ``str`` objects, apart from the CBOR format, which
+    produces ``bytes``: in this case, UUIDs and dates are saved as
+    native CBOR values instead of strings.
+    """
+
+    if output_format == DumpOutputFormat.JSON:
+        return _stream_json(schema)
+    elif output_format == DumpOutputFormat.YAML:
+        return _stream_yaml(schema)
+    elif output_format == DumpOutputFormat.CBOR:
+        return _stream_cbor(schema)
+
+    raise ValueError(f"unsupported output format {output_format}")
+
+
+def dump_header() -> OrderedDict:
+    "Return the section ``instrumentdb`` of a schema"
 
-def save_schema(
-    configuration: ReleaseDumpConfiguration,
-    output_file_path,
-    release_tag: Optional[str] = None,
-):
     try:
         this_repo = git.Repo(search_parent_directories=True)
         git_sha = this_repo.head.object.hexsha
     except (ValueError, git.InvalidGitRepositoryError):
         git_sha = "unknown"
 
-    if release_tag:
-        release_tag = [Release.objects.get(tag=release_tag)]
-        data_files = release_tag[0].data_files.all()
-    else:
-        # If no release is specified, return *everything*
-        release_tag = Release.objects.all()
-        data_files = DataFile.objects.all()
+    return OrderedDict(
+        [
+            ("git_sha", git_sha),
+            ("version", Quoted(__version__)),
+            ("dump_date", timezone.now().isoformat()),
+            (
+                "repository",
+                Quoted("https://github.com/ziotom78/instrumentdb"),
+            ),
+        ]
+    )
 
-    schema = OrderedDict(
+
+def _entities_with_ancestors(
+    entity_uuids, parents: Dict[uuid.UUID, Optional[uuid.UUID]]
+) -> Set[uuid.UUID]:
+    result = set()
+    for cur_uuid in entity_uuids:
+        while cur_uuid is not None and cur_uuid not in result:
+            result.add(cur_uuid)
+            cur_uuid = parents[cur_uuid]
+
+    return result
+
+
+def build_delta_schema(
+    configuration: ReleaseDumpConfiguration, old_tag: str, new_tag: str
+) -> OrderedDict:
+    """Return the differences between two releases as a dictionary
+
+    The data files are compared using set operations on the membership
+    table of the releases. A quantity belongs to a release if at least
+    one of its data files does, and an entity if one of its quantities
+    or of its descendants does. The result lists:
+
+    - The data files that have been added (as full records, with their
+      attachments unless ``configuration.no_attachments`` is set) and
+      the UUIDs of those that have been removed;
+    - The quantities that have been added (as full records, together
+      with their format specifications), and the UUIDs of those that
+      have been removed or whose data files have changed;
+    - The same for entities, where an entity has changed if one of its
+      own quantities has been added, removed, or changed.
+    """
+
+    old_release = Release.objects.get(tag=old_tag)
+
+    # Besides the entity tree and the quantities, this contains the
+    # dependencies of all the data files in the new release
+    index = build_dump_index(release_tag=new_tag)
+    new_release = index.releases[0]
+
+    members = DataFile.release_tags.through.objects
+    new_members = members.filter(release_id=new_release.tag).values("datafile_id")
+    old_members = members.filter(release_id=old_release.tag).values("datafile_id")
+
+    added_data_files = index.data_files.exclude(uuid__in=old_members)
+    removed_data_files = DataFile.objects.filter(uuid__in=old_members).exclude(
+        uuid__in=new_members
+    )
+    removed_data_file_uuids = list(removed_data_files.values_list("uuid", flat=True))
+
+    # Quantities and entities
+    def release_quantities(tag: str) -> Set[uuid.UUID]:
+        return set(
+            DataFile.objects.filter(release_tags__tag=tag)
+            .values_list("quantity_id", flat=True)
+            .distinct()
+        )
+
+    new_quantities = release_quantities(new_release.tag)
+    old_quantities = release_quantities(old_release.tag)
+    touched_quantities = set(
+        added_data_files.values_list("quantity_id", flat=True).distinct()
+    ) | set(removed_data_files.values_list("quantity_id", flat=True).distinct())
+
+    added_quantities = new_quantities - old_quantities
+    removed_quantities = old_quantities - new_quantities
+    changed_quantities = (new_quantities & old_quantities) & touched_quantities
+
+    quantity_entity = {x.uuid: x.parent_entity_id for x in index.quantities}
+    entities = {
+        x.uuid: x for children in index.entity_children.values() for x in children
+    }
+    parents = {x.uuid: x.parent_id for x in entities.values()}
+
+    new_entities = _entities_with_ancestors(
+        (quantity_entity[x] for x in new_quantities), parents
+    )
+    old_entities = _entities_with_ancestors(
+        (quantity_entity[x] for x in old_quantities), parents
+    )
+    changed_entities = (new_entities & old_entities) & {
+        quantity_entity[x]
+        for x in added_quantities | removed_quantities | changed_quantities
+    }
+
+    format_specs = {
+        x.format_spec_id for x in index.quantities if x.uuid in added_quantities
+    }
+
+    def sorted_uuids(uuids) -> List[Quoted]:
+        return [Quoted(x) for x in sorted(uuids, key=str)]
+
+    return OrderedDict(
         [
+            ("instrumentdb", dump_header()),
             (
-                "instrumentdb",
+                "delta",
                 OrderedDict(
                     [
-                        ("git_sha", git_sha),
-                        ("version", Quoted(__version__)),
-                        ("dump_date", timezone.now().isoformat()),
-                        (
-                            "repository",
-                            Quoted("https://github.com/ziotom78/instrumentdb"),
-                        ),
+                        ("from", Quoted(old_release.tag)),
+                        ("to", Quoted(new_release.tag)),
+                        ("release_date", Quoted(new_release.rel_date)),
+                        ("comment", Quoted(new_release.comment)),
                     ]
                 ),
             ),
+            (
+                # Parents are listed before their children
+                "added_entities",
+                [
+                    OrderedDict(
+                        [
+                            ("uuid", Quoted(x.uuid)),
+                            ("name", Quoted(x.name)),
+                            ("parent", Quoted(x.parent_id) if x.parent_id else None),
+                        ]
+                    )
+                    for x in Entity.objects.filter(
+                        uuid__in=new_entities - old_entities
+                    ).order_by("tree_id", "lft")
+                ],
+            ),
+            ("removed_entities", sorted_uuids(old_entities - new_entities)),
+            ("changed_entities", sorted_uuids(changed_entities)),
+            (
+                "format_specifications",
+                dump_specifications(
+                    configuration,
+                    [x for x in index.format_specs if x.uuid in format_specs],
+                ),
+            ),
+            (
+                "added_quantities",
+                dump_quantities(
+                    configuration,
+                    replace(
+                        index,
+                        quantities=[
+                            x for x in index.quantities if x.uuid in added_quantities
+                        ],
+                    ),
+                ),
+            ),
+            ("removed_quantities", sorted_uuids(removed_quantities)),
+            ("changed_quantities", sorted_uuids(changed_quantities)),
+            (
+                "added_data_files",
+                dump_data_files(
+                    configuration, replace(index, data_files=added_data_files)
+                ),
+            ),
+            ("removed_data_files", sorted_uuids(removed_data_file_uuids)),
+        ]
+    )
+
+
+def build_schema(
+    configuration: ReleaseDumpConfiguration,
+    release_tag: Optional[str] = None,
+    delta_from: Optional[str] = None,
+) -> OrderedDict:
+    """Return the schema of the database as a dictionary
+
+    The sections containing entities, format specifications,
+    quantities, data files, and releases are generators, which
+    produce their records only when they are iterated over. Pass the
+    result to :func:`stream_schema` to encode it.
+
+    If `delta_from` is set, the result contains the differences between
+    the releases `delta_from` and `release_tag` (see
+    :func:`build_delta_schema`).
+    """
+
+    if delta_from:
+        if not release_tag:
+            raise ValueError("a delta can only be computed for a release")
+
+        return build_delta_schema(configuration, delta_from, release_tag)
+
+    index = build_dump_index(release_tag=release_tag)
+
+    schema = OrderedDict(
+        [
+            ("instrumentdb", dump_header()),
             (
                 "entities",
                 dump_entity_tree(
-                    configuration, Entity.objects.root_nodes(), data_files=data_files
+                    configuration, index, index.entity_children.get(None, [])
                 ),
             ),
             (
@@ -836,25 +1967,19 @@ def save_schema(
                 (
                     {}
                     if configuration.only_tree
-                    else dump_specifications(
-                        configuration, FormatSpecification.objects.all()
-                    )
+                    else dump_specifications(configuration, index.format_specs)
                 ),
             ),
             (
                 "quantities",
-                dump_quantities(
-                    configuration=configuration,
-                    quantities=Quantity.objects.all(),
-                    data_files=data_files,
-                ),
+                dump_quantities(configuration=configuration, index=index),
             ),
             (
                 "data_files",
                 (
                     {}
                     if configuration.only_tree
-                    else dump_data_files(configuration, data_files)
+                    else dump_data_files(configuration, index)
                 ),
             ),
             (
@@ -862,36 +1987,58 @@ def save_schema(
                 (
                     {}
                     if configuration.only_tree
-                    else dump_releases(configuration, release_tag)
+                    else dump_releases(configuration, index)
                 ),
             ),
         ]
     )
 
-    dump_functions = {
-        DumpOutputFormat.JSON: lambda output_stream: json.dump(
-            schema, output_stream, indent=2
-        ),
-        DumpOutputFormat.YAML: lambda output_stream: yaml_saner_dump(
-            schema, stream=output_stream
-        ),
-    }
+    return schema
 
-    with output_file_path.open("w") as output_file:
-        dump_fn = dump_functions[configuration.output_format]
-        dump_fn(output_stream=output_file)
+
+def save_schema(
+    configuration: ReleaseDumpConfiguration,
+    output_file_path,
+    release_tag: Optional[str] = None,
+    delta_from: Optional[str] = None,
+):
+    if configuration.output_format == DumpOutputFormat.SQLITE and delta_from:
+        raise ValueError("deltas cannot be saved into SQLite snapshots")
+
+    schema = build_schema(configuration, release_tag=release_tag, delta_from=delta_from)
+
+    if configuration.output_format == DumpOutputFormat.SQLITE:
+        save_snapshot(schema, output_file_path)
+        return
+
+    mode = "wb" if configuration.output_format == DumpOutputFormat.CBOR else "w"
+    with output_file_path.open(mode) as output_file:
+        for cur_chunk in stream_schema(schema, configuration.output_format):
+            output_file.write(cur_chunk)
 
 
 def dump_db_to_json(
-    configuration: ReleaseDumpConfiguration, release_tag: Optional[str] = None
+    configuration: ReleaseDumpConfiguration,
+    release_tag: Optional[str] = None,
+    delta_from: Optional[str] = None,
 ) -> Path:
-    """Save the database into a JSON/YAML file
+    """Save the database into a JSON/YAML/CBOR file or a SQLite snapshot
 
     This function creates a output folder and dumps the whole database in it. If
     `release_tag` is set to some string, only the release matching that string
     (e.g., ``v1.3``) will be considered when saving data files. Quantities, entities,
     and format specifications are always saved in full.
 
+    If `delta_from` is set to the tag of another release, the file is named
+    ``delta.json`` and contains only the differences between the two releases
+    (see :func:`build_delta_schema`); only the attachments of the data files that
+    have been added to `release_tag` are saved.
+
+    When attachments are saved, the folder also contains a manifest
+    (see :class:`AttachmentManifest`): if the folder already contains
+    a previous export, only new or modified attachments are copied, and
+    those that are no longer referenced are deleted.
+
     The function returns a ``Path`` object to the schema file that has been created.
     """
 
@@ -900,44 +2047,398 @@ def dump_db_to_json(
     extensions = {
         DumpOutputFormat.JSON: "json",
         DumpOutputFormat.YAML: "yaml",
+        DumpOutputFormat.CBOR: "cbor",
+        DumpOutputFormat.SQLITE: "sqlite3",
     }
     cur_ext = extensions[configuration.output_format]
 
-    output_schema_path = configuration.output_folder / f"schema.{cur_ext}"
-    save_schema(
-        configuration,
-        output_schema_path,
-        release_tag=release_tag,
+    base_name = "delta" if delta_from else "schema"
+    output_schema_path = configuration.output_folder / f"{base_name}.{cur_ext}"
+
+    # The manifest lists the attachments saved by the previous export
+    # into the same folder, so that unchanged files are not copied again
+    manifest = (
+        None
+        if configuration.no_attachments
+        else AttachmentManifest(configuration.output_folder)
     )
 
+    with AttachmentCopier(
+        num_of_threads=configuration.num_of_copy_threads,
+        hard_links=configuration.hard_link_attachments,
+        manifest=manifest,
+    ) as copier:
+        configuration.attachment_copier = copier
+        try:
+            save_schema(
+                configuration,
+                output_schema_path,
+                release_tag=release_tag,
+                delta_from=delta_from,
+            )
+        finally:
+            configuration.attachment_copier = None
+
+    if manifest is not None:
+        stale_files = manifest.remove_stale_files()
+        manifest.save()
+        logging.info(
+            "%d attachment(s) copied, %d unchanged, %d stale file(s) removed",
+            manifest.num_of_copied_files,
+            len(manifest.new_entries) - manifest.num_of_copied_files,
+            len(stale_files),
+        )
+
     return output_schema_path
 
 
-def update_release_file_dumps(force: bool = False):
+def mark_release_dumps_outdated(**filters) -> int:
+    """Flag the JSON dumps of the releases matching `filters` as outdated
+
+    The keyword arguments are passed to ``Release.objects.filter``, e.g.,
+    ``data_files__in=[...]``. As the path index of a release depends on
+    its data files as well, it is flagged too. Return the number of
+    releases that have been flagged.
     """
-    Update the field `json_file` for each `Release` object.
+
+    return (
+        Release.objects.filter(**filters)
+        .filter(
+            models.Q(json_file_outdated=False) | models.Q(path_index_outdated=False)
+        )
+        .update(json_file_outdated=True, path_index_outdated=True)
+    )
+
+
+def mark_all_release_dumps_outdated() -> int:
+    """Flag the JSON dumps of all the releases as outdated
+
+    Every dump contains all the entities, quantities and format
+    specifications, so this must be called whenever any of them changes.
+    Unlike :func:`mark_release_dumps_outdated`, path indexes are not
+    flagged. Return the number of releases that have been flagged.
     """
 
-    for cur_release in Release.objects.all():
-        if bool(cur_release.json_file) and (not force):
-            # The JSON dump already exists, and we are not required
-            # to recreate it, so let's skip this release
-            continue
+    return Release.objects.filter(json_file_outdated=False).update(
+        json_file_outdated=True
+    )
+
+
+def mark_release_path_indexes_outdated(**filters) -> int:
+    """Flag the path indexes of the releases matching `filters` as outdated
+
+    This must be called whenever the paths of quantities change. See
+    :func:`mark_release_dumps_outdated` for the meaning of `filters` and
+    of the return value.
+    """
+
+    return (
+        Release.objects.filter(**filters)
+        .filter(path_index_outdated=False)
+        .update(path_index_outdated=True)
+    )
+
+
+def update_release_path_index(release: Release, batch_size=1000) -> None:
+    "Rebuild the rows of :class:`ReleasePathIndex` for `release`"
+
+    with transaction.atomic():
+        # Lock the release, so that two processes rebuilding the same index
+        # wait for each other instead of inserting the rows twice
+        Release.objects.select_for_update().only("pk").get(pk=release.pk)
+
+        # Like for JSON dumps, the flag is cleared before reading the
+        # data files, so that changes made in the meantime flag it again
+        Release.objects.filter(pk=release.pk).update(path_index_outdated=False)
+        release.path_index_outdated = False
+
+        ReleasePathIndex.objects.filter(release=release).delete()
+
+        # `bulk_create` would load all the rows in memory at once
+        batch = []
+        for data_file_id, path in (
+            DataFile.objects.filter(release_tags=release)
+            .order_by()
+            .values_list("uuid", "quantity__path")
+            .iterator(chunk_size=batch_size)
+        ):
+            batch.append(
+                ReleasePathIndex(release=release, path=path, data_file_id=data_file_id)
+            )
+            if len(batch) >= batch_size:
+                ReleasePathIndex.objects.bulk_create(batch)
+                batch = []
+
+        if batch:
+            ReleasePathIndex.objects.bulk_create(batch)
+
+
+def update_release_path_indexes(force: bool = False) -> List[str]:
+    """Rebuild the path indexes of the releases that are outdated
+
+    If `force` is ``True``, the indexes of *all* the releases are
+    rebuilt. Return the list of tags of the releases that were updated.
+    """
+
+    releases = Release.objects.all()
+    if not force:
+        releases = releases.filter(path_index_outdated=True)
+
+    result = []
+    for cur_release in releases:
+        update_release_path_index(cur_release)
+        result.append(cur_release.tag)
+
+    return result
+
+
+def outdated_releases():
+    "Return the releases whose JSON dump is missing or outdated"
+
+    return Release.objects.filter(
+        models.Q(json_file_outdated=True) | models.Q(json_file="")
+    )
+
+
+def compress_gzip(source_path: Path, dest_path: Path):
+    with source_path.open("rb") as inpf, gzip.open(dest_path, "wb") as outf:
+        shutil.copyfileobj(inpf, outf, COPY_CHUNK_SIZE)
+
+
+def compress_zstd(source_path: Path, dest_path: Path):
+    compressor = zstandard.ZstdCompressor(level=10)
+    with source_path.open("rb") as inpf, dest_path.open("wb") as outf:
+        compressor.copy_stream(inpf, outf)
+
+
+# Compressed copies of the JSON dump of a release are saved together with
+# it, so that they can be served without compressing them on the fly. The
+# value of `name` is the one used in the `Content-Encoding` header
+ContentEncoding = namedtuple("ContentEncoding", ["name", "suffix", "compress"])
+
+# Encodings are listed in order of preference. Zstandard is only supported
+# if the package `zstandard` is installed
+RELEASE_DUMP_ENCODINGS = [ContentEncoding("gzip", ".gz", compress_gzip)]
+if zstandard:
+    RELEASE_DUMP_ENCODINGS.insert(0, ContentEncoding("zstd", ".zst", compress_zstd))
 
+
+def compressed_release_dump_name(release: Release, encoding: ContentEncoding) -> str:
+    "Return the name of the compressed copy of the JSON dump of a release"
+
+    return release.json_file.name + encoding.suffix
+
+
+def cbor_release_dump_name(release: Release) -> str:
+    "Return the name of the CBOR dump of a release"
+
+    return str(Path(release.json_file.name).with_suffix(".cbor"))
+
+
+def delete_release_dump_copies(release: Release):
+    """Remove the copies of the JSON dump of a release from the storage
+
+    These are the compressed copies and the CBOR dump, which are kept next
+    to the file in the field `json_file`.
+    """
+
+    if not release.json_file:
+        return
+
+    storage = release.json_file.storage
+    for name in [
+        compressed_release_dump_name(release, x) for x in RELEASE_DUMP_ENCODINGS
+    ] + [cbor_release_dump_name(release)]:
+        if storage.exists(name):
+            storage.delete(name)
+
+
+def dump_release(tag: str, output_folder: Path) -> Tuple[str, Path, float]:
+    """Dump the release `tag` into a JSON file saved in `output_folder`
+
+    Compressed copies of the file (see ``RELEASE_DUMP_ENCODINGS``) and a
+    dump in CBOR format are saved in the same folder. Return a tuple
+    containing the tag, the path to the JSON file, and the time spent to
+    produce the files (in seconds).
+    This function can be run in a separate process, see
+    :func:`update_release_file_dumps`.
+    """
+
+    start_time = time.perf_counter()
+    configuration = ReleaseDumpConfiguration(
+        no_attachments=True,
+        only_tree=False,
+        exist_ok=True,
+        skip_empty_entities=False,
+        skip_empty_quantities=False,
+        output_format=DumpOutputFormat.JSON,
+        output_folder=output_folder,
+    )
+    json_file_path = dump_db_to_json(configuration, release_tag=tag)
+
+    for cur_encoding in RELEASE_DUMP_ENCODINGS:
+        cur_encoding.compress(
+            json_file_path,
+            json_file_path.with_name(json_file_path.name + cur_encoding.suffix),
+        )
+
+    # The CBOR dump is built now, so that downloads never need to write
+    # into the storage
+    dump_db_to_json(
+        replace(configuration, output_format=DumpOutputFormat.CBOR), release_tag=tag
+    )
+
+    return (tag, json_file_path, time.perf_counter() - start_time)
+
+
+def save_release_dump(release: Release, json_file_path: Path):
+    """Save the JSON dump of a release in the field `json_file`
+
+    The compressed copies and the CBOR dump produced by
+    :func:`dump_release` are saved in the storage as well, next to the
+    JSON file.
+    """
+
+    delete_release_dump_copies(release)
+
+    with json_file_path.open("rb") as json_file:
+        release.json_file.save(
+            name=f"schema_{release.tag}.json",
+            content=File(json_file),
+            save=False,
+        )
+
+    storage = release.json_file.storage
+    copies = [
+        (
+            compressed_release_dump_name(release, cur_encoding),
+            json_file_path.with_name(json_file_path.name + cur_encoding.suffix),
+        )
+        for cur_encoding in RELEASE_DUMP_ENCODINGS
+    ] + [(cbor_release_dump_name(release), json_file_path.with_suffix(".cbor"))]
+
+    for name, copy_path in copies:
+        # Remove any leftover, otherwise the storage would pick another name
+        if storage.exists(name):
+            storage.delete(name)
+
+        with copy_path.open("rb") as copy_file:
+            storage.save(name, File(copy_file))
+
+    release.json_file_date = timezone.now()
+    release.save(update_fields=["json_file", "json_file_date"])
+
+
+def update_release_file_dump(release: Release) -> float:
+    """Rebuild the JSON dump of a release and save it in the field `json_file`
+
+    Return the time spent to produce the dump (in seconds).
+    """
+
+    # Clear the flag *before* dumping the release, so that changes made
+    # while the dump is being built will flag it again
+    Release.objects.filter(pk=release.pk).update(json_file_outdated=False)
+    release.json_file_outdated = False
+
+    try:
         with TemporaryDirectory() as tempdir:
-            temp_path = Path(tempdir)
-            json_file_path = dump_db_to_json(
-                ReleaseDumpConfiguration(
-                    no_attachments=True,
-                    exist_ok=True,
-                    output_format=DumpOutputFormat.JSON,
-                    output_folder=temp_path,
-                ),
-                release_tag=cur_release.tag,
+            (_, json_file_path, elapsed_time) = dump_release(
+                str(release.tag), Path(tempdir)
             )
+            save_release_dump(release, json_file_path)
+    except BaseException:
+        # The dump was not saved, so it must be rebuilt the next time
+        Release.objects.filter(pk=release.pk).update(json_file_outdated=True)
+        release.json_file_outdated = True
+        raise
 
-            with json_file_path.open("rt") as json_file:
-                cur_release.json_file.save(
-                    name=f"schema_{cur_release.tag}.json",
-                    content=open(json_file, "rb"),
-                )
+    return elapsed_time
+
+
+def update_release_file_dumps_in_parallel(
+    releases: List[Release], num_of_jobs: int
+) -> List[Tuple[str, float]]:
+    """Rebuild the JSON dumps of `releases` using a pool of processes
+
+    Each process opens its own connection to the database and saves the
+    dump in a temporary folder; the dumps are then saved in the storage
+    by the calling process. If some of the dumps fail, the others are
+    saved anyway, and the first exception is raised at the end.
+    """
+
+    # See `update_release_file_dump`: the flags of the releases whose dump
+    # is not saved are set again at the end
+    Release.objects.filter(pk__in=[x.pk for x in releases]).update(
+        json_file_outdated=False
+    )
+    release_by_tag = {str(x.tag): x for x in releases}
+
+    timings = []
+    errors = []
+    try:
+        with TemporaryDirectory() as tempdir:
+            # Connections cannot be shared with the child processes: close
+            # them, so that each process will open a new one
+            connections.close_all()
+
+            with ProcessPoolExecutor(
+                max_workers=num_of_jobs, initializer=django.setup
+            ) as executor:
+                futures = {
+                    executor.submit(
+                        dump_release, tag, Path(tempdir) / f"release{idx:05d}"
+                    ): tag
+                    for (idx, tag) in enumerate(release_by_tag.keys())
+                }
+
+                for future in as_completed(futures):
+                    tag = futures[future]
+                    try:
+                        (_, json_file_path, elapsed_time) = future.result()
+                        save_release_dump(release_by_tag[tag], json_file_path)
+                    except Exception as err:
+                        logging.error("unable to dump release %s: %s", tag, err)
+                        errors.append(err)
+                        continue
+
+                    timings.append((tag, elapsed_time))
+    finally:
+        saved_tags = {tag for (tag, _) in timings}
+        failed = [x.pk for (tag, x) in release_by_tag.items() if tag not in saved_tags]
+        if failed:
+            Release.objects.filter(pk__in=failed).update(json_file_outdated=True)
+
+    if errors:
+        raise errors[0]
+
+    return timings
+
+
+def update_release_file_dumps(
+    force: bool = False, num_of_jobs: int = 1
+) -> List[Tuple[str, float]]:
+    """
+    Update the field `json_file` for each `Release` object.
+
+    Only the dumps that are missing or outdated are rebuilt, unless `force`
+    is ``True``. If `num_of_jobs` is greater than one, the dumps are built by
+    a pool of processes (this is not possible with in-memory SQLite
+    databases, which cannot be shared among processes).
+
+    Return a list of pairs containing the tag of each release that has been
+    updated and the time spent to dump it (in seconds).
+    """
+
+    releases = list(Release.objects.all() if force else outdated_releases())
+    if not releases:
+        return []
+
+    connection = connections[Release.objects.db]
+    in_memory_db = connection.vendor == "sqlite" and connection.is_in_memory_db()
+    if num_of_jobs > 1 and len(releases) > 1 and not in_memory_db:
+        return update_release_file_dumps_in_parallel(releases, num_of_jobs)
+
+    return [
+        (cur_release.tag, update_release_file_dump(cur_release))
+        for cur_release in releases
+    ]
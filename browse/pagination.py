@@ -0,0 +1,214 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Pagination classes used by the REST API.
+
+By default, lists of objects are paginated using ``limit`` and
+``offset``, which is easy to use but becomes slower and slower as the
+offset grows, because the database must skip all the preceding rows.
+Clients that walk through a whole table can add ``pagination=cursor``
+to the query of the first page: in this case, the response contains
+opaque ``next`` and ``previous`` links that encode the position of the
+last/first object in the page, and each page is retrieved with an
+indexed range query (keyset pagination), whose cost does not depend on
+how far the page is from the beginning.
+"""
+
+import json
+from typing import Any, List, Sequence
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+    Cursor,
+    CursorPagination,
+    LimitOffsetPagination,
+)
+
+
+def _reverse_ordering(ordering: Sequence[str]) -> List[str]:
+    return [x[1:] if x.startswith("-") else "-" + x for x in ordering]
+
+
+def keyset_filter(ordering: Sequence[str], position: Sequence[Any]) -> Q:
+    """Return a filter selecting the objects that follow `position`
+
+    The parameter `ordering` is a list of field names, as the ones passed
+    to ``QuerySet.order_by``, and `position` contains the values of these
+    fields for one object. The ordering must identify objects uniquely.
+
+    The filter has the form ``a >= x AND (a > x OR (a = x AND (b > y OR
+    ...)))``, where the first term lets the database use an index whose
+    columns match `ordering`.
+    """
+
+    def strictly_after(field_name: str, value) -> Q:
+        if field_name.startswith("-"):
+            return Q(**{field_name[1:] + "__lt": value})
+
+        return Q(**{field_name + "__gt": value})
+
+    result = strictly_after(ordering[-1], position[-1])
+    for field_name, value in zip(reversed(ordering[:-1]), reversed(position[:-1])):
+        result = strictly_after(field_name, value) | (
+            Q(**{field_name.lstrip("-"): value}) & result
+        )
+
+    first_field = ordering[0]
+    if first_field.startswith("-"):
+        first_term = Q(**{first_field[1:] + "__lte": position[0]})
+    else:
+        first_term = Q(**{first_field + "__gte": position[0]})
+
+    return first_term & result
+
+
+class KeysetPagination(CursorPagination):
+    """Paginate a queryset using the default ordering of its model
+
+    Unlike ``CursorPagination``, which filters objects using the first
+    field of the ordering alone and skips the objects with the same value
+    using an offset, the cursors produced by this class contain the values
+    of *all* the fields in the ordering. Thus, pages can be retrieved with
+    a range query even if many objects have the same name or upload date.
+    The primary key is appended to the ordering if it is not already
+    there, so that the position of each object is unique.
+    """
+
+    page_size_query_param = "limit"
+    max_page_size = 1000
+
+    def get_ordering(self, request, queryset, view):
+        ordering = list(queryset.model._meta.ordering)
+        pk_name = queryset.model._meta.pk.name
+        if pk_name not in [x.lstrip("-") for x in ordering]:
+            ordering.append(pk_name)
+
+        return ordering
+
+    def _get_position_from_instance(self, instance, ordering):
+        return json.dumps(
+            [str(getattr(instance, x.lstrip("-"))) for x in ordering],
+            ensure_ascii=False,
+        )
+
+    def _decode_position(self, position: str) -> List[str]:
+        try:
+            result = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(result, list) or len(result) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        return result
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            reverse, position = False, None
+        else:
+            reverse, position = self.cursor.reverse, self.cursor.position
+
+        # A reverse cursor retrieves the objects *preceding* the
+        # position, so the ordering is inverted and then restored
+        ordering = _reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(
+                keyset_filter(ordering, self._decode_position(position))
+            )
+
+        # Retrieve one more object to check if there are more pages
+        results = list(queryset[: self.page_size + 1])
+        self.page = results[: self.page_size]
+        has_more = len(results) > len(self.page)
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        if self.page:
+            self.next_position = self._get_position_from_instance(
+                self.page[-1], self.ordering
+            )
+            self.previous_position = self._get_position_from_instance(
+                self.page[0], self.ordering
+            )
+        else:
+            self.next_position = self.previous_position = position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=False, position=self.next_position)
+        )
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=True, position=self.previous_position)
+        )
+
+
+class OptionalKeysetPagination(KeysetPagination):
+    """Use keyset pagination only if the client asks for it
+
+    Keyset pagination is used if the query contains ``pagination=cursor``
+    or a cursor; otherwise, the list is paginated using ``limit`` and
+    ``offset`` like the other lists in the API.
+    """
+
+    pagination_query_param = "pagination"
+
+    def __init__(self):
+        self.offset_pagination = None
+
+    def use_keyset(self, request) -> bool:
+        return (
+            request.query_params.get(self.pagination_query_param) == "cursor"
+            or self.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_keyset(request):
+            self.offset_pagination = None
+            return super().paginate_queryset(queryset, request, view)
+
+        self.offset_pagination = LimitOffsetPagination()
+        page = self.offset_pagination.paginate_queryset(queryset, request, view)
+        self.display_page_controls = self.offset_pagination.display_page_controls
+        return page
+
+    def get_paginated_response(self, data):
+        if self.offset_pagination is not None:
+            return self.offset_pagination.get_paginated_response(data)
+
+        return super().get_paginated_response(data)
+
+    def to_html(self):
+        if self.offset_pagination is not None:
+            return self.offset_pagination.to_html()
+
+        return super().to_html()
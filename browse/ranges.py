@@ -0,0 +1,249 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Send files stored in the database, honouring HTTP range requests.
+
+Clients can ask for parts of a file using the ``Range`` header (RFC
+9110, section 14), e.g., to read one HDU of a large FITS file or to
+resume an interrupted download::
+
+    Range: bytes=1000-1999     (bytes from 1000 to 1999, inclusive)
+    Range: bytes=1000-         (everything from byte 1000)
+    Range: bytes=-500          (the last 500 bytes)
+    Range: bytes=0-99,-100     (two parts, sent as multipart/byteranges)
+
+The function :func:`serve_file` answers with ``206 Partial Content``,
+reading only the requested bytes from the storage, or with ``416 Range
+Not Satisfiable`` if none of the ranges overlaps the file. If the
+header is missing or cannot be understood, the whole file is sent.
+"""
+
+from datetime import datetime
+from typing import Iterator, List, NamedTuple, Optional
+import uuid
+
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header, parse_http_date_safe
+
+from browse.models import COPY_CHUNK_SIZE
+
+# Requests with more ranges than this are answered with the whole file
+MAX_RANGES = 32
+
+
+class ByteRange(NamedTuple):
+    start: int
+    # Unlike the last byte position in a ``Range`` header, this is *not*
+    # included in the range
+    stop: int
+
+    @property
+    def length(self) -> int:
+        return self.stop - self.start
+
+    def content_range(self, size: int) -> str:
+        return f"bytes {self.start}-{self.stop - 1}/{size}"
+
+
+def _is_byte_position(value: str) -> bool:
+    # str.isdigit() accepts other Unicode digits too (e.g., "²"), which
+    # int() cannot parse
+    return value.isascii() and value.isdigit()
+
+
+def parse_range_header(header: str, size: int) -> Optional[List[ByteRange]]:
+    """Return the ranges of a file with `size` bytes requested by a ``Range`` header
+
+    Ranges that overlap or are adjacent are merged, and the result is
+    sorted. Return ``None`` if the header must be ignored, because it is
+    malformed, it uses a unit other than ``bytes``, or it contains too
+    many ranges; return an empty list if none of the ranges is
+    satisfiable.
+    """
+
+    unit, _, range_set = header.partition("=")
+    if unit.strip().lower() != "bytes":
+        return None
+
+    specs = [x.strip() for x in range_set.split(",") if x.strip()]
+    if not specs or len(specs) > MAX_RANGES:
+        return None
+
+    ranges = []  # type: List[ByteRange]
+    for cur_spec in specs:
+        first, sep, last = cur_spec.partition("-")
+        first, last = first.strip(), last.strip()
+        if (
+            not sep
+            or not (_is_byte_position(first) or first == "")
+            or not (_is_byte_position(last) or last == "")
+        ):
+            return None
+
+        if first == "":
+            # Suffix range: the last N bytes of the file
+            if last == "":
+                return None
+
+            length = int(last)
+            if length > 0 and size > 0:
+                ranges.append(ByteRange(max(size - length, 0), size))
+            continue
+
+        start = int(first)
+        stop = size if last == "" else min(int(last) + 1, size)
+        if last != "" and int(last) < start:
+            return None
+
+        if start < size:
+            ranges.append(ByteRange(start, stop))
+
+    merged = []  # type: List[ByteRange]
+    for cur_range in sorted(ranges):
+        if merged and cur_range.start <= merged[-1].stop:
+            merged[-1] = ByteRange(
+                merged[-1].start, max(merged[-1].stop, cur_range.stop)
+            )
+        else:
+            merged.append(cur_range)
+
+    return merged
+
+
+def if_range_passes(
+    request, etag: Optional[str], last_modified: Optional[datetime]
+) -> bool:
+    """Return True if the ``Range`` header of `request` can be honoured
+
+    If the request has an ``If-Range`` header, the range must be sent
+    only if the file has not changed since the client got its validator:
+    ETags must match exactly (weak ETags never match), and dates must be
+    equal to `last_modified`.
+    """
+
+    value = request.headers.get("If-Range")
+    if value is None:
+        return True
+
+    value = value.strip()
+    if value.startswith('"'):
+        return etag is not None and value == etag
+
+    if value.startswith("W/"):
+        return False
+
+    timestamp = parse_http_date_safe(value)
+    return (
+        timestamp is not None
+        and last_modified is not None
+        and timestamp == int(last_modified.timestamp())
+    )
+
+
+def _read_ranges(
+    file_handle, ranges: List[ByteRange], separators: List[bytes]
+) -> Iterator[bytes]:
+    # `separators` contains the bytes to be sent before each range and
+    # after the last one
+    try:
+        for cur_range, cur_separator in zip(ranges, separators):
+            if cur_separator:
+                yield cur_separator
+
+            file_handle.seek(cur_range.start)
+            remaining = cur_range.length
+            while remaining > 0:
+                data = file_handle.read(min(COPY_CHUNK_SIZE, remaining))
+                if not data:
+                    raise OSError(f"file '{file_handle.name}' is shorter than expected")
+
+                remaining -= len(data)
+                yield data
+
+        if separators[-1]:
+            yield separators[-1]
+    finally:
+        file_handle.close()
+
+
+def serve_file(
+    request,
+    field_file,
+    content_type: str,
+    filename: str,
+    as_attachment: bool = True,
+    etag: Optional[str] = None,
+    last_modified: Optional[datetime] = None,
+):
+    """Return a response containing the file `field_file`, or parts of it
+
+    The parameter `field_file` is the value of a ``FileField``, and
+    `etag`/`last_modified` are the validators of the file, used to
+    evaluate the ``If-Range`` header. The caller is responsible for
+    adding them to the response.
+    """
+
+    storage = field_file.storage
+    size = field_file.size
+
+    ranges = None
+    range_header = request.headers.get("Range")
+    if (
+        request.method == "GET"
+        and range_header is not None
+        and if_range_passes(request, etag, last_modified)
+    ):
+        ranges = parse_range_header(range_header, size)
+
+    if ranges is None:
+        response = FileResponse(
+            storage.open(field_file.name, "rb"),
+            content_type=content_type,
+            as_attachment=as_attachment,
+            filename=filename,
+        )
+        response["Content-Length"] = size
+        response["Accept-Ranges"] = "bytes"
+        return response
+
+    if not ranges:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+
+    if len(ranges) == 1:
+        separators = [b"", b""]
+        response_content_type = content_type
+    else:
+        boundary = uuid.uuid4().hex
+        separators = [
+            "{prefix}--{boundary}\r\nContent-Type: {type}\r\n"
+            "Content-Range: {range}\r\n\r\n".format(
+                prefix="\r\n" if idx > 0 else "",
+                boundary=boundary,
+                type=content_type,
+                range=cur_range.content_range(size),
+            ).encode("utf-8")
+            for idx, cur_range in enumerate(ranges)
+        ]
+        separators.append(f"\r\n--{boundary}--\r\n".encode("utf-8"))
+        response_content_type = f"multipart/byteranges; boundary={boundary}"
+
+    response = StreamingHttpResponse(
+        _read_ranges(storage.open(field_file.name, "rb"), ranges, separators),
+        status=206,
+        content_type=response_content_type,
+    )
+    response["Content-Length"] = sum(x.length for x in ranges) + sum(
+        len(x) for x in separators
+    )
+    if len(ranges) == 1:
+        response["Content-Range"] = ranges[0].content_range(size)
+
+    # Let the client know the name of the file, like in a full response
+    disposition = content_disposition_header(as_attachment, filename)
+    if disposition:
+        response["Content-Disposition"] = disposition
+
+    response["Accept-Ranges"] = "bytes"
+    return response
@@ -1,8 +1,10 @@
 # -*- encoding: utf-8 -*-
 
 import json
+from typing import Dict, Iterable, List, Optional
 
 from rest_framework import serializers
+from rest_framework.exceptions import ParseError
 from rest_framework.reverse import reverse
 from django.contrib.auth.models import User, Group
 from browse.models import (
@@ -15,6 +17,73 @@ from browse.models import (
 )
 
 
+def parse_field_list(value: Optional[str]) -> Optional[List[str]]:
+    "Split a comma-separated list of field names, like ``uuid,name``"
+
+    if value is None:
+        return None
+
+    return [x.strip() for x in value.split(",") if x.strip()]
+
+
+class SparseFieldsMixin:
+    """Let clients choose the fields to include in the representation
+
+    If `fields` is a list of field names, every other field is removed
+    from the serializer, so that its value (e.g., a hyperlink) is not
+    computed at all. Additional keys computed in ``to_representation``
+    should be guarded by :meth:`wants_field`.
+
+    The list `expand` contains the names of related objects that are
+    represented using their own serializer instead of a hyperlink, as
+    listed in ``expandable_fields``. Dotted names like
+    ``quantity.format_spec`` expand the fields of expanded objects.
+    """
+
+    # Map the name of a field to the name of the serializer class used
+    # to expand it. (Names are used because some serializers are
+    # defined later in this file.)
+    expandable_fields: Dict[str, str] = {}
+
+    def __init__(
+        self,
+        *args,
+        fields: Optional[Iterable[str]] = None,
+        expand: Optional[Iterable[str]] = None,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+
+        self.requested_fields = None if fields is None else set(fields)
+
+        nested_expansions = {}  # type: Dict[str, List[str]]
+        for cur_path in expand or []:
+            name, _, rest = cur_path.partition(".")
+            if name not in self.expandable_fields:
+                raise ParseError(f"field '{name}' cannot be expanded")
+
+            nested_expansions.setdefault(name, [])
+            if rest:
+                nested_expansions[name].append(rest)
+
+        for name, nested_expand in nested_expansions.items():
+            if not self.wants_field(name):
+                continue
+
+            serializer_class = globals()[self.expandable_fields[name]]
+            self.fields[name] = serializer_class(read_only=True, expand=nested_expand)
+
+        if self.requested_fields is not None:
+            for name in list(self.fields):
+                if name not in self.requested_fields:
+                    self.fields.pop(name)
+
+    def wants_field(self, name: str) -> bool:
+        "Return True if the field `name` must be included in the representation"
+
+        return self.requested_fields is None or name in self.requested_fields
+
+
 class UserSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = User
@@ -27,7 +96,9 @@ class GroupSerializer(serializers.HyperlinkedModelSerializer):
         fields = ["url", "name"]
 
 
-class FormatSpecificationSerializer(serializers.HyperlinkedModelSerializer):
+class FormatSpecificationSerializer(
+    SparseFieldsMixin, serializers.HyperlinkedModelSerializer
+):
     url = serializers.HyperlinkedIdentityField(
         view_name="formatspecification-detail", read_only=True
     )
@@ -54,11 +125,12 @@ class FormatSpecificationSerializer(serializers.HyperlinkedModelSerializer):
         representation = super(FormatSpecificationSerializer, self).to_representation(
             instance
         )
-        representation["download_link"] = reverse(
-            "formatspecification-download",
-            kwargs={"pk": instance.uuid},
-            request=self.context["request"],
-        )
+        if self.wants_field("download_link"):
+            representation["download_link"] = reverse(
+                "formatspecification-download",
+                kwargs={"pk": instance.uuid},
+                request=self.context["request"],
+            )
 
         return representation
 
@@ -72,7 +144,7 @@ class SubEntitySerializer(serializers.ModelSerializer):
         ]
 
 
-class EntitySerializer(serializers.HyperlinkedModelSerializer):
+class EntitySerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     children = SubEntitySerializer(many=True, required=False)
     url = serializers.HyperlinkedIdentityField(
         view_name="entity-detail", read_only=True
@@ -84,13 +156,19 @@ class EntitySerializer(serializers.HyperlinkedModelSerializer):
             "uuid",
             "url",
             "name",
+            "path",
             "parent",
             "children",
             "quantities",
         ]
 
 
-class QuantitySerializer(serializers.HyperlinkedModelSerializer):
+class QuantitySerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
+    expandable_fields = {
+        "format_spec": "FormatSpecificationSerializer",
+        "parent_entity": "EntitySerializer",
+    }
+
     url = serializers.HyperlinkedIdentityField(
         view_name="quantity-detail", read_only=True
     )
@@ -101,6 +179,7 @@ class QuantitySerializer(serializers.HyperlinkedModelSerializer):
             "uuid",
             "url",
             "name",
+            "path",
             "format_spec",
             "parent_entity",
             "data_files",
@@ -137,7 +216,9 @@ class JSONField(serializers.Field):
         return result
 
 
-class DataFileSerializer(serializers.HyperlinkedModelSerializer):
+class DataFileSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
+    expandable_fields = {"quantity": "QuantitySerializer"}
+
     release_tags = serializers.HyperlinkedRelatedField(
         view_name="release-detail",
         many=True,
@@ -164,7 +245,9 @@ class DataFileSerializer(serializers.HyperlinkedModelSerializer):
             "plot_file",
             "comment",
             "release_tags",
+            "file_data_sha256",
         ]
+        read_only_fields = ["file_data_sha256"]
         extra_kwargs = {
             "file_data": {
                 "max_length": 512,
@@ -179,14 +262,14 @@ class DataFileSerializer(serializers.HyperlinkedModelSerializer):
     def to_representation(self, instance):
         representation = super(DataFileSerializer, self).to_representation(instance)
 
-        if instance.file_data:
+        if instance.file_data and self.wants_field("download_link"):
             representation["download_link"] = reverse(
                 "datafile-download",
                 kwargs={"pk": instance.uuid},
                 request=self.context["request"],
             )
 
-        if instance.plot_file:
+        if instance.plot_file and self.wants_field("plot_download_link"):
             representation["plot_download_link"] = reverse(
                 "datafile-plot",
                 kwargs={"pk": instance.uuid},
@@ -196,11 +279,19 @@ class DataFileSerializer(serializers.HyperlinkedModelSerializer):
         return representation
 
 
-class ReleaseSerializer(serializers.HyperlinkedModelSerializer):
+class ReleaseSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
+    # Releases can contain tens of thousands of data files: they can be
+    # set here, but they are listed through `data_files_url`, which is
+    # paginated
     data_files = serializers.HyperlinkedRelatedField(
         view_name="datafile-detail",
         many=True,
         queryset=DataFile.objects.all(),
+        write_only=True,
+    )
+    num_of_data_files = serializers.SerializerMethodField()
+    data_files_url = serializers.HyperlinkedIdentityField(
+        view_name="release-data-files", read_only=True
     )
     url = serializers.HyperlinkedIdentityField(
         view_name="release-detail", read_only=True
@@ -220,6 +311,8 @@ class ReleaseSerializer(serializers.HyperlinkedModelSerializer):
             "release_document_mime_type",
             "release_document_url",
             "data_files",
+            "num_of_data_files",
+            "data_files_url",
         ]
         extra_kwargs = {
             "release_document": {
@@ -229,14 +322,31 @@ class ReleaseSerializer(serializers.HyperlinkedModelSerializer):
         }
         ordering = ["-rel_date"]
 
+    def get_num_of_data_files(self, instance) -> int:
+        # `ReleaseViewSet` annotates the queryset, but objects that have
+        # just been created or updated need to be counted
+        num_of_data_files = getattr(instance, "num_of_data_files", None)
+        if num_of_data_files is None:
+            num_of_data_files = instance.data_files.count()
+
+        return num_of_data_files
+
+    def update(self, instance, validated_data):
+        instance = super(ReleaseSerializer, self).update(instance, validated_data)
+
+        # The number computed by the queryset might be out of date
+        instance.__dict__.pop("num_of_data_files", None)
+        return instance
+
     def to_representation(self, instance):
         representation = super(ReleaseSerializer, self).to_representation(instance)
 
-        representation["json_dump"] = reverse(
-            "release-download-view",
-            kwargs={"pk": instance.tag},
-            request=self.context["request"],
-        )
+        if self.wants_field("json_dump"):
+            representation["json_dump"] = reverse(
+                "release-download-view",
+                kwargs={"pk": instance.tag},
+                request=self.context["request"],
+            )
 
         return representation
 
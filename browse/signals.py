@@ -0,0 +1,89 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Keep track of the releases whose JSON dump is outdated.
+
+The JSON dump of a release (see :class:`browse.models.Release`) contains
+the data files included in the release. Whenever a data file changes,
+is deleted, or is added to/removed from a release, the dumps of the
+releases involved are flagged as outdated; as every dump includes all
+the entities, quantities, and format specifications, any change to
+them flags all the dumps. Dumps are rebuilt by
+:func:`browse.models.update_release_file_dumps`.
+
+Note that bulk operations (``QuerySet.update``, ``bulk_create``, etc.) do
+not send signals: code using them must call
+:func:`browse.models.mark_release_dumps_outdated` by itself.
+"""
+
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from browse.models import (
+    DataFile,
+    Entity,
+    FormatSpecification,
+    Quantity,
+    Release,
+    delete_release_dump_copies,
+    mark_all_release_dumps_outdated,
+    mark_release_dumps_outdated,
+)
+
+
+@receiver(post_save, sender=Entity)
+@receiver(post_save, sender=Quantity)
+@receiver(post_save, sender=FormatSpecification)
+@receiver(post_delete, sender=Entity)
+@receiver(post_delete, sender=Quantity)
+@receiver(post_delete, sender=FormatSpecification)
+def schema_object_changed(sender, instance, **kwargs):
+    # Every dump includes all the entities, quantities and format
+    # specifications, not only those used by the data files of the release
+    mark_all_release_dumps_outdated()
+
+
+@receiver(post_save, sender=DataFile)
+def data_file_saved(sender, instance, created, **kwargs):
+    # A new data file cannot belong to any release yet
+    if not created:
+        mark_release_dumps_outdated(data_files=instance)
+
+
+@receiver(pre_delete, sender=DataFile)
+def data_file_deleted(sender, instance, **kwargs):
+    # We must do this *before* the object is deleted, as the links to its
+    # releases are going to be deleted as well
+    mark_release_dumps_outdated(data_files=instance)
+
+
+@receiver(post_delete, sender=Release)
+def release_deleted(sender, instance, **kwargs):
+    # The JSON dump is removed by django-cleanup, but its copies are not
+    # tracked by any field
+    delete_release_dump_copies(instance)
+
+
+@receiver(m2m_changed, sender=DataFile.release_tags.through)
+def release_membership_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # "instance" is a Release
+        if action in ("post_add", "post_remove", "post_clear"):
+            mark_release_dumps_outdated(pk=instance.pk)
+    elif action in ("post_add", "post_remove"):
+        mark_release_dumps_outdated(pk__in=pk_set)
+    elif action == "pre_clear":
+        mark_release_dumps_outdated(data_files=instance)
+
+
+@receiver(m2m_changed, sender=DataFile.dependencies.through)
+def dependencies_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # "instance" is the dependency, "pk_set" contains the data files
+        # whose list of dependencies has changed
+        if action in ("post_add", "post_remove"):
+            mark_release_dumps_outdated(data_files__in=pk_set)
+        elif action == "pre_clear":
+            mark_release_dumps_outdated(data_files__dependencies=instance)
+    elif action in ("post_add", "post_remove", "post_clear"):
+        mark_release_dumps_outdated(data_files=instance)
@@ -0,0 +1,294 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Save a dump of the database into a standalone SQLite file.
+
+A snapshot contains the same information as a JSON dump (see
+:func:`browse.models.build_schema`), but it is stored in indexed tables
+that can be queried without loading the whole file, using any SQLite
+client::
+
+    SELECT data_files.name, data_files.metadata
+    FROM data_files
+    JOIN quantities ON quantities.uuid = data_files.quantity_uuid
+    WHERE quantities.path GLOB 'satellite/MFT/*'
+
+Entities and quantities have a materialized ``path`` column containing
+the names of all their ancestors joined by ``/`` (the same path used by
+the ``/tree/`` URLs), and the metadata of data files are saved as JSON
+text, which can be queried with the JSON functions of SQLite. Use
+``GLOB`` instead of ``LIKE`` to search paths, as ``LIKE`` is not case
+sensitive and cannot use the indexes. The table ``snapshot_info``
+contains the header of the dump and the version of the layout.
+"""
+
+import json
+from pathlib import Path
+import sqlite3
+from typing import Iterable, List, Optional, Tuple
+
+# Increase this whenever the layout of the tables changes
+SNAPSHOT_LAYOUT_VERSION = 1
+
+# Number of rows inserted with each call to `executemany`
+SNAPSHOT_BATCH_SIZE = 1000
+
+SNAPSHOT_TABLES = """
+CREATE TABLE snapshot_info (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+
+CREATE TABLE entities (
+    uuid TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    parent_uuid TEXT REFERENCES entities (uuid),
+    path TEXT NOT NULL,
+    depth INTEGER NOT NULL
+);
+
+CREATE TABLE format_specifications (
+    uuid TEXT PRIMARY KEY,
+    document_ref TEXT NOT NULL,
+    title TEXT,
+    doc_file_name TEXT,
+    file_mime_type TEXT,
+    doc_mime_type TEXT,
+    file_path TEXT
+);
+
+CREATE TABLE quantities (
+    uuid TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    format_spec_uuid TEXT REFERENCES format_specifications (uuid),
+    entity_uuid TEXT NOT NULL REFERENCES entities (uuid),
+    path TEXT
+);
+
+CREATE TABLE data_files (
+    uuid TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    upload_date TEXT,
+    quantity_uuid TEXT NOT NULL REFERENCES quantities (uuid),
+    spec_version TEXT,
+    metadata TEXT,
+    file_name TEXT,
+    plot_file TEXT,
+    plot_mime_type TEXT
+);
+
+CREATE TABLE dependencies (
+    data_file_uuid TEXT NOT NULL REFERENCES data_files (uuid),
+    dependency_uuid TEXT NOT NULL,
+    PRIMARY KEY (data_file_uuid, dependency_uuid)
+);
+
+CREATE TABLE releases (
+    tag TEXT PRIMARY KEY,
+    release_date TEXT,
+    comment TEXT,
+    release_document_mime_type TEXT,
+    release_document TEXT
+);
+
+CREATE TABLE release_data_files (
+    tag TEXT NOT NULL REFERENCES releases (tag),
+    data_file_uuid TEXT NOT NULL,
+    PRIMARY KEY (tag, data_file_uuid)
+);
+"""
+
+# Indexes are created once all the rows have been inserted, which is
+# faster than updating them after each insertion
+SNAPSHOT_INDEXES = """
+CREATE INDEX entities_path ON entities (path);
+CREATE INDEX entities_parent ON entities (parent_uuid);
+CREATE INDEX quantities_path ON quantities (path);
+CREATE INDEX quantities_entity ON quantities (entity_uuid);
+CREATE INDEX data_files_quantity ON data_files (quantity_uuid);
+CREATE INDEX data_files_name ON data_files (name);
+CREATE INDEX dependencies_dependency ON dependencies (dependency_uuid);
+CREATE INDEX release_data_files_data_file ON release_data_files (data_file_uuid);
+"""
+
+
+def _text(value) -> Optional[str]:
+    # Values wrapped in `Quoted` keep the original object: this way,
+    # missing fields are saved as NULL instead of the string "None"
+    value = getattr(value, "value", value)
+    return None if value is None else str(value)
+
+
+def _entity_rows(
+    entities, parent_uuid: Optional[str] = None, parent_path: str = "", depth: int = 0
+) -> Iterable[Tuple]:
+    for cur_entity in entities:
+        path = (
+            f"{parent_path}/{cur_entity['name']}" if parent_path else cur_entity["name"]
+        )
+        yield (
+            _text(cur_entity["uuid"]),
+            _text(cur_entity["name"]),
+            parent_uuid,
+            path,
+            depth,
+        )
+
+        yield from _entity_rows(
+            cur_entity.get("children", []),
+            parent_uuid=_text(cur_entity["uuid"]),
+            parent_path=path,
+            depth=depth + 1,
+        )
+
+
+def _insert(
+    connection: sqlite3.Connection, table: str, num_of_columns: int, rows: Iterable
+) -> None:
+    placeholders = ", ".join(["?"] * num_of_columns)
+    statement = f"INSERT INTO {table} VALUES ({placeholders})"
+
+    batch = []  # type: List[Tuple]
+    for cur_row in rows:
+        batch.append(cur_row)
+        if len(batch) >= SNAPSHOT_BATCH_SIZE:
+            connection.executemany(statement, batch)
+            batch = []
+
+    if batch:
+        connection.executemany(statement, batch)
+
+
+def _insert_data_files(connection: sqlite3.Connection, data_files) -> None:
+    # Data files and their dependencies are inserted while the records are
+    # produced, so that only a batch of them is kept in memory
+    dependencies = []  # type: List[Tuple[str, str]]
+
+    def data_file_rows():
+        for cur_file in data_files:
+            cur_uuid = _text(cur_file["uuid"])
+            dependencies.extend((cur_uuid, _text(x)) for x in cur_file["dependencies"])
+
+            metadata = cur_file.get("metadata")
+            yield (
+                cur_uuid,
+                _text(cur_file["name"]),
+                _text(cur_file["upload_date"]),
+                _text(cur_file["quantity"]),
+                _text(cur_file["spec_version"]),
+                None if metadata is None else json.dumps(metadata),
+                _text(cur_file.get("file_name")),
+                _text(cur_file.get("plot_file")),
+                _text(cur_file.get("plot_mime_type")),
+            )
+
+            if len(dependencies) >= SNAPSHOT_BATCH_SIZE:
+                _insert(connection, "dependencies", 2, dependencies)
+                dependencies.clear()
+
+    _insert(connection, "data_files", 9, data_file_rows())
+    _insert(connection, "dependencies", 2, dependencies)
+
+
+def save_snapshot(schema, output_file_path: Path) -> None:
+    """Save `schema` into a new SQLite file
+
+    The parameter `schema` must have the structure produced by
+    :func:`browse.models.build_schema`; its sections are consumed one
+    record at a time. Any existing file at `output_file_path` is
+    overwritten.
+    """
+
+    output_file_path.unlink(missing_ok=True)
+
+    connection = sqlite3.connect(output_file_path)
+    try:
+        # The file is only usable once it is complete, so there is no
+        # need to protect it against crashes while it is being written
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+
+        with connection:
+            connection.executescript(SNAPSHOT_TABLES)
+
+            info = [("layout_version", str(SNAPSHOT_LAYOUT_VERSION))]
+            info += [(key, str(value)) for key, value in schema["instrumentdb"].items()]
+            _insert(connection, "snapshot_info", 2, info)
+
+            _insert(connection, "entities", 5, _entity_rows(schema["entities"]))
+
+            _insert(
+                connection,
+                "format_specifications",
+                7,
+                (
+                    (
+                        _text(x["uuid"]),
+                        _text(x["document_ref"]),
+                        _text(x["title"]),
+                        _text(x["doc_file_name"]),
+                        _text(x["file_mime_type"]),
+                        _text(x["doc_mime_type"]),
+                        _text(x.get("file_path")),
+                    )
+                    for x in schema["format_specifications"]
+                ),
+            )
+
+            _insert(
+                connection,
+                "quantities",
+                5,
+                (
+                    (
+                        _text(x["uuid"]),
+                        _text(x["name"]),
+                        _text(x["format_spec"]),
+                        _text(x["entity"]),
+                        None,
+                    )
+                    for x in schema["quantities"]
+                ),
+            )
+            connection.execute(
+                """
+                UPDATE quantities SET path = (
+                    SELECT entities.path FROM entities
+                    WHERE entities.uuid = quantities.entity_uuid
+                ) || '/' || name
+                """
+            )
+
+            _insert_data_files(connection, schema["data_files"])
+
+            for cur_release in schema["releases"]:
+                _insert(
+                    connection,
+                    "releases",
+                    5,
+                    [
+                        (
+                            _text(cur_release["tag"]),
+                            _text(cur_release["release_date"]),
+                            _text(cur_release["comment"]),
+                            _text(cur_release.get("release_document_mime_type")),
+                            _text(cur_release.get("release_document")),
+                        )
+                    ],
+                )
+                _insert(
+                    connection,
+                    "release_data_files",
+                    2,
+                    (
+                        (_text(cur_release["tag"]), _text(x))
+                        for x in cur_release["data_files"]
+                    ),
+                )
+
+            connection.executescript(SNAPSHOT_INDEXES)
+
+        # Collect statistics for the query planner
+        connection.execute("ANALYZE")
+    finally:
+        connection.close()
@@ -1,16 +1,28 @@
 # -*- encoding: utf-8 -*-
+from collections import defaultdict
+import hashlib
 import json
 from datetime import datetime
 from datetime import timezone
 import mimetypes
 from math import ceil
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional, Set, Tuple
+from uuid import UUID
 
 from django.contrib.auth import authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import HttpResponse, Http404, FileResponse
+from django.http import (
+    HttpResponse,
+    HttpResponseBadRequest,
+    Http404,
+    FileResponse,
+    StreamingHttpResponse,
+)
+from django.db.models import Count, Prefetch, Q
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
 from django.views.generic.base import View
 from django.views.generic.detail import DetailView
 from django.views.generic.list import ListView
@@ -21,10 +33,31 @@ from rest_framework import viewsets, permissions, status, renderers
 from rest_framework.authentication import SessionAuthentication
 from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.settings import api_settings
 
 import instrumentdb
-from browse.models import Entity, Quantity, DataFile, FormatSpecification, Release
+from browse.archive import ARCHIVE_MIME_TYPES, ArchiveFormat, stream_archive
+from browse.models import (
+    Entity,
+    Quantity,
+    DataFile,
+    FormatSpecification,
+    Release,
+    ReleaseDumpConfiguration,
+    DumpOutputFormat,
+    ContentEncoding,
+    RELEASE_DUMP_ENCODINGS,
+    build_schema,
+    cbor_release_dump_name,
+    compressed_release_dump_name,
+    stream_schema,
+    update_release_file_dump,
+    update_release_path_index,
+)
+from browse.pagination import OptionalKeysetPagination
+from browse.ranges import serve_file
 from browse.serializers import (
+    parse_field_list,
     UserSerializer,
     GroupSerializer,
     FormatSpecificationSerializer,
@@ -49,12 +82,84 @@ from instrumentdb.authentication import (
 
 ADMIN_ONLY_HTTP_METHODS = ["POST", "PUT", "PATCH", "DELETE"]
 
+# Maximum number of paths accepted by the `resolve` action of releases
+MAX_RESOLVED_PATHS = 1000
+
 mimetypes.init()
 
 
 ###########################################################################
 
 
+def not_modified_response(
+    request, etag: str, last_modified: Optional[datetime] = None
+) -> Optional[HttpResponse]:
+    """Return a response if the client's copy of a file is up to date
+
+    The validators `etag` (already quoted) and `last_modified` are
+    compared with the headers ``If-None-Match`` and ``If-Modified-Since``.
+    They must be computed from the database alone, so that a 304 (or
+    412) response is returned without opening the file. If this function
+    returns ``None``, the caller must build the response and pass it to
+    :func:`set_validators`.
+    """
+
+    timestamp = None if last_modified is None else int(last_modified.timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+
+    return response
+
+
+def set_validators(
+    response, etag: str, last_modified: Optional[datetime] = None
+) -> None:
+    "Add the headers ``ETag`` and ``Last-Modified`` to a response"
+
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified.timestamp())
+
+
+def data_file_etag(data_file: DataFile) -> str:
+    "Return a strong ETag for the contents of a data file"
+
+    if data_file.file_data_sha256:
+        return quote_etag(data_file.file_data_sha256)
+
+    # The checksum is unknown for files uploaded before it was saved in
+    # the database; their contents cannot change without a new upload
+    return quote_etag(
+        "{0}-{1}".format(
+            data_file.uuid.hex, int(data_file.upload_date.timestamp() * 1_000_000)
+        )
+    )
+
+
+def stored_file_etag(field_file, sha256: str) -> str:
+    """Return a strong ETag for a plot or a specification document
+
+    `sha256` is the checksum of the file saved in the database. The name
+    of the file cannot be used, because django-cleanup deletes the old
+    file after each upload, and a later upload can reuse its name.
+    """
+
+    if not sha256:
+        # Checksums are computed whenever the records are saved, so this
+        # happens only for files that were missing during migration 0016
+        checksum = hashlib.sha256()
+        with field_file.open("rb"):
+            for chunk in field_file.chunks():
+                checksum.update(chunk)
+        sha256 = checksum.hexdigest()
+
+    return quote_etag(sha256)
+
+
+###########################################################################
+
+
 class UserView(DetailView):
     model = User
     template_name = "browse/user_detail.html"
@@ -131,20 +236,25 @@ class FormatSpecificationDownloadView(LoginRequiredMixin, View):
 
         cur_object = get_object_or_404(FormatSpecification, pk=pk)
         file_data = cur_object.doc_file
-
-        try:
-            file_data.open()
-        except ValueError:
+        if not file_data:
             raise Http404(
                 "The format specification file was not uploaded to the database"
             )
 
-        data = file_data.read()
-        resp = HttpResponse(data, content_type=cur_object.doc_mime_type)
-
-        resp["Content-Disposition"] = 'filename="{0}"'.format(
-            cur_object.get_sensible_file_name()
+        etag = stored_file_etag(file_data, cur_object.doc_file_sha256)
+        not_modified = not_modified_response(request, etag)
+        if not_modified:
+            return not_modified
+
+        resp = serve_file(
+            request,
+            file_data,
+            content_type=cur_object.doc_mime_type,
+            filename=cur_object.get_sensible_file_name(),
+            as_attachment=False,
+            etag=etag,
         )
+        set_validators(resp, etag)
         return resp
 
 
@@ -154,40 +264,55 @@ class DataFileDownloadView(LoginRequiredMixin, View):
 
         cur_object = get_object_or_404(DataFile, pk=pk)
         file_data = cur_object.file_data
-        try:
-            file_data.open()
-        except ValueError:
+        if not file_data:
             raise Http404("The data file was not uploaded to the database")
 
-        data = file_data.read()
-        resp = HttpResponse(
-            data, content_type=cur_object.quantity.format_spec.file_mime_type
-        )
-        resp["Content-Disposition"] = 'attachment; filename="{0}"'.format(
-            Path(cur_object.name).name
+        etag = data_file_etag(cur_object)
+        not_modified = not_modified_response(request, etag, cur_object.upload_date)
+        if not_modified:
+            return not_modified
+
+        resp = serve_file(
+            request,
+            file_data,
+            content_type=cur_object.quantity.format_spec.file_mime_type,
+            filename=Path(cur_object.name).name,
+            etag=etag,
+            last_modified=cur_object.upload_date,
         )
+        set_validators(resp, etag, cur_object.upload_date)
         return resp
 
 
+def plot_file_name(data_file: DataFile) -> str:
+    "Return the name of the file to be used when downloading a plot"
+
+    ext = mimetypes.guess_extension(data_file.plot_mime_type) or ""
+    return Path(data_file.name).name + ext
+
+
 class DataFilePlotDownloadView(LoginRequiredMixin, View):
     def get(self, request, pk):
         "Allow the user to download the plot associated with a data file"
 
         cur_object = get_object_or_404(DataFile, pk=pk)
         plot_file_data = cur_object.plot_file
-
-        try:
-            plot_file_data.open()
-        except ValueError:
+        if not plot_file_data:
             raise Http404("The plot file was not uploaded to the database")
 
-        data = plot_file_data.read()
-        resp = HttpResponse(data, content_type=cur_object.plot_mime_type)
-
-        resp["Content-Disposition"] = 'attachment; filename="{name}{ext}"'.format(
-            name=Path(cur_object.name).name,
-            ext=mimetypes.guess_extension(cur_object.plot_mime_type),
+        etag = stored_file_etag(plot_file_data, cur_object.plot_file_sha256)
+        not_modified = not_modified_response(request, etag)
+        if not_modified:
+            return not_modified
+
+        resp = serve_file(
+            request,
+            plot_file_data,
+            content_type=cur_object.plot_mime_type,
+            filename=plot_file_name(cur_object),
+            etag=etag,
         )
+        set_validators(resp, etag)
         return resp
 
 
@@ -233,21 +358,147 @@ class ReleaseView(LoginRequiredMixin, DetailView):
         return context
 
 
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """Parse the value of an ``Accept-Encoding`` header
+
+    Return a dictionary associating each coding with its quality value
+    (e.g., ``"gzip;q=0.5, br"`` → ``{"gzip": 0.5, "br": 1.0}``).
+    """
+
+    result = {}
+    for cur_item in header.split(","):
+        coding, *params = [x.strip() for x in cur_item.split(";")]
+        if not coding:
+            continue
+
+        quality = 1.0
+        for cur_param in params:
+            key, _, value = cur_param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+
+        result[coding.lower()] = quality
+
+    return result
+
+
+def choose_release_dump_encoding(request) -> Optional[ContentEncoding]:
+    """Pick the compressed copy of a release dump to send to the client
+
+    Return ``None`` if the client does not accept any of the encodings in
+    ``RELEASE_DUMP_ENCODINGS``.
+    """
+
+    accepted = parse_accept_encoding(request.headers.get("Accept-Encoding", ""))
+    default_quality = accepted.get("*", 0.0)
+
+    best_encoding, best_quality = None, 0.0
+    for cur_encoding in RELEASE_DUMP_ENCODINGS:
+        quality = accepted.get(cur_encoding.name, default_quality)
+        if quality > best_quality:
+            best_encoding, best_quality = cur_encoding, quality
+
+    return best_encoding
+
+
 class ReleaseDownloadView(LoginRequiredMixin, View):
     def get(self, request, pk):
-        "Allow the user to download a release JSON file"
+        """Allow the user to download a release JSON file
+
+        If the client accepts it, one of the compressed copies of the file
+        is sent. The file is streamed from the storage, and since the
+        response has a ``Content-Encoding`` header, ``GZipMiddleware`` does
+        not compress it again.
+
+        The release is sent in CBOR format if the query parameter
+        ``format=cbor`` is set or the client accepts ``application/cbor``.
+
+        Dumps are never rebuilt here, as concurrent requests would build
+        them twice: this is done by ``manage.py updatedb``, by ``manage.py
+        import``, and when releases are saved through the API. Outdated
+        dumps are sent anyway, with the header ``X-Dump-Outdated``.
+        """
 
         cur_object = get_object_or_404(Release, pk=pk)
-        file_data = cur_object.json_file
-        file_data.open()
-        data = file_data.read()
-        resp = HttpResponse(
-            data,
-            content_type="application/json",
+        storage = cur_object.json_file.storage
+
+        # Each representation of the dump (CBOR, or JSON with some
+        # encoding) must have its own ETag
+        use_cbor = request.GET.get("format") == "cbor" or "application/cbor" in (
+            request.headers.get("Accept", "")
         )
-        resp["Content-Disposition"] = 'attachment; filename="schema_{0}.json"'.format(
-            cur_object.tag,
+
+        # Dumps created before the CBOR copy was introduced lack it until
+        # they are rebuilt
+        if not cur_object.json_file or (
+            use_cbor and not storage.exists(cbor_release_dump_name(cur_object))
+        ):
+            return HttpResponse(
+                f"The dump of release {cur_object.tag} has not been "
+                + "created yet, please try again later",
+                status=503,
+                content_type="text/plain",
+            )
+        encoding = None if use_cbor else choose_release_dump_encoding(request)
+        if encoding and not storage.exists(
+            compressed_release_dump_name(cur_object, encoding)
+        ):
+            # Dumps created before the compressed copies were introduced
+            # lack them until they are rebuilt
+            encoding = None
+        if use_cbor:
+            variant = "cbor"
+        else:
+            variant = encoding.name if encoding else "json"
+
+        etag = quote_etag(
+            "{0}-{1}-{2}".format(
+                cur_object.tag,
+                int(cur_object.json_file_date.timestamp() * 1_000_000),
+                variant,
+            )
         )
+        vary_headers = ["Accept"] if use_cbor else ["Accept-Encoding"]
+
+        not_modified = not_modified_response(request, etag, cur_object.json_file_date)
+        if not_modified:
+            patch_vary_headers(not_modified, vary_headers)
+            return not_modified
+
+        if use_cbor:
+            resp = FileResponse(
+                storage.open(cbor_release_dump_name(cur_object), "rb"),
+                content_type="application/cbor",
+                as_attachment=True,
+                filename=f"schema_{cur_object.tag}.cbor",
+            )
+        else:
+            if encoding:
+                file_handle = storage.open(
+                    compressed_release_dump_name(cur_object, encoding), "rb"
+                )
+            else:
+                file_handle = cur_object.json_file.open("rb")
+
+            resp = FileResponse(
+                file_handle,
+                content_type="application/json",
+                as_attachment=True,
+                filename=f"schema_{cur_object.tag}.json",
+            )
+            if encoding:
+                resp["Content-Encoding"] = encoding.name
+
+        if cur_object.json_file_outdated:
+            # Some data files of the release changed after the dump was
+            # created, and "updatedb" has not been run since then
+            resp["X-Dump-Outdated"] = "true"
+
+        set_validators(resp, etag, cur_object.json_file_date)
+        patch_vary_headers(resp, vary_headers)
         return resp
 
 
@@ -268,6 +519,64 @@ class PassthroughRenderer(renderers.BaseRenderer):
         return data
 
 
+class SparseFieldsViewSetMixin:
+    """Pass the query parameters ``fields`` and ``expand`` to the serializer
+
+    Both parameters are comma-separated lists of field names (see
+    ``SparseFieldsMixin``) and are only used in ``GET`` requests. The
+    dictionary ``expand_plans`` maps each field that can be expanded to
+    the arguments of ``select_related`` and ``prefetch_related`` needed
+    to serialize it without additional queries.
+    """
+
+    expand_plans: Dict[str, Tuple[List[str], List[Prefetch]]] = {}
+
+    def get_query_field_list(self, name: str) -> Optional[List[str]]:
+        if self.request is None or self.request.method not in ("GET", "HEAD"):
+            return None
+
+        return parse_field_list(self.request.query_params.get(name))
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault("fields", self.get_query_field_list("fields"))
+        kwargs.setdefault("expand", self.get_query_field_list("expand"))
+        return super().get_serializer(*args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+
+        # Expanding "a.b" implies expanding "a" as well
+        paths = set()
+        for cur_path in self.get_query_field_list("expand") or []:
+            components = cur_path.split(".")
+            paths.update(".".join(components[: i + 1]) for i in range(len(components)))
+
+        for cur_path in sorted(paths):
+            if cur_path in self.expand_plans:
+                select_lookups, prefetch_lookups = self.expand_plans[cur_path]
+                queryset = queryset.select_related(*select_lookups).prefetch_related(
+                    *prefetch_lookups
+                )
+
+        return queryset
+
+
+# Hyperlinks only need the primary key of the related objects, so the
+# prefetched querysets load as few columns as possible (plus the foreign
+# key used to match them with their parents)
+ENTITY_PREFETCHES = [
+    ("children", Entity.objects.only("uuid", "name", "parent")),
+    ("quantities", Quantity.objects.only("uuid", "parent_entity")),
+]
+
+
+def entity_prefetches(prefix: str = "") -> List[Prefetch]:
+    return [
+        Prefetch(prefix + name, queryset=queryset)
+        for name, queryset in ENTITY_PREFETCHES
+    ]
+
+
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
@@ -290,7 +599,7 @@ class GroupViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAdminUser]
 
 
-class FormatSpecificationViewSet(viewsets.ModelViewSet):
+class FormatSpecificationViewSet(SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     authentication_classes = [
         instrumentdb.authentication.ExpiringTokenAuthentication,
         SessionAuthentication,
@@ -312,18 +621,26 @@ class FormatSpecificationViewSet(viewsets.ModelViewSet):
         if not instance.doc_file:
             raise Http404()
 
-        file_handle = instance.doc_file.open()
-        response = FileResponse(file_handle, content_type=instance.doc_mime_type)
-        response["Content-Length"] = instance.doc_file.size
-        response["Content-Disposition"] = (
-            f'attachment; filename="{instance.doc_file_name}"'
+        etag = stored_file_etag(instance.doc_file, instance.doc_file_sha256)
+        not_modified = not_modified_response(request, etag)
+        if not_modified:
+            return not_modified
+
+        response = serve_file(
+            request,
+            instance.doc_file,
+            content_type=instance.doc_mime_type,
+            filename=instance.get_sensible_file_name(),
+            etag=etag,
         )
+        set_validators(response, etag)
         return response
 
 
-class EntityViewSet(viewsets.ModelViewSet):
-    queryset = Entity.objects.all()
+class EntityViewSet(SparseFieldsViewSetMixin, viewsets.ModelViewSet):
+    queryset = Entity.objects.prefetch_related(*entity_prefetches())
     serializer_class = EntitySerializer
+    pagination_class = OptionalKeysetPagination
 
     authentication_classes = [
         instrumentdb.authentication.ExpiringTokenAuthentication,
@@ -336,13 +653,8 @@ class EntityViewSet(viewsets.ModelViewSet):
             return [permissions.IsAdminUser()]
         return [permissions.IsAuthenticated()]
 
-    def retrieve(self, request, pk):
-        ent = get_object_or_404(Entity, pk=pk)
-        serializer = EntitySerializer(ent, context={"request": request})
-        return Response(serializer.data)
-
 
-class QuantityViewSet(viewsets.ModelViewSet):
+class QuantityViewSet(SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     authentication_classes = [
         instrumentdb.authentication.ExpiringTokenAuthentication,
         SessionAuthentication,
@@ -354,11 +666,18 @@ class QuantityViewSet(viewsets.ModelViewSet):
             return [permissions.IsAdminUser()]
         return [permissions.IsAuthenticated()]
 
-    queryset = Quantity.objects.all()
+    queryset = Quantity.objects.prefetch_related(
+        Prefetch("data_files", queryset=DataFile.objects.only("uuid", "quantity"))
+    )
     serializer_class = QuantitySerializer
+    pagination_class = OptionalKeysetPagination
+    expand_plans = {
+        "format_spec": (["format_spec"], []),
+        "parent_entity": (["parent_entity"], entity_prefetches("parent_entity__")),
+    }
 
 
-class DataFileViewSet(viewsets.ModelViewSet):
+class DataFileViewSet(SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     authentication_classes = [
         instrumentdb.authentication.ExpiringTokenAuthentication,
         SessionAuthentication,
@@ -376,37 +695,76 @@ class DataFileViewSet(viewsets.ModelViewSet):
         if not instance.file_data:
             raise Http404()
 
-        file_handle = instance.file_data.open()
-        response = FileResponse(
-            file_handle, content_type=instance.quantity.format_spec.file_mime_type
+        etag = data_file_etag(instance)
+        not_modified = not_modified_response(request, etag, instance.upload_date)
+        if not_modified:
+            return not_modified
+
+        response = serve_file(
+            request,
+            instance.file_data,
+            content_type=instance.quantity.format_spec.file_mime_type,
+            filename=instance.name,
+            etag=etag,
+            last_modified=instance.upload_date,
         )
-        response["Content-Length"] = instance.file_data.size
-        response["Content-Disposition"] = f'attachment; filename="{instance.name}"'
+        set_validators(response, etag, instance.upload_date)
         return response
 
     @action(methods=["get"], detail=True, renderer_classes=(PassthroughRenderer,))
     def plot(self, request, *args, **kwargs):
         instance = self.get_object()
-        if not instance.plot_file_data:
+        if not instance.plot_file:
             raise Http404()
 
-        file_handle = instance.file_data.open()
-        response = FileResponse(file_handle, content_type=instance.plot_mime_type)
-        response["Content-Length"] = instance.file_data.size
-        response["Content-Disposition"] = f'attachment; filename="{instance.name}"'
+        etag = stored_file_etag(instance.plot_file, instance.plot_file_sha256)
+        not_modified = not_modified_response(request, etag)
+        if not_modified:
+            return not_modified
+
+        response = serve_file(
+            request,
+            instance.plot_file,
+            content_type=instance.plot_mime_type,
+            filename=plot_file_name(instance),
+            etag=etag,
+        )
+        set_validators(response, etag)
         return response
 
-    queryset = DataFile.objects.all()
+    queryset = DataFile.objects.prefetch_related(
+        Prefetch("dependencies", queryset=DataFile.objects.only("uuid")),
+        Prefetch("release_tags", queryset=Release.objects.only("tag")),
+    )
     serializer_class = DataFileSerializer
+    pagination_class = OptionalKeysetPagination
+    expand_plans = {
+        "quantity": (
+            ["quantity"],
+            [
+                Prefetch(
+                    "quantity__data_files",
+                    queryset=DataFile.objects.only("uuid", "quantity"),
+                )
+            ],
+        ),
+        "quantity.format_spec": (["quantity__format_spec"], []),
+        "quantity.parent_entity": (
+            ["quantity__parent_entity"],
+            entity_prefetches("quantity__parent_entity__"),
+        ),
+    }
 
 
 class ReleasePagination(PageNumberPagination):
-    page_size = 1
+    # Releases list the number of their data files but not the files
+    # themselves (see the `data_files` action), so pages can be large
+    page_size = 25
     page_size_query_param = "page_size"
-    max_page_size = 3
+    max_page_size = 100
 
 
-class ReleaseViewSet(viewsets.ModelViewSet):
+class ReleaseViewSet(SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     # Enable dots to be used in release tag names. See
     # https://stackoverflow.com/questions/27963899/django-rest-framework-using-dot-in-url
 
@@ -417,73 +775,308 @@ class ReleaseViewSet(viewsets.ModelViewSet):
     pagination_class = ReleasePagination
 
     def get_permissions(self):
-        if self.request.method in ADMIN_ONLY_HTTP_METHODS:
+        # Resolving paths does not modify the release, but it uses POST
+        # because the list of paths can be long
+        if self.request.method in ADMIN_ONLY_HTTP_METHODS and self.action != "resolve":
             return [permissions.IsAdminUser()]
         return [permissions.IsAuthenticated()]
 
     lookup_value_regex = "[\\w.]+"
-    queryset = Release.objects.all()
+    queryset = Release.objects.annotate(num_of_data_files=Count("data_files")).order_by(
+        "-rel_date", "tag"
+    )
     serializer_class = ReleaseSerializer
 
+    # Releases are created and modified rarely, but their path index is
+    # used by every request to /releases/TAG/PATH, and their dump by every
+    # download: both are rebuilt here, as GET requests never write them
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        update_release_file_dump(serializer.instance)
+        update_release_path_index(serializer.instance)
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        update_release_file_dump(serializer.instance)
+        update_release_path_index(serializer.instance)
+
+    @action(methods=["get"], detail=True, url_path="data_files", url_name="data-files")
+    def data_files(self, request, *args, **kwargs):
+        """Return the data files belonging to the release, one page at a time
+
+        The list can be filtered using the query parameters ``quantity``
+        (the UUID of a quantity) and ``name`` (the name of the data file).
+        """
+        instance = self.get_object()
+        data_files = DataFileViewSet.queryset.filter(release_tags=instance)
+
+        quantity = request.query_params.get("quantity")
+        if quantity is not None:
+            try:
+                data_files = data_files.filter(quantity=UUID(quantity))
+            except ValueError:
+                return Response(
+                    {"error": f"'{quantity}' is not a valid UUID"},
+                    status=HTTP_400_BAD_REQUEST,
+                )
+
+        name = request.query_params.get("name")
+        if name is not None:
+            data_files = data_files.filter(name=name)
+
+        # `ReleasePagination` is meant for releases: data files use the
+        # same pagination as `/api/data_files/`
+        paginator = api_settings.DEFAULT_PAGINATION_CLASS()
+        page = paginator.paginate_queryset(data_files, request, view=self)
+        serializer = DataFileSerializer(
+            page, many=True, context=self.get_serializer_context()
+        )
+        return paginator.get_paginated_response(serializer.data)
+
+    # The archive is returned as a plain Django response; the JSON
+    # renderer is only used for errors (e.g., missing credentials)
+    @action(
+        methods=["get"],
+        detail=True,
+        renderer_classes=(renderers.JSONRenderer, PassthroughRenderer),
+    )
+    def bundle(self, request, *args, **kwargs):
+        """Download the release together with all its attachments
+
+        The archive is built while it is being sent. Its format is chosen
+        through the query parameter ``archive`` (``tar`` or ``zip``). If
+        the parameter ``from`` is set to the tag of another release, the
+        archive contains the delta between the two releases and only the
+        attachments of the data files that have been added.
+        """
+        instance = self.get_object()
+        delta_from = self.get_delta_from()
+
+        try:
+            archive_format = ArchiveFormat(request.query_params.get("archive", "tar"))
+        except ValueError:
+            return HttpResponseBadRequest(
+                "Unsupported archive format, use one of the following: "
+                + ", ".join(x.value for x in ArchiveFormat)
+            )
+
+        configuration = ReleaseDumpConfiguration(
+            no_attachments=False,
+            only_tree=False,
+            exist_ok=True,
+            skip_empty_entities=False,
+            skip_empty_quantities=False,
+            output_format=DumpOutputFormat.JSON,
+            output_folder=Path(),
+        )
+
+        response = StreamingHttpResponse(
+            stream_archive(
+                configuration,
+                archive_format,
+                release_tag=instance.tag,
+                delta_from=delta_from,
+            ),
+            content_type=ARCHIVE_MIME_TYPES[archive_format],
+        )
+        base_name = (
+            f"delta_{delta_from}_{instance.tag}"
+            if delta_from
+            else f"release_{instance.tag}"
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="{base_name}.{archive_format.value}"'
+        )
+        return response
+
+    @action(methods=["post"], detail=True)
+    def resolve(self, request, *args, **kwargs):
+        """Return the data files in the release matching a list of paths
+
+        The body of the request must contain the key ``paths``, a list of
+        strings like ``satellite/LFT/cad`` (the sequence of entities followed
+        by the name of the quantity), like the ones used by the
+        ``releases/TAG/PATH/`` URLs. The result maps each path to the full
+        record of its data file in the release (the query parameter
+        ``fields`` can be used to trim them); paths that do not match any
+        data file are listed in ``missing``. Like ``releases/TAG/PATH/``,
+        paths matching more than one data file in the release are treated
+        as errors and listed in ``ambiguous``.
+        """
+        instance = self.get_object()
+
+        paths = request.data.get("paths")
+        if not isinstance(paths, list) or not all(isinstance(x, str) for x in paths):
+            return Response(
+                {"error": "'paths' must be a list of strings"},
+                status=HTTP_400_BAD_REQUEST,
+            )
+
+        if len(paths) > MAX_RESOLVED_PATHS:
+            return Response(
+                {"error": f"no more than {MAX_RESOLVED_PATHS} paths can be resolved"},
+                status=HTTP_400_BAD_REQUEST,
+            )
+
+        normalized = {}  # type: Dict[str, str]
+        for cur_path in paths:
+            cur_normalized = normalize_path(cur_path)
+            # A path must contain at least one entity and the quantity
+            if "/" in cur_normalized:
+                normalized[cur_path] = cur_normalized
+
+        # A path can match more than one data file, if its quantity has
+        # several files in the release or if two sibling entities share
+        # the same name
+        matches = find_release_data_files(instance, set(normalized.values()))
+        data_files = DataFileViewSet.queryset.in_bulk(
+            [x[0] for x in matches.values() if len(x) == 1]
+        )
+
+        serializer = DataFileSerializer(
+            context=self.get_serializer_context(),
+            fields=parse_field_list(request.query_params.get("fields")),
+        )
+        result = {}
+        missing = []
+        ambiguous = []
+        for cur_path in paths:
+            cur_matches = matches.get(normalized.get(cur_path), [])
+            if len(cur_matches) == 1:
+                result[cur_path] = serializer.to_representation(
+                    data_files[cur_matches[0]]
+                )
+            elif cur_matches:
+                ambiguous.append(cur_path)
+            else:
+                missing.append(cur_path)
+
+        return Response(
+            {
+                "release": instance.tag,
+                "data_files": result,
+                "missing": missing,
+                "ambiguous": ambiguous,
+            }
+        )
+
+    def get_delta_from(self) -> Optional[str]:
+        "Return the release passed in the query parameter ``from``, if any"
+
+        tag = self.request.query_params.get("from")
+        if tag is None:
+            return None
+
+        return get_object_or_404(Release, tag=tag).tag
+
+    @action(methods=["get"], detail=True)
+    def delta(self, request, *args, **kwargs):
+        """Return the differences between a release and the one passed in ``from``
+
+        The result is a JSON document produced by ``build_delta_schema``,
+        which is built while it is being sent. Use the ``bundle`` action to
+        get the attachments of the new data files as well.
+        """
+        instance = self.get_object()
+        delta_from = self.get_delta_from()
+        if delta_from is None:
+            return Response(
+                {"error": "the query parameter 'from' is required"},
+                status=HTTP_400_BAD_REQUEST,
+            )
+
+        configuration = ReleaseDumpConfiguration(
+            no_attachments=True,
+            only_tree=False,
+            exist_ok=True,
+            skip_empty_entities=False,
+            skip_empty_quantities=False,
+            output_format=DumpOutputFormat.JSON,
+            output_folder=Path(),
+        )
+
+        return StreamingHttpResponse(
+            stream_schema(
+                build_schema(
+                    configuration, release_tag=instance.tag, delta_from=delta_from
+                ),
+                DumpOutputFormat.JSON,
+            ),
+            content_type="application/json",
+        )
+
 
 ################################################################################
 
 
+def normalize_path(path: str) -> str:
+    """Remove empty components from a path like ``satellite/LFT/cad``
+
+    This is the case if e.g. the caller mistakenly writes two ``/``
+    characters, like in ``/tree/satellite//telescope/cad``.
+    """
+    return "/".join(x for x in path.split("/") if x != "")
+
+
 def navigate_tree_of_entities(url_components: List[str]) -> Entity:
-    # Filter out empty components. (This can be the case if e.g. the
-    # caller mistakenly writes two `/` characters, like in
-    # `/tree/satellite//telescope/cad`.)
-    url_components = [x for x in url_components if x != ""]
+    """Return the quantity or the entity matching a path
+
+    The path is looked up in the materialized paths of quantities and
+    entities (see :attr:`browse.models.Entity.path`), so that the cost
+    does not depend on its depth. If a quantity and an entity have the
+    same path, the quantity is returned.
+    """
 
-    if not url_components:
+    path = normalize_path("/".join(url_components))
+    if not path:
         raise Http404("Empty path to entity")
 
-    matching_entries = Entity.objects.filter(name=url_components[0])
+    # Quantities can only be children of other entities
+    if "/" in path:
+        quantities = list(Quantity.objects.filter(path=path)[:2])
+        if len(quantities) == 1:
+            return quantities[0]
 
-    # We are looking for a root node
-    depth0_entry = None
-    for cur_entry in matching_entries:
-        if cur_entry.is_root_node():
-            if depth0_entry is None:
-                depth0_entry = cur_entry
-            else:
-                raise Http404(f"more than one root node with name {url_components[0]}")
+        if len(quantities) > 1:
+            raise ValueError(f"More than one quantity matched the path {path}")
 
-    cur_obj = depth0_entry
+    entities = list(Entity.objects.filter(path=path)[:2])
+    if not entities:
+        raise Http404(f"No entity found with path {path}")
 
-    if len(url_components) == 1:
-        return cur_obj
+    if len(entities) > 1:
+        raise ValueError(f"More than one entity matched the path {path}")
 
-    try:
-        for comp in url_components[1:-1]:
-            cur_obj = cur_obj.get_children().get(name=comp)
-    except (Entity.DoesNotExist, AttributeError):
-        raise ValueError("Invalid path {}".format("/".join(url_components)))
-
-    last_name = url_components[-1]
-    if last_name.endswith("/"):
-        last_name = last_name[:-1]
-
-    if cur_obj is None:
-        raise ValueError(
-            "no matching item for path '{}'".format("/".join(url_components))
+    return entities[0]
+
+
+def find_release_data_files(release: Release, paths: Set[str]) -> Dict[str, List[UUID]]:
+    """Return the UUIDs of the data files in `release` matching each path
+
+    The paths must be normalized (see :func:`normalize_path`); those that
+    do not match any data file are not included in the result. The path
+    index of the release is used, with one lookup for all the paths.
+
+    The index is rebuilt when releases are saved through the API and by
+    the "import" and "updatedb" commands, never here, as GET requests must
+    not write to the database. If the release has changed since then, the
+    data files are looked up through the paths of their quantities.
+    """
+
+    if release.path_index_outdated:
+        rows = DataFile.objects.filter(
+            release_tags=release, quantity__path__in=paths
+        ).values_list("quantity__path", "uuid")
+    else:
+        rows = release.path_index.filter(path__in=paths).values_list(
+            "path", "data_file_id"
         )
 
-    try:
-        return cur_obj.quantities.get(name=last_name)
-    except Quantity.DoesNotExist:
-        matching_entries = Entity.objects.filter(name=last_name, parent=cur_obj)
-        if len(matching_entries) == 0:
-            raise Http404(
-                f"No entity found with name {last_name} in URL {'/'.join(url_components)}"
-            )
-        if len(matching_entries) > 1:
-            raise ValueError(
-                f"More than one entry matched the name {last_name} "
-                f"in the children of {cur_obj.name}"
-            )
+    result = defaultdict(list)  # type: Dict[str, List[UUID]]
+    for cur_path, cur_uuid in rows:
+        result[cur_path].append(cur_uuid)
 
-        return matching_entries[0]
+    return result
 
 
 def api_response_error(message: str, status: int) -> HttpResponse:
@@ -532,25 +1125,26 @@ def release_view(request, rel_name: str, reference: str, browse_view=False):
     #               |                      |
     #      sequence of entities         quantity
 
-    url_components = reference.split("/")
+    path = normalize_path(reference)
 
-    try:
-        cur_obj = navigate_tree_of_entities(url_components=url_components[:-1])
+    data_file_uuids = find_release_data_files(release, {path}).get(path, [])
+    if not data_file_uuids:
+        return api_response_error(
+            message=f"No data file found with path {path} in release {release.tag}",
+            status=status.HTTP_400_BAD_REQUEST,
+        )
 
-        quantity_name = url_components[-1]
-        quantity = get_object_or_404(cur_obj.quantities, name=quantity_name)
-        data_file = get_object_or_404(
-            quantity.data_files, release_tags__tag=release.tag
+    if len(data_file_uuids) > 1:
+        return api_response_error(
+            message=f"More than one data file matched the path {path} "
+            f"in release {release.tag}",
+            status=status.HTTP_400_BAD_REQUEST,
         )
-    except ValueError as err:
-        return api_response_error(message=str(err), status=status.HTTP_400_BAD_REQUEST)
-    except Http404 as err:
-        return api_response_error(message=str(err), status=status.HTTP_400_BAD_REQUEST)
 
     if browse_view:
-        return redirect("data-file-view", data_file.uuid)
+        return redirect("data-file-view", data_file_uuids[0])
     else:
-        return redirect("datafile-detail", data_file.uuid)
+        return redirect("datafile-detail", data_file_uuids[0])
 
 
 def api_release_view(request, rel_name, reference):
@@ -119,7 +119,10 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
-    "django.middleware.gzip.GZipMiddleware",
+    "browse.middleware.RangeAwareGZipMiddleware",
+    # This must come after RangeAwareGZipMiddleware, so that ETags are
+    # computed from the uncompressed contents of the responses
+    "django.middleware.http.ConditionalGetMiddleware",
 ]
 
 ROOT_URLCONF = "instrumentdb.urls"
@@ -1,7 +1,30 @@
 # -*- encoding: utf-8 -*-
+from contextlib import redirect_stdout
+import gzip
+import io
+import json
+from unittest import mock
+
+import cbor2
+from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.test import TestCase
-from browse.models import Entity, Quantity, DataFile, FormatSpecification
+from django.urls import reverse
+from browse.models import (
+    Entity,
+    Quantity,
+    DataFile,
+    FormatSpecification,
+    Release,
+    ReleasePathIndex,
+    RELEASE_DUMP_ENCODINGS,
+    cbor_release_dump_name,
+    compressed_release_dump_name,
+    update_release_file_dumps,
+    update_release_path_indexes,
+)
 
 
 class RelationshipsTestCase(TestCase):
@@ -74,6 +97,40 @@ class RelationshipsTestCase(TestCase):
             grasp_beam.format_spec.document_ref != synth_beam.format_spec.document_ref
         )
 
+    def test_paths(self):
+        fp = Entity.objects.get(name="rtc_focal_plane")
+        beam = Entity.objects.get(name="rtc_beam")
+        grasp_beam = Quantity.objects.get(name="rtc_grasp_beam")
+        assert beam.path == "rtc_focal_plane/rtc_beam"
+        assert grasp_beam.path == "rtc_focal_plane/rtc_beam/rtc_grasp_beam"
+        assert (
+            DataFile.objects.get(name="rtc_grasp_beam.fits").full_path
+            == "rtc_focal_plane/rtc_beam/rtc_grasp_beam/rtc_grasp_beam.fits"
+        )
+
+        # Renaming an entity must update the paths of its descendants
+        fp.name = "rtc_instrument"
+        fp.save()
+        assert Entity.objects.get(name="rtc_beam").path == "rtc_instrument/rtc_beam"
+        assert Quantity.objects.get(name="rtc_synth_beam").path == (
+            "rtc_instrument/rtc_beam/rtc_synth_beam"
+        )
+
+        # Moving an entity, either by changing its parent or by calling
+        # `move_to`, must update the paths as well
+        telescope = Entity.objects.create(name="rtc_telescope")
+        beam = Entity.objects.get(name="rtc_beam")
+        beam.parent = telescope
+        beam.save()
+        assert Quantity.objects.get(name="rtc_grasp_beam").path == (
+            "rtc_telescope/rtc_beam/rtc_grasp_beam"
+        )
+
+        beam.move_to(Entity.objects.get(name="rtc_instrument"))
+        assert Quantity.objects.get(name="rtc_grasp_beam").path == (
+            "rtc_instrument/rtc_beam/rtc_grasp_beam"
+        )
+
     def test_bad_names(self):
         with self.assertRaises(ValidationError):
             Entity.name.field.run_validators(value="wrong name with spaces")
@@ -94,3 +151,316 @@ class RelationshipsTestCase(TestCase):
 
         assert synth_file.dependencies.count() == 1
         assert synth_file.dependencies.all()[0] == grasp_file
+
+
+class ReleaseDumpTestCase(TestCase):
+    def setUp(self):
+        entity = Entity.objects.create(name="rdt_entity", parent=None)
+        spec = FormatSpecification.objects.create(
+            document_ref="RDT-DOC-REF-001",
+            title="Test document",
+            file_mime_type="application/json",
+        )
+        quantity = Quantity.objects.create(
+            name="rdt_quantity", format_spec=spec, parent_entity=entity
+        )
+
+        self.file1 = DataFile.objects.create(
+            name="file1", quantity=quantity, spec_version="1.0"
+        )
+        self.file2 = DataFile.objects.create(
+            name="file2", quantity=quantity, spec_version="1.0"
+        )
+
+        self.release1 = Release.objects.create(tag="v1.0")
+        self.release1.data_files.add(self.file1)
+        self.release2 = Release.objects.create(tag="v2.0")
+        self.release2.data_files.add(self.file2)
+
+        update_release_file_dumps()
+
+    def outdated_tags(self):
+        return set(
+            Release.objects.filter(json_file_outdated=True).values_list(
+                "tag", flat=True
+            )
+        )
+
+    def test_dumps_are_up_to_date(self):
+        for cur_release in Release.objects.all():
+            self.assertFalse(cur_release.json_file_outdated)
+            self.assertTrue(bool(cur_release.json_file))
+
+        self.assertEqual(update_release_file_dumps(), [])
+
+    def test_new_release(self):
+        release = Release.objects.create(tag="v3.0")
+        self.assertTrue(release.json_file_outdated)
+        self.assertFalse(bool(release.json_file))
+        self.assertEqual([x[0] for x in update_release_file_dumps()], ["v3.0"])
+
+    def test_data_file_changes(self):
+        self.file1.comment = "Updated"
+        self.file1.save()
+        self.assertEqual(self.outdated_tags(), {"v1.0"})
+
+    def test_membership_changes(self):
+        self.file1.release_tags.add(self.release2)
+        self.assertEqual(self.outdated_tags(), {"v2.0"})
+
+        update_release_file_dumps()
+        self.release1.data_files.clear()
+        self.assertEqual(self.outdated_tags(), {"v1.0"})
+
+    def test_dependency_changes(self):
+        self.file2.dependencies.add(self.file1)
+        self.assertEqual(self.outdated_tags(), {"v2.0"})
+
+        update_release_file_dumps()
+        self.file1.datafile_set.clear()
+        self.assertEqual(self.outdated_tags(), {"v2.0"})
+
+    def test_schema_changes(self):
+        # Every dump contains all the entities, quantities and format
+        # specifications, even if no data file of the release uses them
+        entity = Entity.objects.get(name="rdt_entity")
+        entity.name = "rdt_renamed"
+        entity.save()
+        self.assertEqual(self.outdated_tags(), {"v1.0", "v2.0"})
+
+        update_release_file_dumps()
+        release = Release.objects.get(tag="v1.0")
+        dump = json.loads(release.json_file.read())
+        self.assertEqual(dump["entities"][0]["name"], "rdt_renamed")
+
+        quantity = Quantity.objects.get(name="rdt_quantity")
+        quantity.name = "rdt_renamed_quantity"
+        quantity.save()
+        self.assertEqual(self.outdated_tags(), {"v1.0", "v2.0"})
+
+        update_release_file_dumps()
+        spec = FormatSpecification.objects.get()
+        spec.title = "New title"
+        spec.save()
+        self.assertEqual(self.outdated_tags(), {"v1.0", "v2.0"})
+
+        update_release_file_dumps()
+        Entity.objects.create(name="rdt_other", parent=None).delete()
+        self.assertEqual(self.outdated_tags(), {"v1.0", "v2.0"})
+
+    def test_data_file_deleted(self):
+        self.file1.delete()
+        self.assertEqual(self.outdated_tags(), {"v1.0"})
+
+    def test_failed_dump(self):
+        self.file1.comment = "Updated"
+        self.file1.save()
+
+        with mock.patch("browse.models.dump_release", side_effect=OSError("full")):
+            with self.assertRaises(OSError):
+                update_release_file_dumps()
+
+        # The release must be dumped again the next time
+        self.assertEqual(self.outdated_tags(), {"v1.0"})
+        self.assertEqual([x[0] for x in update_release_file_dumps()], ["v1.0"])
+
+    def test_path_index(self):
+        self.assertEqual(set(update_release_path_indexes()), {"v1.0", "v2.0"})
+        self.assertEqual(update_release_path_indexes(), [])
+
+        # Rebuilding an index never duplicates its rows
+        update_release_path_indexes(force=True)
+        self.assertEqual(ReleasePathIndex.objects.count(), 2)
+        self.assertEqual(
+            list(
+                ReleasePathIndex.objects.filter(release=self.release1).values_list(
+                    "path", "data_file"
+                )
+            ),
+            [("rdt_entity/rdt_quantity", self.file1.uuid)],
+        )
+
+        # Changes in the membership must flag the index
+        self.file1.release_tags.add(self.release2)
+        self.assertEqual(update_release_path_indexes(), ["v2.0"])
+        self.assertEqual(self.release2.path_index.count(), 2)
+
+        # Renaming an entity changes the paths of all the releases
+        entity = Entity.objects.get(name="rdt_entity")
+        entity.name = "rdt_renamed"
+        entity.save()
+        self.assertEqual(set(update_release_path_indexes()), {"v1.0", "v2.0"})
+        self.assertEqual(
+            set(ReleasePathIndex.objects.values_list("path", flat=True)),
+            {"rdt_renamed/rdt_quantity"},
+        )
+
+    def test_updatedb(self):
+        self.file2.comment = "Updated"
+        self.file2.save()
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            call_command("updatedb", "--list-stale")
+        self.assertEqual(output.getvalue().split(), ["v2.0"])
+        self.assertEqual(self.outdated_tags(), {"v2.0"})
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            call_command("updatedb")
+        self.assertIn("Rebuilt the JSON file for release v2.0 in", output.getvalue())
+        self.assertIn("Rebuilt the path index for release v2.0", output.getvalue())
+        self.assertEqual(self.outdated_tags(), set())
+        self.assertFalse(Release.objects.filter(path_index_outdated=True).exists())
+
+    def test_updatedb_jobs(self):
+        # The test database lives in memory and cannot be shared with other
+        # processes, so the dumps are rebuilt serially
+        timings = update_release_file_dumps(force=True, num_of_jobs=2)
+        self.assertEqual({x[0] for x in timings}, {"v1.0", "v2.0"})
+        self.assertTrue(all(x[1] >= 0.0 for x in timings))
+        self.assertEqual(self.outdated_tags(), set())
+
+        with self.assertRaises(CommandError):
+            call_command("updatedb", "--jobs", "0")
+
+    def test_download_never_rebuilds_dump(self):
+        self.file1.release_tags.add(self.release2)
+
+        user = User.objects.create_user(username="rdt_user", password="rdt_password")
+        self.client.force_login(user)
+        url = reverse("release-download-view", kwargs={"pk": "v2.0"})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Content-Encoding", response)
+        self.assertEqual(response["X-Dump-Outdated"], "true")
+
+        # The old dump is sent, and it is still flagged as outdated
+        dump = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(
+            {x["uuid"] for x in dump["data_files"]}, {str(self.file2.uuid)}
+        )
+        self.assertEqual(self.outdated_tags(), {"v2.0"})
+
+        update_release_file_dumps()
+        response = self.client.get(url)
+        self.assertNotIn("X-Dump-Outdated", response)
+        dump = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(
+            {x["uuid"] for x in dump["data_files"]},
+            {str(self.file1.uuid), str(self.file2.uuid)},
+        )
+
+        # Releases without a dump cannot be downloaded until it is built
+        Release.objects.create(tag="v3.0")
+        response = self.client.get(
+            reverse("release-download-view", kwargs={"pk": "v3.0"})
+        )
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(bool(Release.objects.get(tag="v3.0").json_file))
+
+    def test_download_conditional(self):
+        user = User.objects.create_user(username="rdt_user", password="rdt_password")
+        self.client.force_login(user)
+        url = reverse("release-download-view", kwargs={"pk": "v1.0"})
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        self.assertIn("Last-Modified", response)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+        # Each representation of the dump has its own ETag
+        response = self.client.get(
+            url, HTTP_IF_NONE_MATCH=etag, HTTP_ACCEPT_ENCODING="gzip"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+        # The dump must be sent again once it has been rebuilt
+        self.file1.comment = "Updated"
+        self.file1.save()
+        update_release_file_dumps()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_download_compressed_dump(self):
+        user = User.objects.create_user(username="rdt_user", password="rdt_password")
+        self.client.force_login(user)
+        url = reverse("release-download-view", kwargs={"pk": "v1.0"})
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+        dump = json.loads(gzip.decompress(b"".join(response.streaming_content)))
+        self.assertEqual(dump["releases"][0]["tag"], "v1.0")
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="identity")
+        self.assertNotIn("Content-Encoding", response)
+        json.loads(b"".join(response.streaming_content))
+
+        # Dumps without compressed copies are sent as they are (and
+        # compressed on the fly by GZipMiddleware)
+        self.release1.refresh_from_db()
+        for cur_encoding in RELEASE_DUMP_ENCODINGS:
+            self.release1.json_file.storage.delete(
+                compressed_release_dump_name(self.release1, cur_encoding)
+            )
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response.status_code, 200)
+        dump = json.loads(gzip.decompress(b"".join(response.streaming_content)))
+        self.assertEqual(dump["releases"][0]["tag"], "v1.0")
+
+    def test_download_cbor_dump(self):
+        user = User.objects.create_user(username="rdt_user", password="rdt_password")
+        self.client.force_login(user)
+        url = reverse("release-download-view", kwargs={"pk": "v1.0"})
+
+        response = self.client.get(url, {"format": "cbor"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/cbor")
+        dump = cbor2.loads(b"".join(response.streaming_content))
+        self.assertEqual([x["uuid"] for x in dump["data_files"]], [self.file1.uuid])
+
+        # The CBOR dump is rebuilt together with the JSON dump
+        self.file2.release_tags.add(self.release1)
+        update_release_file_dumps()
+        response = self.client.get(url, HTTP_ACCEPT="application/cbor")
+        dump = cbor2.loads(b"".join(response.streaming_content))
+        self.assertEqual(len(dump["data_files"]), 2)
+
+        # Downloads never create a missing CBOR dump
+        self.release1.refresh_from_db()
+        storage = self.release1.json_file.storage
+        cbor_name = cbor_release_dump_name(self.release1)
+        storage.delete(cbor_name)
+        response = self.client.get(url, {"format": "cbor"})
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(storage.exists(cbor_name))
+
+    def test_compressed_dumps_are_replaced(self):
+        self.release1.refresh_from_db()
+        storage = self.release1.json_file.storage
+        old_names = [
+            compressed_release_dump_name(self.release1, x)
+            for x in RELEASE_DUMP_ENCODINGS
+        ] + [cbor_release_dump_name(self.release1)]
+        self.assertTrue(all(storage.exists(x) for x in old_names))
+
+        update_release_file_dumps(force=True)
+        self.release1.refresh_from_db()
+        self.assertTrue(
+            all(
+                storage.exists(compressed_release_dump_name(self.release1, x))
+                for x in RELEASE_DUMP_ENCODINGS
+            )
+        )
+
+        self.release1.delete()
+        self.assertFalse(any(storage.exists(x) for x in old_names))
@@ -1,14 +1,37 @@
 # -*- encoding: utf-8 -*-
 
 import datetime
+import hashlib
 import json
+import sqlite3
+import tarfile
+import uuid
+import zipfile
+from collections import OrderedDict
 from pathlib import Path
 from tempfile import TemporaryDirectory
 
+import cbor2
+from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
 from django.test import TestCase
-from browse.models import Entity, FormatSpecification, Quantity, DataFile, Release
+from django.test.utils import CaptureQueriesContext
+from browse.snapshot import SNAPSHOT_LAYOUT_VERSION
+from browse.models import (
+    Entity,
+    FormatSpecification,
+    Quantity,
+    DataFile,
+    Release,
+    ReleaseDumpConfiguration,
+    DumpOutputFormat,
+    Quoted,
+    dump_db_to_json,
+    stream_schema,
+)
 
 
 def get_white_test_image(name: str = "test_image.gif") -> SimpleUploadedFile:
@@ -288,6 +311,111 @@ class TextExport(TestCase):
                 )
 
     def test_export_and_import(self):
+        self.check_export_and_import()
+
+    def test_export_and_bulk_import(self):
+        # Use a tiny batch size, so that several batches are needed
+        self.check_export_and_import("--bulk", "--batch-size", "2")
+
+    def test_export_and_parallel_bulk_import(self):
+        self.check_export_and_import("--bulk", "--jobs", "4")
+
+        for cur_file in DataFile.objects.all():
+            with cur_file.file_data.open("rb") as inpf:
+                self.assertEqual(
+                    cur_file.file_data_sha256, hashlib.sha256(inpf.read()).hexdigest()
+                )
+
+    def test_bulk_import_wrong_checksum(self):
+        with TemporaryDirectory() as tempdir:
+            export_path = Path(tempdir) / "test"
+            call_command("export", export_path)
+
+            # Corrupt one of the exported data files
+            with (export_path / "manifest.json").open("rt") as inpf:
+                manifest = json.load(inpf)
+            data_file_key = [
+                key for key in manifest["files"] if key.startswith("data_files/")
+            ][0]
+            with (export_path / data_file_key).open("wb") as outf:
+                outf.write(b"corrupted")
+
+            DataFile.objects.all().delete()
+            Quantity.objects.all().delete()
+            Entity.objects.all().delete()
+            FormatSpecification.objects.all().delete()
+            Release.objects.all().delete()
+            storage_files = {
+                x for x in Path(settings.MEDIA_ROOT).rglob("*") if x.is_file()
+            }
+
+            with self.assertRaises(CommandError):
+                call_command(
+                    "import", "--bulk", "--jobs", "2", export_path / "schema.json"
+                )
+
+        # Nothing must have been left behind, neither in the database nor
+        # in the storage
+        self.assertEqual(DataFile.objects.count(), 0)
+        self.assertEqual(
+            {x for x in Path(settings.MEDIA_ROOT).rglob("*") if x.is_file()},
+            storage_files,
+        )
+
+    def test_data_file_checksum(self):
+        with self.subchild1_file1.file_data.open("rb") as inpf:
+            expected = hashlib.sha256(inpf.read()).hexdigest()
+        self.assertEqual(self.subchild1_file1.file_data_sha256, expected)
+
+    def test_export_and_stream_import(self):
+        self.check_export_and_import("--stream")
+
+    def test_export_and_bulk_stream_import(self):
+        self.check_export_and_import("--stream", "--bulk", "--batch-size", "2")
+
+    def test_bulk_stream_import_batches(self):
+        # This dependency refers to a data file that comes later in the
+        # schema, so it cannot be linked when the first batch is written
+        self.subchild1_file1.dependencies.add(self.subchild2_file2)
+
+        with TemporaryDirectory() as tempdir:
+            export_path = Path(tempdir) / "test"
+            call_command("export", export_path)
+
+            import_args = ["--stream", "--bulk", "--batch-size", "1"]
+
+            # Import the schema over the objects already in the database…
+            call_command("import", *import_args, export_path / "schema.json")
+            self.assertEqual(DataFile.objects.count(), 4)
+            self.assertEqual(Entity.objects.count(), 6)
+
+            # …and then in an empty database
+            DataFile.objects.all().delete()
+            Quantity.objects.all().delete()
+            Entity.objects.all().delete()
+            Release.objects.all().delete()
+            call_command("import", *import_args, export_path / "schema.json")
+
+        self.assertEqual(DataFile.objects.count(), 4)
+        self.assertEqual(Release.objects.count(), 2)
+        self.assertEqual(
+            set(
+                DataFile.objects.get(
+                    uuid=self.subchild1_file1.uuid
+                ).dependencies.values_list("uuid", flat=True)
+            ),
+            {self.subchild2_file2.uuid},
+        )
+        self.assertEqual(
+            set(
+                DataFile.objects.get(
+                    uuid=self.subchild2_file2.uuid
+                ).dependencies.values_list("uuid", flat=True)
+            ),
+            {self.subchild1_file2.uuid},
+        )
+
+    def check_export_and_import(self, *import_args):
         with TemporaryDirectory() as tempdir:
             export_path = Path(tempdir) / "test"
 
@@ -302,7 +430,7 @@ class TextExport(TestCase):
             Release.objects.all().delete()
 
             # Step 3: import the files from the export path
-            call_command("import", export_path / "schema.json")
+            call_command("import", *import_args, export_path / "schema.json")
 
             # Step 4: check that the database was rebuilt correctly
 
@@ -342,6 +470,7 @@ class TextExport(TestCase):
 
             entity_subchild3 = Entity.objects.get(name="subchild3")
             self.assertEqual(entity_subchild3.parent, entity_child2)
+            self.assertEqual(entity_subchild3.path, "root/child2/subchild3")
 
             #     Check that the quantities are correct
             quantity_subchild1 = Quantity.objects.get(name="subchild1_quantity")
@@ -355,6 +484,9 @@ class TextExport(TestCase):
             self.assertEqual(
                 quantity_subchild2.parent_entity.uuid, entity_subchild2.uuid
             )
+            self.assertEqual(
+                quantity_subchild2.path, "root/child2/subchild2/subchild2_quantity"
+            )
 
             #     Check that the data files are correct
             for (
@@ -445,6 +577,449 @@ class TextExport(TestCase):
                 self.assertEqual(cur_rel.release_document.read(), cur_release_document)
                 self.assertEqual(cur_rel.release_document_mime_type, "text/plain")
 
+    def test_export_with_threads_and_hard_links(self):
+        with TemporaryDirectory() as tempdir:
+            dest_path = Path(tempdir) / "output"
+            call_command("export", "--jobs", "3", "--hard-links", dest_path)
+
+            for cur_data_file in [
+                self.subchild1_file1,
+                self.subchild1_file2,
+                self.subchild2_file1,
+                self.subchild2_file2,
+            ]:
+                cur_data_file.file_data.open("rb")
+                expected = cur_data_file.file_data.read()
+                cur_data_file.file_data.close()
+
+                cur_path = (
+                    dest_path
+                    / "data_files"
+                    / f"{cur_data_file.uuid}_{cur_data_file.name}"
+                )
+                self.assertEqual(cur_path.read_bytes(), expected)
+                self.assertTrue((dest_path / cur_data_file.plot_file.name).exists())
+
+            # Exporting again with plain copies must not overwrite the
+            # files in the storage that were hard-linked by the first export
+            exported_path = (
+                dest_path
+                / "data_files"
+                / f"{self.subchild1_file1.uuid}_{self.subchild1_file1.name}"
+            )
+            call_command("export", "--force", "--jobs", "2", dest_path)
+            exported_path.write_bytes(b"modified")
+
+            self.subchild1_file1.file_data.open("rb")
+            self.assertEqual(
+                self.subchild1_file1.file_data.read(), b'{"subchild1_file_field": 2}'
+            )
+            self.subchild1_file1.file_data.close()
+
+    def test_incremental_export(self):
+        with TemporaryDirectory() as tempdir:
+            dest_path = Path(tempdir) / "output"
+            call_command("export", dest_path)
+
+            manifest_path = dest_path / "manifest.json"
+            self.assertTrue(manifest_path.exists())
+            with manifest_path.open("rt") as inpf:
+                manifest = json.load(inpf)["files"]
+
+            kept_file = f"data_files/{self.subchild1_file1.uuid}_subchild1_file1"
+            removed_file = f"data_files/{self.subchild2_file2.uuid}_subchild2_file2"
+            self.assertIn(kept_file, manifest)
+            self.assertIn(removed_file, manifest)
+            self.assertIn(f"format_spec/{self.fmt_spec.uuid}_REF001.txt", manifest)
+            self.assertIn("release_documents/v1.2345.txt", manifest)
+            self.assertEqual(
+                manifest[kept_file]["size"], len(b'{"subchild1_file_field": 2}')
+            )
+            self.assertEqual(
+                manifest[kept_file]["sha256"],
+                hashlib.sha256(b'{"subchild1_file_field": 2}').hexdigest(),
+            )
+
+            kept_inode = (dest_path / kept_file).stat().st_ino
+            self.subchild2_file2.delete()
+
+            call_command("export", "--force", dest_path)
+
+            # Unchanged files are not copied again, stale files are removed
+            self.assertEqual((dest_path / kept_file).stat().st_ino, kept_inode)
+            self.assertFalse((dest_path / removed_file).exists())
+
+            with manifest_path.open("rt") as inpf:
+                manifest = json.load(inpf)["files"]
+            self.assertIn(kept_file, manifest)
+            self.assertNotIn(removed_file, manifest)
+
+    def test_export_archive(self):
+        with TemporaryDirectory() as tempdir:
+            dest_path = Path(tempdir) / "output"
+            call_command("export", "--release", "v1.2345", dest_path)
+
+            expected = {
+                x.relative_to(dest_path).as_posix(): x.read_bytes()
+                for x in dest_path.glob("**/*")
+                if x.is_file() and x.name != "manifest.json"
+            }
+            expected_schema = json.loads(expected.pop("schema.json"))
+            self.assertEqual(len(expected), 6)
+
+            tar_path = Path(tempdir) / "output.tar"
+            call_command("export", "--release", "v1.2345", "--archive", "tar", tar_path)
+            with tarfile.open(tar_path) as archive:
+                contents = {
+                    x.name: archive.extractfile(x).read() for x in archive.getmembers()
+                }
+
+            zip_path = Path(tempdir) / "output.zip"
+            call_command("export", "--release", "v1.2345", "--archive", "zip", zip_path)
+            with zipfile.ZipFile(zip_path) as archive:
+                self.assertIsNone(archive.testzip())
+                self.assertEqual(archive.namelist()[0], "schema.json")
+                zip_contents = {x: archive.read(x) for x in archive.namelist()}
+
+            for cur_contents in (contents, zip_contents):
+                schema = json.loads(cur_contents.pop("schema.json"))
+                for cur_schema in (schema, expected_schema):
+                    cur_schema["instrumentdb"].pop("dump_date", None)
+
+                self.assertEqual(schema, expected_schema)
+                self.assertEqual(cur_contents, expected)
+
+            # Existing files are not overwritten unless --force is used
+            with self.assertRaises(CommandError):
+                call_command("export", "--archive", "zip", zip_path)
+            call_command("export", "--archive", "zip", "--force", zip_path)
+            self.assertEqual(len(zipfile.ZipFile(zip_path).namelist()), 12)
+
+    def test_export_delta(self):
+        # Add a new entity with a quantity to the second release, and keep
+        # one data file of the first release in it
+        entity_child3 = Entity.objects.create(name="child3", parent=self.entity_root)
+        quantity_child3 = Quantity.objects.create(
+            name="child3_quantity",
+            format_spec=self.fmt_spec,
+            parent_entity=entity_child3,
+        )
+        child3_file = DataFile.objects.create(
+            name="child3_file",
+            quantity=quantity_child3,
+            spec_version="v1.0",
+            file_data=SimpleUploadedFile(name="child3.json", content=b"{}"),
+        )
+        child3_file.release_tags.add(self.release2)
+        self.subchild1_file1.release_tags.add(self.release2)
+
+        with TemporaryDirectory() as tempdir:
+            dest_path = Path(tempdir) / "output"
+            call_command(
+                "export", "--release", "v2.3456", "--delta-from", "v1.2345", dest_path
+            )
+
+            self.assertFalse((dest_path / "schema.json").exists())
+            with (dest_path / "delta.json").open("rt") as inpf:
+                delta = json.load(inpf)
+
+            self.assertEqual(delta["delta"]["from"], "v1.2345")
+            self.assertEqual(delta["delta"]["to"], "v2.3456")
+            self.assertEqual(
+                {x["uuid"] for x in delta["added_data_files"]},
+                {
+                    str(self.subchild1_file2.uuid),
+                    str(self.subchild2_file2.uuid),
+                    str(child3_file.uuid),
+                },
+            )
+            self.assertEqual(
+                delta["removed_data_files"], [str(self.subchild2_file1.uuid)]
+            )
+            self.assertEqual(
+                [x["uuid"] for x in delta["added_quantities"]],
+                [str(quantity_child3.uuid)],
+            )
+            self.assertEqual(delta["removed_quantities"], [])
+            self.assertEqual(
+                set(delta["changed_quantities"]),
+                {str(self.quantity_subchild1.uuid), str(self.quantity_subchild2.uuid)},
+            )
+            self.assertEqual(
+                delta["added_entities"],
+                [
+                    {
+                        "uuid": str(entity_child3.uuid),
+                        "name": "child3",
+                        "parent": str(self.entity_root.uuid),
+                    }
+                ],
+            )
+            self.assertEqual(delta["removed_entities"], [])
+            self.assertEqual(
+                set(delta["changed_entities"]),
+                {str(self.entity_subchild1.uuid), str(self.entity_subchild2.uuid)},
+            )
+            self.assertEqual(
+                [x["uuid"] for x in delta["format_specifications"]],
+                [str(self.fmt_spec.uuid)],
+            )
+
+            # Only the attachments of the new data files are saved
+            self.assertEqual(
+                {x.name for x in (dest_path / "data_files").iterdir()},
+                {
+                    Path(x["file_name"]).name
+                    for x in delta["added_data_files"]
+                    if "file_name" in x
+                },
+            )
+            self.assertEqual(len(list((dest_path / "data_files").iterdir())), 3)
+
+            # The other way round
+            call_command(
+                "export",
+                "--release",
+                "v1.2345",
+                "--delta-from",
+                "v2.3456",
+                "--no-attachments",
+                Path(tempdir) / "reverse",
+            )
+            with (Path(tempdir) / "reverse" / "delta.json").open("rt") as inpf:
+                delta = json.load(inpf)
+
+            self.assertEqual(delta["removed_quantities"], [str(quantity_child3.uuid)])
+            self.assertEqual(delta["removed_entities"], [str(entity_child3.uuid)])
+            self.assertEqual(delta["added_quantities"], [])
+
+        with self.assertRaises(CommandError):
+            call_command("export", "--delta-from", "v1.2345", "output")
+        with self.assertRaises(CommandError):
+            call_command(
+                "export", "--release", "v2.3456", "--delta-from", "v0.0", "output"
+            )
+
+    def test_export_cbor(self):
+        with TemporaryDirectory() as tempdir:
+            call_command("export", "--no-attachments", Path(tempdir) / "json")
+            with (Path(tempdir) / "json" / "schema.json").open("rt") as inpf:
+                json_schema = json.load(inpf)
+
+            call_command("export", "--no-attachments", "--cbor", Path(tempdir) / "cbor")
+            with (Path(tempdir) / "cbor" / "schema.cbor").open("rb") as inpf:
+                cbor_schema = cbor2.load(inpf)
+
+        # UUIDs and dates are saved natively
+        data_file = cbor_schema["data_files"][0]
+        self.assertIsInstance(data_file["uuid"], uuid.UUID)
+        self.assertEqual(data_file["uuid"], self.subchild1_file1.uuid)
+        self.assertIsInstance(data_file["upload_date"], datetime.datetime)
+        self.assertEqual(
+            data_file["upload_date"],
+            DataFile.objects.get(uuid=data_file["uuid"]).upload_date,
+        )
+        self.assertIsInstance(
+            cbor_schema["releases"][0]["release_date"], datetime.datetime
+        )
+
+        # Apart from this, the structure is the same as the JSON file
+        def to_json(value):
+            if isinstance(value, dict):
+                return {k: to_json(v) for k, v in value.items()}
+            elif isinstance(value, list):
+                return [to_json(x) for x in value]
+            elif isinstance(value, (uuid.UUID, datetime.datetime)):
+                return str(value)
+            return value
+
+        for cur_schema in (json_schema, cbor_schema):
+            del cur_schema["instrumentdb"]["dump_date"]
+        self.assertEqual(to_json(cbor_schema), json_schema)
+
+    def test_export_sqlite(self):
+        with TemporaryDirectory() as tempdir:
+            output_folder = Path(tempdir) / "snapshot"
+            call_command("export", "--release", "v1.2345", "--sqlite", output_folder)
+
+            # Attachments are saved as usual
+            self.assertTrue((output_folder / "data_files").is_dir())
+
+            snapshot = sqlite3.connect(output_folder / "schema.sqlite3")
+            try:
+                self.assertEqual(
+                    snapshot.execute(
+                        "SELECT path, depth FROM entities ORDER BY path"
+                    ).fetchall(),
+                    [
+                        ("root", 0),
+                        ("root/child1", 1),
+                        ("root/child1/subchild1", 2),
+                        ("root/child2", 1),
+                        ("root/child2/subchild2", 2),
+                        ("root/child2/subchild3", 2),
+                    ],
+                )
+
+                # Look for the metadata of all the data files below an entity
+                rows = snapshot.execute(
+                    """
+                    SELECT data_files.uuid, data_files.spec_version,
+                        json_extract(data_files.metadata, '$.subchild1_metadata_field')
+                    FROM data_files
+                    JOIN quantities ON quantities.uuid = data_files.quantity_uuid
+                    WHERE quantities.path GLOB 'root/child1/*'
+                    """
+                ).fetchall()
+                self.assertEqual(rows, [(str(self.subchild1_file1.uuid), "v1.0", 1)])
+
+                # Only the data files in the release are included
+                self.assertEqual(
+                    snapshot.execute(
+                        "SELECT tag, data_file_uuid FROM release_data_files "
+                        "ORDER BY data_file_uuid"
+                    ).fetchall(),
+                    sorted(
+                        ("v1.2345", str(x.uuid))
+                        for x in (self.subchild1_file1, self.subchild2_file1)
+                    ),
+                )
+                self.assertEqual(
+                    snapshot.execute(
+                        "SELECT dependency_uuid FROM dependencies WHERE data_file_uuid = ?",
+                        (str(self.subchild2_file1.uuid),),
+                    ).fetchall(),
+                    [(str(self.subchild1_file1.uuid),)],
+                )
+                self.assertEqual(
+                    snapshot.execute(
+                        "SELECT release_document FROM releases WHERE tag = 'v1.2345'"
+                    ).fetchone(),
+                    ("release_documents/v1.2345.txt",),
+                )
+                self.assertEqual(
+                    snapshot.execute(
+                        "SELECT value FROM snapshot_info WHERE key = 'layout_version'"
+                    ).fetchone(),
+                    (str(SNAPSHOT_LAYOUT_VERSION),),
+                )
+            finally:
+                snapshot.close()
+
+            with self.assertRaises(CommandError):
+                call_command(
+                    "export",
+                    "--release",
+                    "v2.3456",
+                    "--delta-from",
+                    "v1.2345",
+                    "--sqlite",
+                    "--force",
+                    output_folder,
+                )
+
+    def test_export_json_layout(self):
+        # The schema is written one record at a time, but the result must
+        # be the same as if it was saved in one go by `json.dump`
+        with TemporaryDirectory() as tempdir:
+            dest_path = Path(tempdir) / "output"
+            call_command("export", "--no-attachments", dest_path)
+
+            with (dest_path / "schema.json").open("rt") as inpf:
+                contents = inpf.read()
+
+            schema = json.loads(contents, object_pairs_hook=OrderedDict)
+            self.assertEqual(contents, json.dumps(schema, indent=2))
+            self.assertEqual(len(schema["data_files"]), 4)
+            self.assertEqual(len(schema["releases"]), 2)
+
+    def test_export_skip_empty(self):
+        # This quantity has a data file, but not in release v1.2345
+        quantity_subchild3 = Quantity.objects.create(
+            name="subchild3_quantity",
+            format_spec=self.fmt_spec,
+            parent_entity=self.entity_subchild3,
+        )
+        DataFile.objects.create(
+            name="subchild3_file", quantity=quantity_subchild3, spec_version="v1.0"
+        ).release_tags.add(self.release2)
+        empty_leaf = Entity.objects.create(name="empty_leaf", parent=self.entity_child2)
+
+        def entity_names(entities):
+            for cur_entity in entities:
+                yield cur_entity["name"]
+                yield from entity_names(cur_entity.get("children", []))
+
+        with TemporaryDirectory() as tempdir:
+            dest_path = Path(tempdir) / "output"
+            call_command(
+                "export",
+                "--no-attachments",
+                "--release",
+                "v1.2345",
+                "--skip-empty-entities",
+                "--skip-empty-quantities",
+                dest_path,
+            )
+            with (dest_path / "schema.json").open("rt") as inpf:
+                schema = json.load(inpf)
+
+        self.assertEqual(
+            {x["name"] for x in schema["quantities"]},
+            {"subchild1_quantity", "subchild2_quantity"},
+        )
+
+        # Leaf entities are skipped if they have no data files in the release
+        names = set(entity_names(schema["entities"]))
+        self.assertNotIn(empty_leaf.name, names)
+        self.assertNotIn("subchild3", names)
+        self.assertEqual(names, {"root", "child1", "child2", "subchild1", "subchild2"})
+
+    def test_export_query_count(self):
+        def count_export_queries(release_tag):
+            with TemporaryDirectory() as tempdir:
+                with CaptureQueriesContext(connection) as context:
+                    dump_db_to_json(
+                        ReleaseDumpConfiguration(
+                            no_attachments=False,
+                            only_tree=False,
+                            exist_ok=True,
+                            skip_empty_entities=True,
+                            skip_empty_quantities=True,
+                            output_format=DumpOutputFormat.JSON,
+                            output_folder=Path(tempdir),
+                        ),
+                        release_tag=release_tag,
+                    )
+            return len(context.captured_queries)
+
+        num_of_queries_all = count_export_queries(release_tag=None)
+        num_of_queries_release = count_export_queries(release_tag="v1.2345")
+
+        # Make the database larger: the number of queries must not change
+        for idx in range(5):
+            cur_entity = Entity.objects.create(
+                name=f"extra_entity{idx}", parent=self.entity_child1
+            )
+            cur_quantity = Quantity.objects.create(
+                name=f"extra_quantity{idx}",
+                format_spec=self.fmt_spec,
+                parent_entity=cur_entity,
+            )
+            cur_data_file = DataFile.objects.create(
+                name=f"extra_file{idx}",
+                metadata="{}",
+                quantity=cur_quantity,
+                spec_version="v1.0",
+            )
+            cur_data_file.dependencies.add(self.subchild1_file1)
+            cur_data_file.release_tags.add(self.release1)
+
+        self.assertEqual(count_export_queries(release_tag=None), num_of_queries_all)
+        self.assertEqual(
+            count_export_queries(release_tag="v1.2345"), num_of_queries_release
+        )
+
     def test_delete_all(self):
         call_command("delete-all", "--force")
 
@@ -473,3 +1048,48 @@ class TextExport(TestCase):
         self.assertEqual(len(Quantity.objects.all()), 0)
         self.assertEqual(len(Entity.objects.all()), 0)
         self.assertEqual(len(Release.objects.all()), 0)
+
+
+class TestCBOR(TestCase):
+    def test_stream_cbor(self):
+        data_file_uuid = uuid.UUID("8d8ac610-566d-4ef0-9c22-186b2a5ed793")
+        upload_date = datetime.datetime(
+            2013, 3, 21, 20, 4, tzinfo=datetime.timezone.utc
+        )
+        schema = OrderedDict(
+            [
+                ("a", 1),
+                (
+                    "data_files",
+                    (
+                        OrderedDict(
+                            [
+                                ("uuid", Quoted(data_file_uuid)),
+                                ("upload_date", Quoted(upload_date)),
+                                ("file_name", Quoted(Path("data_files") / "x")),
+                            ]
+                        )
+                        for _ in range(2)
+                    ),
+                ),
+            ]
+        )
+
+        chunks = list(stream_schema(schema, DumpOutputFormat.CBOR))
+        self.assertGreater(len(chunks), 1)
+
+        encoded = b"".join(chunks)
+        # The generator is encoded as an indefinite-length array (0x9f…0xff),
+        # while UUIDs and dates use tags 37 and 1
+        self.assertTrue(encoded.startswith(bytes.fromhex("a26161016a")))
+        self.assertIn(bytes.fromhex("9fa3"), encoded)
+        self.assertTrue(encoded.endswith(b"\xff"))
+        self.assertIn(bytes.fromhex("d82550") + data_file_uuid.bytes, encoded)
+        self.assertIn(bytes.fromhex("c11a514b67b0"), encoded)
+
+        record = {
+            "uuid": data_file_uuid,
+            "upload_date": upload_date,
+            "file_name": "data_files/x",
+        }
+        self.assertEqual(cbor2.loads(encoded), {"a": 1, "data_files": [record, record]})
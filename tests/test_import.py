@@ -1,8 +1,14 @@
 # -*- encoding: utf-8 -*-
 
+import io
+import json
 from pathlib import Path
+from tempfile import TemporaryDirectory
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.test import TestCase
+import yaml
+from browse.jsonstream import JSONStreamReader
 from browse.models import Entity, FormatSpecification, Quantity, DataFile, Release
 
 
@@ -95,3 +101,290 @@ class TestTutorial(TestCase):
             data_file_len=0,
             release_len=0,
         )
+
+
+def entity_tree():
+    return [
+        (entity.name, entity.level, entity.parent_id)
+        for entity in Entity.objects.order_by("tree_id", "lft")
+    ]
+
+
+class TestBulkImport(TestCase):
+    def setUp(self):
+        self.examples_path = Path(__file__).parent / ".." / "examples"
+
+    def test_bulk_import_nested_yaml(self):
+        call_command("import", "--bulk", self.examples_path / "schema1.yaml")
+        check_db_size(
+            self,
+            entity_len=12,
+            format_spec_len=3,
+            quantity_len=12,
+            data_file_len=3,
+            release_len=1,
+        )
+        check_deps_in_schema(self)
+
+        horn01_grasp = Quantity.objects.get(name="horn01_grasp")
+        self.assertEqual(horn01_grasp.parent_entity.name, "horn01")
+        self.assertEqual(horn01_grasp.format_spec.document_ref, "SPEC-001")
+        self.assertEqual(horn01_grasp.data_files.count(), 2)
+
+    def test_bulk_import_plain_yaml(self):
+        call_command(
+            "import", "--bulk", "--batch-size", "3", self.examples_path / "schema2.yaml"
+        )
+        check_db_size(
+            self,
+            entity_len=12,
+            format_spec_len=3,
+            quantity_len=12,
+            data_file_len=3,
+            release_len=1,
+        )
+        check_deps_in_schema(self)
+
+    def test_bulk_import_builds_same_tree(self):
+        call_command("import", self.examples_path / "schema1.yaml")
+        expected_tree = entity_tree()
+
+        Entity.objects.all().delete()
+        call_command(
+            "import", "--bulk", "--batch-size", "2", self.examples_path / "schema1.yaml"
+        )
+        self.assertEqual(entity_tree(), expected_tree)
+
+    def test_bulk_import_over_existing_objects(self):
+        call_command("import", self.examples_path / "schema1.yaml")
+        Entity.objects.filter(name="horn01").update(name="old_name")
+
+        call_command("import", "--bulk", self.examples_path / "schema1.yaml")
+        check_db_size(
+            self,
+            entity_len=12,
+            format_spec_len=3,
+            quantity_len=12,
+            data_file_len=3,
+            release_len=1,
+        )
+        self.assertTrue(Entity.objects.filter(name="horn01").exists())
+        self.assertFalse(Entity.objects.filter(name="old_name").exists())
+
+    def test_bulk_import_dry_run(self):
+        call_command(
+            "import", "--bulk", "--dry-run", self.examples_path / "schema1.yaml"
+        )
+        check_db_size(
+            self,
+            entity_len=0,
+            format_spec_len=0,
+            quantity_len=0,
+            data_file_len=0,
+            release_len=0,
+        )
+
+
+def write_schema(path: Path, data_file_dependencies, release_files) -> Path:
+    """Write a JSON schema with one quantity and two data files"""
+
+    schema = {
+        "format_specifications": [
+            {
+                "uuid": "2f3d8a1c-7a8e-4f1b-9c43-5a4f0c2b7d10",
+                "document_ref": "REF001",
+                "title": "Document",
+            }
+        ],
+        "entities": [
+            {
+                "uuid": "6b3e6d6e-5c68-4ad4-8ff2-0e4ba8f13e8f",
+                "name": "root",
+                "quantities": [
+                    {
+                        "uuid": "0ad5b2b4-0d41-4bd9-9a73-4f4b6a0d2c53",
+                        "name": "quantity",
+                        "format_spec": "REF001",
+                    }
+                ],
+            }
+        ],
+        "data_files": [
+            {
+                "uuid": "8c4d1f68-9b6a-4df8-a8f1-4a0e1d5b4c01",
+                "name": "file1",
+                "quantity": "0ad5b2b4-0d41-4bd9-9a73-4f4b6a0d2c53",
+                "upload_date": "2023-01-02 03:04:05",
+                "spec_version": "1.0",
+            },
+            {
+                "uuid": "8c4d1f68-9b6a-4df8-a8f1-4a0e1d5b4c02",
+                "name": "file2",
+                "quantity": "0ad5b2b4-0d41-4bd9-9a73-4f4b6a0d2c53",
+                "upload_date": "2023-01-02 03:04:05",
+                "spec_version": "1.0",
+                "dependencies": data_file_dependencies,
+            },
+        ],
+        "releases": [
+            {
+                "tag": "v1.0",
+                "release_date": "2023-05-07 05:06:07",
+                "comment": "",
+                "data_files": release_files,
+            }
+        ],
+    }
+
+    schema_file = path / "schema.json"
+    with schema_file.open("wt") as outf:
+        json.dump(schema, outf)
+
+    return schema_file
+
+
+class TestReferences(TestCase):
+    def test_links(self):
+        with TemporaryDirectory() as tempdir:
+            schema_file = write_schema(
+                Path(tempdir),
+                data_file_dependencies=["8c4d1f68-9b6a-4df8-a8f1-4a0e1d5b4c01"],
+                release_files=[
+                    "8c4d1f68-9b6a-4df8-a8f1-4a0e1d5b4c01",
+                    "8c4d1f68-9b6a-4df8-a8f1-4a0e1d5b4c02",
+                ],
+            )
+            call_command("import", schema_file)
+
+            # Importing the same schema twice must not duplicate the links
+            call_command("import", schema_file)
+
+        file1 = DataFile.objects.get(name="file1")
+        file2 = DataFile.objects.get(name="file2")
+        self.assertEqual(list(file2.dependencies.all()), [file1])
+        self.assertEqual(
+            set(Release.objects.get(tag="v1.0").data_files.all()), {file1, file2}
+        )
+
+    def test_missing_dependencies(self):
+        with TemporaryDirectory() as tempdir:
+            schema_file = write_schema(
+                Path(tempdir),
+                data_file_dependencies=[
+                    "8c4d1f68-9b6a-4df8-a8f1-4a0e1d5b4c01",
+                    "00000000-0000-0000-0000-000000000001",
+                    "00000000-0000-0000-0000-000000000002",
+                ],
+                release_files=[],
+            )
+
+            with self.assertRaises(CommandError) as context:
+                call_command("import", schema_file)
+
+        # All the missing objects must be reported at once
+        message = str(context.exception)
+        self.assertIn("00000000-0000-0000-0000-000000000001", message)
+        self.assertIn("00000000-0000-0000-0000-000000000002", message)
+        self.assertNotIn("8c4d1f68-9b6a-4df8-a8f1-4a0e1d5b4c01", message)
+
+    def test_missing_release_files(self):
+        with TemporaryDirectory() as tempdir:
+            schema_file = write_schema(
+                Path(tempdir),
+                data_file_dependencies=[],
+                release_files=[
+                    "8c4d1f68-9b6a-4df8-a8f1-4a0e1d5b4c01",
+                    "00000000-0000-0000-0000-000000000001",
+                    "00000000-0000-0000-0000-000000000002",
+                ],
+            )
+
+            with self.assertRaises(CommandError) as context:
+                call_command("import", schema_file)
+
+        message = str(context.exception)
+        self.assertIn("00000000-0000-0000-0000-000000000001", message)
+        self.assertIn("00000000-0000-0000-0000-000000000002", message)
+        self.assertFalse(Release.objects.filter(tag="v1.0").exists())
+
+
+def read_all(reader: JSONStreamReader):
+    "Rebuild a JSON value using the iterators of a JSONStreamReader"
+
+    char = reader.peek()
+    if char == "{":
+        return {key: read_all(reader) for key in reader.iter_object()}
+    elif char == "[":
+        return [read_all(reader) for _ in reader.iter_array()]
+    else:
+        return reader.read_value()
+
+
+class TestJSONStreamReader(TestCase):
+    document = {
+        "a": [1, 23456, -7.5e-3, True, False, None],
+        "b": {"c": 'a long string with "escapes" and ünïcödé', "d": []},
+        "e": {},
+        "f": [{"g": 12345678901234567890}, [[], [1]]],
+    }
+
+    def test_chunk_sizes(self):
+        text = json.dumps(self.document, indent=2)
+        for chunk_size in (1, 2, 3, 7, 65536):
+            reader = JSONStreamReader(io.StringIO(text), chunk_size=chunk_size)
+            self.assertEqual(read_all(reader), self.document)
+            self.assertEqual(reader.peek(), "")
+
+    def test_iter_values(self):
+        reader = JSONStreamReader(io.StringIO("[1, {}, [2]]"), chunk_size=1)
+        self.assertEqual(list(reader.iter_values()), [1, {}, [2]])
+
+    def test_invalid_documents(self):
+        for text in ('{"a": 1,}', '{"a" 1}', "[1 2]", '{"a": [1, 2}', "[1,"):
+            reader = JSONStreamReader(io.StringIO(text), chunk_size=2)
+            with self.assertRaises(json.JSONDecodeError):
+                read_all(reader)
+
+
+class TestStreamImport(TestCase):
+    def test_stream_import(self):
+        with (
+            Path(__file__).parent / ".." / "examples" / "schema1.yaml"
+        ).open() as inpf:
+            schema = yaml.safe_load(inpf)
+
+        with TemporaryDirectory() as tempdir:
+            schema_file = Path(tempdir) / "schema1.json"
+            with schema_file.open("wt") as outf:
+                json.dump(schema, outf, default=str)
+
+            call_command("import", "--stream", schema_file)
+
+        check_db_size(
+            self,
+            entity_len=12,
+            format_spec_len=3,
+            quantity_len=12,
+            data_file_len=3,
+            release_len=1,
+        )
+        check_deps_in_schema(self)
+        self.assertEqual(
+            Entity.objects.get(name="horn01").parent,
+            Entity.objects.get(name="beams"),
+        )
+
+    def test_stream_import_wrong_key_order(self):
+        schema = {
+            "entities": [
+                {"children": [{"name": "child"}], "name": "parent"},
+            ]
+        }
+
+        with TemporaryDirectory() as tempdir:
+            schema_file = Path(tempdir) / "schema.json"
+            with schema_file.open("wt") as outf:
+                json.dump(schema, outf)
+
+            with self.assertRaises(CommandError):
+                call_command("import", "--stream", schema_file)
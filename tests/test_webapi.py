@@ -1,5 +1,9 @@
 # -*- encoding: utf-8 -*-
+import hashlib
+import io
 import json
+import tarfile
+import zipfile
 from io import StringIO
 from uuid import UUID
 
@@ -12,6 +16,8 @@ from browse.models import (
     Quantity,
     DataFile,
     Release,
+    ReleasePathIndex,
+    update_release_path_indexes,
 )
 from django.contrib.auth.models import User
 
@@ -173,6 +179,28 @@ class FormatSpecificationTests(APITestCase):
         actual_content = b"".join(chunk for chunk in response.streaming_content)
         self.assertEqual(actual_content, expected_content)
 
+    def test_conditional_format_specification(self):
+        response = create_format_spec(self.client, "DUMMY_REF_001")
+        url = response.data["url"]
+        download_link = self.client.get(url).json()["download_link"]
+
+        response = self.client.get(download_link)
+        etag = response["ETag"]
+        self.assertEqual(etag, '"{0}"'.format(hashlib.sha256(b"Test file").hexdigest()))
+
+        # Every new upload deletes the previous file, so the third upload
+        # reuses the name of the first one: the ETag must change anyway
+        for contents in [b"Second file", b"Third file"]:
+            self.client.patch(
+                url, {"doc_file": StringIO(contents.decode())}, format="multipart"
+            )
+            response = self.client.get(download_link, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(b"".join(response.streaming_content), contents)
+            self.assertEqual(
+                response["ETag"], '"{0}"'.format(hashlib.sha256(contents).hexdigest())
+            )
+
 
 class EntityTests(APITestCase):
     def setUp(self) -> None:
@@ -382,6 +410,125 @@ class DataFileTests(APITestCase):
         actual_content = b"".join(chunk for chunk in response.streaming_content)
         self.assertEqual(actual_content, expected_content)
 
+    def test_conditional_download(self):
+        response = create_data_file_spec(
+            self.client,
+            name="test_datafile",
+            metadata={"a": 10, "b": "hello"},
+            quantity=self.quantity_response.data["url"],
+        )
+        data_file = DataFile.objects.get()
+        download_link = self.client.get(response.data["url"]).json()["download_link"]
+
+        response = self.client.get(download_link)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response["ETag"]
+        last_modified = response["Last-Modified"]
+        self.assertEqual(etag, '"{0}"'.format(hashlib.sha256(b"1,2,3,4,5").hexdigest()))
+
+        # Remove the file from the storage: if the client's copy is up to
+        # date, the server must not try to read it
+        data_file.file_data.storage.delete(data_file.file_data.name)
+
+        response = self.client.get(download_link, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+
+        response = self.client.get(download_link, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse("data-file-download-view", kwargs={"pk": data_file.uuid}),
+            HTTP_IF_NONE_MATCH=etag,
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_conditional_detail(self):
+        response = create_data_file_spec(
+            self.client,
+            name="test_datafile",
+            metadata={"a": 10, "b": "hello"},
+            quantity=self.quantity_response.data["url"],
+        )
+        url = response.data["url"]
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response["ETag"]
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Any change in the record changes the ETag
+        self.client.patch(url, {"spec_version": "2.0"}, format="json")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_range_download(self):
+        response = create_data_file_spec(
+            self.client,
+            name="test_datafile",
+            metadata={"a": 10, "b": "hello"},
+            quantity=self.quantity_response.data["url"],
+        )
+        download_link = self.client.get(response.data["url"]).json()["download_link"]
+
+        response = self.client.get(download_link, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(b"".join(response.streaming_content), b"1,2,3,4,5")
+        etag = response["ETag"]
+
+        # Resume an interrupted download; the response must not be
+        # compressed, or the offsets would be wrong
+        response = self.client.get(
+            download_link, HTTP_RANGE="bytes=3-", HTTP_ACCEPT_ENCODING="gzip"
+        )
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response["Content-Range"], "bytes 3-8/9")
+        self.assertEqual(response["Content-Length"], "6")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(b"".join(response.streaming_content), b",3,4,5")
+
+        response = self.client.get(download_link, HTTP_RANGE="bytes=-3")
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response["Content-Range"], "bytes 6-8/9")
+        self.assertEqual(b"".join(response.streaming_content), b"4,5")
+
+        response = self.client.get(download_link, HTTP_RANGE="bytes=0-0,4-4")
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertTrue(response["Content-Type"].startswith("multipart/byteranges"))
+        content = b"".join(response.streaming_content)
+        self.assertEqual(int(response["Content-Length"]), len(content))
+        self.assertIn(b"Content-Range: bytes 0-0/9\r\n\r\n1\r\n", content)
+        self.assertIn(b"Content-Range: bytes 4-4/9\r\n\r\n3\r\n", content)
+
+        response = self.client.get(download_link, HTTP_RANGE="bytes=100-")
+        self.assertEqual(
+            response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+        )
+        self.assertEqual(response["Content-Range"], "bytes */9")
+
+        # Malformed headers are ignored
+        for header in ["lines=1-2", "bytes=\u00b2-", "bytes=0-\u0663"]:
+            response = self.client.get(download_link, HTTP_RANGE=header)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(b"".join(response.streaming_content), b"1,2,3,4,5")
+
+        # If the file has changed, the whole file must be sent again
+        response = self.client.get(
+            download_link, HTTP_RANGE="bytes=3-", HTTP_IF_RANGE='"stale"'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b"".join(response.streaming_content), b"1,2,3,4,5")
+
+        response = self.client.get(
+            download_link, HTTP_RANGE="bytes=3-", HTTP_IF_RANGE=etag
+        )
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+
 
 class ReleaseTests(APITestCase):
     def setUp(self):
@@ -429,11 +576,18 @@ class ReleaseTests(APITestCase):
             },
         )
         assert response.status_code == status.HTTP_200_OK
+        self.assertEqual(response.data["num_of_data_files"], 1)
+
+        # Saving a release through the API rebuilds its dump
+        release = Release.objects.get()
+        self.assertFalse(release.json_file_outdated)
+        self.assertTrue(bool(release.json_file))
 
         response = self.client.get(rel_url)
         json = response.json()
         self.assertEqual(json["tag"], "v1.0")
-        self.assertEqual(len(json["data_files"]), 1)
+        self.assertEqual(json["num_of_data_files"], 1)
+        self.assertNotIn("data_files", json)
         self.assertEqual(json["release_document_mime_type"], "text/plain")
         self.assertTrue(json["release_document"] is not None)
 
@@ -449,6 +603,179 @@ class ReleaseTests(APITestCase):
         response = self.client.get("/browse/releases/v1.0/document/", follow=True)
         self.assertEqual(response.content, b"Contents of the release document")
 
+    def test_release_path_index(self):
+        create_release_spec(
+            self.client, "v1.0", data_files=[self.datafile_response.data["url"]]
+        )
+
+        # The index is built as soon as the release is created: looking up
+        # a path requires the release and one row of the index
+        with self.assertNumQueries(2):
+            response = self.client.get("/releases/v1.0/test_entity/test_quantity/")
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        assert response.url in self.datafile_response.data["url"]
+
+        # Renaming an ancestor of the quantity makes the index outdated:
+        # until it is rebuilt, paths are looked up without it
+        entity = Entity.objects.get(name="test_entity")
+        entity.name = "renamed_entity"
+        entity.save()
+
+        response = self.client.get("/releases/v1.0/test_entity/test_quantity/")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        for _ in range(2):
+            response = self.client.get(
+                "/browse/releases/v1.0/renamed_entity/test_quantity/"
+            )
+            self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+            self.assertEqual(
+                response.url,
+                reverse("data-file-view", args=[self.datafile_response.data["uuid"]]),
+            )
+
+            # GET requests never rebuild the index
+            self.assertTrue(Release.objects.get(tag="v1.0").path_index_outdated)
+            self.assertEqual(
+                list(ReleasePathIndex.objects.values_list("path", flat=True)),
+                ["test_entity/test_quantity"],
+            )
+
+        self.assertEqual(update_release_path_indexes(), ["v1.0"])
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                "/browse/releases/v1.0/renamed_entity/test_quantity/"
+            )
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+
+    def test_release_data_files(self):
+        other_file_response = create_data_file_spec(
+            self.client,
+            name="other_datafile",
+            metadata={},
+            quantity=self.quantity_response.data["url"],
+        )
+        response = create_release_spec(
+            self.client,
+            "v1.0",
+            data_files=[
+                self.datafile_response.data["url"],
+                other_file_response.data["url"],
+            ],
+        )
+        self.assertEqual(response.data["num_of_data_files"], 2)
+
+        # The list of data files is paginated
+        url = response.data["data_files_url"]
+        response = self.client.get(url, {"limit": 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 2)
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertIsNotNone(response.data["next"])
+
+        response = self.client.get(url, {"name": "other_datafile"})
+        self.assertEqual(
+            [x["uuid"] for x in response.data["results"]],
+            [other_file_response.data["uuid"]],
+        )
+
+        response = self.client.get(
+            url, {"quantity": self.quantity_response.data["uuid"]}
+        )
+        self.assertEqual(response.data["count"], 2)
+
+        response = self.client.get(url, {"quantity": "not-a-uuid"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # Releases are listed without their data files
+        response = self.client.get(reverse("release-list"))
+        self.assertEqual(response.data["results"][0]["num_of_data_files"], 2)
+
+    def test_release_bundle(self):
+        create_release_spec(
+            self.client, "v1.0", data_files=[self.datafile_response.data["url"]]
+        )
+        url = reverse("release-bundle", kwargs={"pk": "v1.0"})
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/x-tar")
+        with tarfile.open(
+            fileobj=io.BytesIO(b"".join(response.streaming_content))
+        ) as tar:
+            names = tar.getnames()
+            schema = json.load(tar.extractfile("schema.json"))
+            data_file_path = schema["data_files"][0]["file_name"]
+            self.assertEqual(tar.extractfile(data_file_path).read(), b"1,2,3,4,5")
+
+        self.assertEqual(names[0], "schema.json")
+        self.assertIn("release_documents/v1.0.txt", names)
+        self.assertEqual([x["tag"] for x in schema["releases"]], ["v1.0"])
+
+        response = self.client.get(url, {"archive": "zip"})
+        self.assertEqual(response["Content-Type"], "application/zip")
+        with zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content))) as zf:
+            self.assertEqual(sorted(zf.namelist()), sorted(names))
+            self.assertEqual(zf.read(data_file_path), b"1,2,3,4,5")
+
+        response = self.client.get(url, {"archive": "rar"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.client.force_authenticate(user=None)
+        response = self.client.get(url)
+        self.assertIn(
+            response.status_code,
+            (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN),
+        )
+
+    def test_release_delta(self):
+        old_file_url = self.datafile_response.data["url"]
+        new_file_response = create_data_file_spec(
+            self.client,
+            name="test_datafile_new",
+            metadata={"a": 11},
+            quantity=self.quantity_response.data["url"],
+        )
+        create_release_spec(self.client, "v1.0", data_files=[old_file_url])
+        create_release_spec(
+            self.client, "v1.1", data_files=[new_file_response.data["url"]]
+        )
+        url = reverse("release-delta", kwargs={"pk": "v1.1"})
+
+        response = self.client.get(url, {"from": "v1.0"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        delta = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(
+            [x["uuid"] for x in delta["added_data_files"]],
+            [new_file_response.data["uuid"]],
+        )
+        self.assertEqual(
+            delta["removed_data_files"], [self.datafile_response.data["uuid"]]
+        )
+        self.assertEqual(
+            delta["changed_quantities"], [self.quantity_response.data["uuid"]]
+        )
+        # Only the JSON record is returned, without attachments
+        self.assertNotIn("file_name", delta["added_data_files"][0])
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(url, {"from": "v0.1"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        # The bundle contains the attachments of the new data files
+        response = self.client.get(
+            reverse("release-bundle", kwargs={"pk": "v1.1"}),
+            {"from": "v1.0", "archive": "zip"},
+        )
+        with zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content))) as zf:
+            names = zf.namelist()
+            delta = json.loads(zf.read("delta.json"))
+
+        self.assertEqual(
+            names, ["delta.json", delta["added_data_files"][0]["file_name"]]
+        )
+
 
 class AuthenticateTest(APITestCase):
     def setUp(self) -> None:
@@ -505,6 +832,439 @@ class AuthenticateTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
 
+class QueryCountTests(APITestCase):
+    """Check that the number of queries does not depend on the number of objects
+
+    Hyperlinked fields listing related objects (e.g., the data files of a
+    quantity) must be filled using prefetched querysets: if a test fails
+    because the number of queries increased, check the ``queryset`` of the
+    viewset.
+    """
+
+    def setUp(self):
+        _create_test_user_and_authenticate(client=self.client, superuser=False)
+
+        self.format_spec = FormatSpecification.objects.create(
+            document_ref="DUMMY_REF_001", title="My dummy document"
+        )
+        self.root = Entity.objects.create(name="root")
+        self.release = Release.objects.create(tag="v1.0")
+        self.num_of_objects = 0
+
+    def add_objects(self, num_of_objects: int):
+        for _ in range(num_of_objects):
+            idx = self.num_of_objects
+            self.num_of_objects += 1
+
+            entity = Entity.objects.create(name=f"entity{idx}", parent=self.root)
+            Entity.objects.create(name=f"subentity{idx}", parent=entity)
+            quantity = Quantity.objects.create(
+                name=f"quantity{idx}",
+                format_spec=self.format_spec,
+                parent_entity=entity,
+            )
+
+            first_file = DataFile.objects.create(
+                name=f"file{idx}_1", metadata="{}", quantity=quantity
+            )
+            first_file.release_tags.add(self.release)
+
+            second_file = DataFile.objects.create(
+                name=f"file{idx}_2", metadata="{}", quantity=quantity
+            )
+            second_file.dependencies.add(first_file)
+            second_file.release_tags.add(self.release)
+
+    def check_num_of_queries(self, url_name: str, num_of_queries: int, detail):
+        """Check the list and detail endpoints of a viewset
+
+        The parameter `detail` is a function returning the primary key of
+        the object to be retrieved by the detail endpoint.
+        """
+
+        for num_of_objects in (1, 5):
+            self.add_objects(num_of_objects)
+
+            # The count used by the paginator is one more query
+            with self.assertNumQueries(num_of_queries + 1):
+                response = self.client.get(reverse(f"{url_name}-list"), {"limit": 100})
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+            detail_url = reverse(f"{url_name}-detail", kwargs={"pk": detail()})
+            with self.assertNumQueries(num_of_queries):
+                response = self.client.get(detail_url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_entities(self):
+        # Entities, children, quantities
+        self.check_num_of_queries("entity", 3, lambda: self.root.pk)
+
+        response = self.client.get(
+            reverse("entity-detail", kwargs={"pk": self.root.pk})
+        )
+        self.assertEqual(len(response.json()["children"]), 6)
+
+    def test_quantities(self):
+        # Quantities, data files
+        self.check_num_of_queries(
+            "quantity", 2, lambda: Quantity.objects.order_by("name").last().pk
+        )
+
+    def test_data_files(self):
+        # Data files, dependencies, releases
+        self.check_num_of_queries(
+            "datafile", 3, lambda: DataFile.objects.order_by("name").last().pk
+        )
+
+    def test_releases(self):
+        # Releases (data files are counted in the same query)
+        self.check_num_of_queries("release", 1, lambda: self.release.pk)
+
+    def test_release_data_files(self):
+        # Release, data files, dependencies, releases
+        self.add_objects(1)
+        url = reverse("release-data-files", kwargs={"pk": self.release.pk})
+        with self.assertNumQueries(5):
+            self.client.get(url)
+
+        self.add_objects(5)
+        with self.assertNumQueries(5):
+            self.client.get(url)
+
+
+class KeysetPaginationTests(APITestCase):
+    def setUp(self):
+        _create_test_user_and_authenticate(client=self.client, superuser=False)
+
+        format_spec = FormatSpecification.objects.create(
+            document_ref="DUMMY_REF_001", title="My dummy document"
+        )
+        entity = Entity.objects.create(name="root")
+        self.quantity = Quantity.objects.create(
+            name="quantity", format_spec=format_spec, parent_entity=entity
+        )
+
+        # Many data files share the same upload date and name, so that
+        # the cursor must use all the fields in the ordering
+        upload_dates = ["2023-01-02T03:04:05Z", "2023-01-03T03:04:05Z"]
+        for idx in range(12):
+            DataFile.objects.create(
+                name=f"file{idx % 3}",
+                upload_date=upload_dates[idx % 2],
+                metadata="{}",
+                quantity=self.quantity,
+            )
+
+    def walk(self, url, query):
+        "Return the list of UUIDs and the URL of the last page"
+
+        uuids = []
+        while url:
+            response = self.client.get(url, query)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn("count", response.data)
+
+            uuids += [x["uuid"] for x in response.data["results"]]
+            last_url = url
+            url = response.data["next"]
+            # The query is already contained in the links
+            query = None
+
+        return uuids, last_url
+
+    def test_data_files(self):
+        expected = [str(x.uuid) for x in DataFile.objects.all()]
+
+        uuids, last_url = self.walk(
+            reverse("datafile-list"), {"pagination": "cursor", "limit": 5}
+        )
+        self.assertEqual(uuids, expected)
+
+        # Go back from the last page
+        response = self.client.get(self.client.get(last_url).data["previous"])
+        self.assertEqual([x["uuid"] for x in response.data["results"]], expected[5:10])
+        response = self.client.get(response.data["previous"])
+        self.assertEqual([x["uuid"] for x in response.data["results"]], expected[:5])
+        self.assertIsNone(response.data["previous"])
+
+    def test_entities_and_quantities(self):
+        for idx in range(4):
+            Entity.objects.create(name="child", parent=Entity.objects.get(name="root"))
+
+        for url_name, model in (("entity", Entity), ("quantity", Quantity)):
+            uuids, _ = self.walk(
+                reverse(f"{url_name}-list"), {"pagination": "cursor", "limit": 2}
+            )
+            self.assertEqual(
+                uuids, [str(x.uuid) for x in model.objects.order_by("name", "uuid")]
+            )
+
+    def test_default_pagination(self):
+        # Without "pagination=cursor", limit/offset pagination is used
+        response = self.client.get(reverse("datafile-list"), {"limit": 5, "offset": 10})
+        self.assertEqual(response.data["count"], 12)
+        self.assertEqual(len(response.data["results"]), 2)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("datafile-list"), {"cursor": "invalid"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class SparseFieldsTests(APITestCase):
+    def setUp(self):
+        _create_test_user_and_authenticate(client=self.client, superuser=False)
+
+        self.format_spec = FormatSpecification.objects.create(
+            document_ref="DUMMY_REF_001", title="My dummy document"
+        )
+        self.entity = Entity.objects.create(name="root")
+        self.quantity = Quantity.objects.create(
+            name="quantity", format_spec=self.format_spec, parent_entity=self.entity
+        )
+
+    def add_data_files(self, num_of_files: int):
+        for idx in range(num_of_files):
+            DataFile.objects.create(
+                name=f"file{idx}", metadata='{"a": 1}', quantity=self.quantity
+            )
+
+    def test_fields(self):
+        self.add_data_files(1)
+
+        response = self.client.get(
+            reverse("datafile-list"), {"fields": "uuid,name,metadata"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data["results"],
+            [
+                {
+                    "uuid": str(DataFile.objects.get().uuid),
+                    "name": "file0",
+                    "metadata": {"a": 1},
+                }
+            ],
+        )
+
+        response = self.client.get(
+            reverse("release-list"), {"fields": "tag,num_of_data_files"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # Without "fields", everything is included
+        response = self.client.get(
+            reverse("formatspecification-detail", args=[self.format_spec.pk])
+        )
+        self.assertIn("download_link", response.data)
+        response = self.client.get(
+            reverse("formatspecification-detail", args=[self.format_spec.pk]),
+            {"fields": "uuid"},
+        )
+        self.assertEqual(list(response.data), ["uuid"])
+
+    def test_expand(self):
+        self.add_data_files(1)
+
+        response = self.client.get(
+            reverse("datafile-list"),
+            {"fields": "uuid,quantity", "expand": "quantity.format_spec"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        quantity = response.data["results"][0]["quantity"]
+        self.assertEqual(quantity["uuid"], str(self.quantity.uuid))
+        self.assertEqual(quantity["format_spec"]["document_ref"], "DUMMY_REF_001")
+        self.assertIn("download_link", quantity["format_spec"])
+        # The entity was not expanded, so it is still a link
+        self.assertIsInstance(quantity["parent_entity"], str)
+
+        response = self.client.get(
+            reverse("quantity-detail", args=[self.quantity.pk]),
+            {"expand": "parent_entity"},
+        )
+        self.assertEqual(response.data["parent_entity"]["name"], "root")
+
+        response = self.client.get(reverse("datafile-list"), {"expand": "metadata"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_expand_num_of_queries(self):
+        url = reverse("datafile-list")
+        query = {"expand": "quantity.format_spec,quantity.parent_entity", "limit": 100}
+
+        # Count, data files (with quantities, specifications and
+        # entities), dependencies, releases, data files of the quantities,
+        # children and quantities of the entities
+        for num_of_files in (1, 5):
+            self.add_data_files(num_of_files)
+            with self.assertNumQueries(7):
+                response = self.client.get(url, query)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_writes_ignore_fields(self):
+        # The parameters only affect GET requests: otherwise, fields that
+        # are not listed would be silently ignored when validating data
+        _create_test_user_and_authenticate(client=self.client, superuser=True)
+        url = reverse("entity-detail", args=[self.entity.pk])
+
+        response = self.client.patch(url + "?fields=uuid", {"name": "new_root"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["name"], "new_root")
+
+        response = self.client.get(url, {"fields": "name"})
+        self.assertEqual(response.data, {"name": "new_root"})
+
+
+class ReleaseResolveTests(APITestCase):
+    def setUp(self):
+        # Non-administrators can resolve paths
+        _create_test_user_and_authenticate(client=self.client, superuser=False)
+
+        self.format_spec = FormatSpecification.objects.create(
+            document_ref="DUMMY_REF_001", title="My dummy document"
+        )
+        self.release = Release.objects.create(tag="v1.0")
+        self.other_release = Release.objects.create(tag="v2.0")
+
+        # The tree has this shape:
+        #
+        # satellite
+        # +--- detector0 (quantity "noise")
+        # +--- detector1 (quantity "noise")
+        # ...
+        self.satellite = Entity.objects.create(name="satellite")
+        self.data_files = {}
+        for idx in range(5):
+            detector = Entity.objects.create(
+                name=f"detector{idx}", parent=self.satellite
+            )
+            quantity = Quantity.objects.create(
+                name="noise", format_spec=self.format_spec, parent_entity=detector
+            )
+
+            old_file = DataFile.objects.create(
+                name="old", metadata="{}", quantity=quantity
+            )
+            old_file.release_tags.add(self.other_release)
+
+            new_file = DataFile.objects.create(
+                name="new", metadata=f'{{"idx": {idx}}}', quantity=quantity
+            )
+            new_file.release_tags.add(self.release)
+            self.data_files[f"satellite/detector{idx}/noise"] = new_file
+
+        self.url = reverse("release-resolve", kwargs={"pk": "v1.0"})
+
+    def test_resolve(self):
+        paths = [
+            "satellite/detector3/noise",
+            "/satellite/detector0/noise/",
+            "satellite/detector9/noise",
+            "satellite/detector1/cad",
+            "noise",
+        ]
+        response = self.client.post(
+            self.url + "?fields=uuid,metadata", {"paths": paths}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["release"], "v1.0")
+        self.assertEqual(
+            response.data["data_files"],
+            {
+                "satellite/detector3/noise": {
+                    "uuid": str(self.data_files["satellite/detector3/noise"].uuid),
+                    "metadata": {"idx": 3},
+                },
+                "/satellite/detector0/noise/": {
+                    "uuid": str(self.data_files["satellite/detector0/noise"].uuid),
+                    "metadata": {"idx": 0},
+                },
+            },
+        )
+        self.assertEqual(response.data["missing"], paths[2:])
+        self.assertEqual(response.data["ambiguous"], [])
+
+    def test_ambiguous_paths(self):
+        # Two root entities with the same name, both containing a
+        # quantity with the same path
+        other_satellite = Entity.objects.create(name="satellite")
+        other_quantity = Quantity.objects.create(
+            name="noise",
+            format_spec=self.format_spec,
+            parent_entity=Entity.objects.create(
+                name="detector0", parent=other_satellite
+            ),
+        )
+        paths = [
+            "satellite/detector0/noise",
+            "satellite/detector1/noise",
+            "satellite/detector2/noise",
+        ]
+
+        # The other quantity has no data files in the release
+        response = self.client.post(self.url, {"paths": paths}, format="json")
+        self.assertEqual(len(response.data["data_files"]), 3)
+        self.assertEqual(response.data["ambiguous"], [])
+
+        DataFile.objects.create(
+            name="other", metadata="{}", quantity=other_quantity
+        ).release_tags.add(self.release)
+
+        # A quantity with two data files in the same release
+        DataFile.objects.create(
+            name="newer",
+            metadata="{}",
+            quantity=self.data_files["satellite/detector1/noise"].quantity,
+        ).release_tags.add(self.release)
+
+        # The result is the same whether the path index is used or not
+        for build_index in (False, True):
+            if build_index:
+                update_release_path_indexes()
+
+            response = self.client.post(self.url, {"paths": paths}, format="json")
+            self.assertEqual(response.data["ambiguous"], paths[0:2])
+            self.assertEqual(response.data["missing"], [])
+            self.assertEqual(
+                list(response.data["data_files"].keys()),
+                ["satellite/detector2/noise"],
+            )
+
+    def test_num_of_queries(self):
+        # Release, paths, data files, dependencies, releases: the depth of
+        # the tree does not matter
+        for num_of_paths in (1, 5):
+            paths = list(self.data_files)[:num_of_paths]
+            with self.assertNumQueries(5):
+                response = self.client.post(self.url, {"paths": paths}, format="json")
+
+            self.assertEqual(len(response.data["data_files"]), num_of_paths)
+
+    def test_path_index(self):
+        update_release_path_indexes()
+
+        # Once the index is built, paths are resolved using it: changing
+        # the paths behind its back does not affect the result
+        Quantity.objects.update(path="nowhere")
+        paths = list(self.data_files)
+        with self.assertNumQueries(5):
+            response = self.client.post(self.url, {"paths": paths}, format="json")
+
+        self.assertEqual(
+            {x: y["uuid"] for x, y in response.data["data_files"].items()},
+            {x: str(y.uuid) for x, y in self.data_files.items()},
+        )
+
+    def test_invalid_requests(self):
+        response = self.client.post(self.url, {"paths": "satellite"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(
+            reverse("release-resolve", kwargs={"pk": "v9.9"}),
+            {"paths": []},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
 def test_unauthenticated_access(self):
     view = DataFileViewSet.as_view({"get": "list"})
     factory = APIRequestFactory()